@@ -32,6 +32,9 @@
 #define WHERE_I_AM_VERBOSE_ENGINE {fprintf(stderr,"%s,%s,%s,%p,%d\n",__FILE__,engine->get_instance_name(engine_handle),__func__,this,__LINE__ );}
 #define WHERE_I_AM_VERBOSE {fprintf(stderr,"%s:%s:%p:%d\n",__FILE__,__func__,this,__LINE__ );}
 #define WHERE_I_AM {}
+#define BINARY_TRACE_MAGIC "RVTRACE"
+#define BINARY_TRACE_VERSION 1
+#define BINARY_TRACE_HEADER_SIZE 16
 
 /*a Types from the CDL */
 /*t t_riscv_mode
@@ -119,6 +122,25 @@ typedef struct t_match_trace_entry {
     t_sl_uint64 instruction;
 } t_match_trace_entry;
 
+/*t t_binary_trace
+ *
+ * State for reading or writing a binary trace file; the instruction
+ * table holds each distinct instruction in order of first use, and when
+ * writing the hash table maps instructions to their table index+1 (0 for
+ * an empty slot)
+*/
+typedef struct {
+    FILE *f;
+    int num_entries;
+    int last_time;
+    t_sl_uint64 last_pc;
+    int num_instructions;
+    int max_instructions;
+    t_sl_uint64 *instructions;
+    int hash_size;
+    int *hash;
+} t_binary_trace;
+
 /*t t_match_trace
 */
 typedef struct {
@@ -152,6 +174,8 @@ public:
     int inputs_captured;
     int connected_okay;
     FILE *capture_trace;
+    int capture_binary;
+    t_binary_trace capture_binary_trace;
     t_match_trace match_trace;
     t_chk_riscv_trace_outputs outputs;
     t_chk_riscv_trace_inputs inputs;
@@ -165,6 +189,193 @@ public:
     int verbose;
 };
 
+/*a Binary trace files
+ *
+ * A binary trace file is a 16-byte header of the magic "RVTRACE\0" and
+ * the version and number of entries as 32-bit little-endian values,
+ * followed by the entries. Each entry is varints of the zigzag-encoded
+ * time delta, the zigzag-encoded pc delta, and (instruction
+ * reference<<3)|mode; a reference of 0 is followed by a varint of the
+ * instruction, which is added to the instruction table, and a
+ * reference of n is the (n-1)th instruction of the table. Varints are
+ * little-endian base-128, the top bit of each byte set if more follow.
+ */
+/*f binary_trace_init */
+static void binary_trace_init(t_binary_trace *bt, FILE *f)
+{
+    memset(bt, 0, sizeof(*bt));
+    bt->f = f;
+}
+
+/*f binary_trace_free */
+static void binary_trace_free(t_binary_trace *bt)
+{
+    if (bt->instructions) free(bt->instructions);
+    if (bt->hash) free(bt->hash);
+    bt->instructions = NULL;
+    bt->hash = NULL;
+}
+
+/*f binary_trace_hash */
+static int binary_trace_hash(t_binary_trace *bt, t_sl_uint64 instruction)
+{
+    return (int)((instruction * 0x9e3779b1ULL)>>8) & (bt->hash_size-1);
+}
+
+/*f binary_trace_instruction_add
+  Add an instruction to the table, returning its reference (index+1)
+ */
+static int binary_trace_instruction_add(t_binary_trace *bt, t_sl_uint64 instruction, int hashed)
+{
+    if (bt->num_instructions>=bt->max_instructions) {
+        bt->max_instructions = (bt->max_instructions==0) ? 1024 : 2*bt->max_instructions;
+        bt->instructions = (t_sl_uint64 *)realloc(bt->instructions, bt->max_instructions*sizeof(t_sl_uint64));
+    }
+    bt->instructions[bt->num_instructions++] = instruction;
+    if (!hashed) return bt->num_instructions;
+    if (2*bt->num_instructions>bt->hash_size) {
+        if (bt->hash) free(bt->hash);
+        bt->hash_size = 2*bt->max_instructions;
+        bt->hash = (int *)calloc(bt->hash_size, sizeof(int));
+        for (int i=0; i<bt->num_instructions; i++) {
+            int h;
+            for (h=binary_trace_hash(bt, bt->instructions[i]); bt->hash[h]; h=(h+1)&(bt->hash_size-1));
+            bt->hash[h] = i+1;
+        }
+        return bt->num_instructions;
+    }
+    int h;
+    for (h=binary_trace_hash(bt, instruction); bt->hash[h]; h=(h+1)&(bt->hash_size-1));
+    bt->hash[h] = bt->num_instructions;
+    return bt->num_instructions;
+}
+
+/*f binary_trace_instruction_find
+  Return the reference (index+1) of an instruction, or 0 if not in the table
+ */
+static int binary_trace_instruction_find(t_binary_trace *bt, t_sl_uint64 instruction)
+{
+    if (!bt->hash) return 0;
+    for (int h=binary_trace_hash(bt, instruction); bt->hash[h]; h=(h+1)&(bt->hash_size-1)) {
+        if (bt->instructions[bt->hash[h]-1]==instruction) return bt->hash[h];
+    }
+    return 0;
+}
+
+/*f binary_trace_write_varint */
+static void binary_trace_write_varint(t_binary_trace *bt, t_sl_uint64 v)
+{
+    while (v>=0x80) {
+        fputc(0x80 | (v&0x7f), bt->f);
+        v >>= 7;
+    }
+    fputc((int)v, bt->f);
+}
+
+/*f binary_trace_read_varint
+  Return 0 if the file ends before the varint is complete
+ */
+static int binary_trace_read_varint(t_binary_trace *bt, t_sl_uint64 *v)
+{
+    int shift=0;
+    *v = 0;
+    for (;;) {
+        int b = fgetc(bt->f);
+        if ((b==EOF) || (shift>=64)) return 0;
+        *v |= ((t_sl_uint64)(b&0x7f))<<shift;
+        if (b<0x80) return 1;
+        shift += 7;
+    }
+}
+
+/*f binary_trace_zigzag */
+static t_sl_uint64 binary_trace_zigzag(long long v)
+{
+    if (v<0) return (((t_sl_uint64)(-v))<<1)-1;
+    return ((t_sl_uint64)v)<<1;
+}
+
+/*f binary_trace_unzigzag */
+static long long binary_trace_unzigzag(t_sl_uint64 v)
+{
+    if (v&1) return -(long long)((v+1)>>1);
+    return (long long)(v>>1);
+}
+
+/*f binary_trace_write_header */
+static void binary_trace_write_header(t_binary_trace *bt)
+{
+    unsigned char header[BINARY_TRACE_HEADER_SIZE];
+    memcpy(header, BINARY_TRACE_MAGIC, 8);
+    for (int i=0; i<4; i++) {
+        header[8+i]  = (BINARY_TRACE_VERSION>>(8*i)) & 0xff;
+        header[12+i] = (bt->num_entries>>(8*i)) & 0xff;
+    }
+    fseek(bt->f, 0, SEEK_SET);
+    fwrite(header, 1, BINARY_TRACE_HEADER_SIZE, bt->f);
+    fseek(bt->f, 0, SEEK_END);
+}
+
+/*f binary_trace_read_header
+  Return 1 if the file is a binary trace, else rewind it and return 0
+ */
+static int binary_trace_read_header(t_binary_trace *bt)
+{
+    unsigned char header[BINARY_TRACE_HEADER_SIZE];
+    if ((fread(header, 1, BINARY_TRACE_HEADER_SIZE, bt->f)!=BINARY_TRACE_HEADER_SIZE) ||
+        memcmp(header, BINARY_TRACE_MAGIC, 8)) {
+        rewind(bt->f);
+        return 0;
+    }
+    bt->num_entries = 0;
+    for (int i=0; i<4; i++) {
+        bt->num_entries |= header[12+i]<<(8*i);
+    }
+    return 1;
+}
+
+/*f binary_trace_write_entry */
+static void binary_trace_write_entry(t_binary_trace *bt, int time, int mode, t_sl_uint64 pc, t_sl_uint64 instruction)
+{
+    int reference;
+    binary_trace_write_varint(bt, binary_trace_zigzag((long long)time - (long long)bt->last_time));
+    binary_trace_write_varint(bt, binary_trace_zigzag((long long)pc - (long long)bt->last_pc));
+    reference = binary_trace_instruction_find(bt, instruction);
+    binary_trace_write_varint(bt, (((t_sl_uint64)reference)<<3) | (mode&7));
+    if (!reference) {
+        binary_trace_write_varint(bt, instruction);
+        binary_trace_instruction_add(bt, instruction, 1);
+    }
+    bt->last_time = time;
+    bt->last_pc = pc;
+    bt->num_entries++;
+}
+
+/*f binary_trace_read_entry
+  Return 0 at the end of the file or if the entry is invalid
+ */
+static int binary_trace_read_entry(t_binary_trace *bt, int *time, int *mode, t_sl_uint64 *pc, t_sl_uint64 *instruction)
+{
+    t_sl_uint64 time_delta, pc_delta, reference;
+    if (!binary_trace_read_varint(bt, &time_delta)) return 0;
+    if (!binary_trace_read_varint(bt, &pc_delta)) return 0;
+    if (!binary_trace_read_varint(bt, &reference)) return 0;
+    *mode = reference & 7;
+    reference >>= 3;
+    if (reference==0) {
+        if (!binary_trace_read_varint(bt, instruction)) return 0;
+        binary_trace_instruction_add(bt, *instruction, 0);
+    } else {
+        if (reference>(t_sl_uint64)bt->num_instructions) return 0;
+        *instruction = bt->instructions[reference-1];
+    }
+    bt->last_time += (int)binary_trace_unzigzag(time_delta);
+    bt->last_pc   += binary_trace_unzigzag(pc_delta);
+    *time = bt->last_time;
+    *pc   = bt->last_pc;
+    return 1;
+}
+
 /*a Match trace methods */
 /*f match_trace_add */
 void c_chk_riscv_trace::match_trace_add(int time, int mode, t_sl_uint64 pc, t_sl_uint64 instruction)
@@ -325,12 +536,16 @@ c_chk_riscv_trace::c_chk_riscv_trace( class c_engine *eng, void *eng_handle )
     match_ignore_mode_mask = engine->get_option_int( engine_handle, "ignore_mode_mask", 0 );
     match_ignore_start_pc = engine->get_option_int( engine_handle, "ignore_start_pc", 0 );
     match_ignore_end_pc   = engine->get_option_int( engine_handle, "ignore_end_pc", 0 );
+    capture_binary = engine->get_option_int( engine_handle, "capture_binary", 0 );
 
     memset(&inputs, 0, sizeof(inputs));
     memset(&input, 0, sizeof(input));
     capture_trace = NULL;
+    binary_trace_init(&capture_binary_trace, NULL);
     if (capture_filename[0]) {
-        capture_trace = fopen(capture_filename,"w");
+        capture_trace = fopen(capture_filename,"wb");
+        capture_binary_trace.f = capture_trace;
+        if (capture_trace && capture_binary) binary_trace_write_header(&capture_binary_trace);
     }
     match_trace.last  = NULL;
     match_trace.first = NULL;
@@ -341,11 +556,22 @@ c_chk_riscv_trace::c_chk_riscv_trace( class c_engine *eng, void *eng_handle )
         int mode;
         t_sl_uint64 pc;
         t_sl_uint64 instruction;
-        f = fopen(match_filename,"r");
-        while (f && (fscanf(f, "%d,%d,%llx,%llx\n",&time,&mode,&pc,&instruction)==4)) {
-            match_trace_add(time,mode,pc,instruction);
+        f = fopen(match_filename,"rb");
+        if (f) {
+            t_binary_trace bt;
+            binary_trace_init(&bt, f);
+            if (binary_trace_read_header(&bt)) {
+                for (int i=0; (i<bt.num_entries) && binary_trace_read_entry(&bt, &time, &mode, &pc, &instruction); i++) {
+                    match_trace_add(time,mode,pc,instruction);
+                }
+                binary_trace_free(&bt);
+            } else {
+                while (fscanf(f, "%d,%d,%llx,%llx\n",&time,&mode,&pc,&instruction)==4) {
+                    match_trace_add(time,mode,pc,instruction);
+                }
+            }
+            fclose(f);
         }
-        fclose(f);
     }
     connected_okay = 0;
 
@@ -394,8 +620,13 @@ c_chk_riscv_trace::~c_chk_riscv_trace()
 */
 t_sl_error_level c_chk_riscv_trace::delete_instance( void )
 {
-    if (capture_trace) {fclose(capture_trace);}
+    if (capture_trace) {
+        if (capture_binary) binary_trace_write_header(&capture_binary_trace);
+        fclose(capture_trace);
+    }
+    binary_trace_free(&capture_binary_trace);
     capture_trace = NULL;
+    capture_binary_trace.f = NULL;
     return error_level_okay;
 }
 
@@ -468,8 +699,12 @@ c_chk_riscv_trace::verify_trace_capture(void)
         mode        = input.trace.mode;
         pc          = input.trace.instr_pc;
         instruction = input.trace.instruction;
-        fprintf(capture_trace, "%d,%d,%08llx,%08llx\n",
-                engine->cycle(), mode, pc, instruction);
+        if (capture_binary) {
+            binary_trace_write_entry(&capture_binary_trace, engine->cycle(), mode, pc, instruction);
+        } else {
+            fprintf(capture_trace, "%d,%d,%08llx,%08llx\n",
+                    engine->cycle(), mode, pc, instruction);
+        }
     }
 }
 
@@ -23,6 +23,17 @@
  *
  * In an ASIC or FPGA the SRAM modules should be supplied by
  * libraries; this file is effectively simulation library support.
+ *
+ * An SRAM whose 'filename' option names a binary SRAM image (rather
+ * than a MIF file) is instantiated as a c_sram_image here instead of
+ * the simulation library SRAM. The image is a 64-byte header - the
+ * magic 'CDLSRAM\0', then version, width in bits, depth in words,
+ * base word address, bytes per word and payload offset - followed by
+ * the payload of little-endian words, each 1, 2, 4 or 8 bytes. An image
+ * that exactly covers the SRAM is mapped copy-on-write as its memory,
+ * and any other image is read in one shot, so large memories start
+ * (and reset) without parsing. The image SRAM does not support the
+ * memory read and write messages of the simulation library SRAM.
  */
 
 /*a Includes */
@@ -30,6 +41,10 @@
 #include <stdio.h>
 #include <string.h>
 #include <stdarg.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
 #include "be_model_includes.h"
 #include "sl_general.h"
 
@@ -42,6 +57,7 @@ static t_sl_error_level se_sram_srw_ ## size ## x ## width ## _ ## bpe ## _insta
     engine->set_option_list( engine_handle, sl_option_list(engine->get_option_list( engine_handle ), "size", size) ); \
     engine->set_option_list( engine_handle, sl_option_list(engine->get_option_list( engine_handle ), "width", width) ); \
     engine->set_option_list( engine_handle, sl_option_list(engine->get_option_list( engine_handle ), "bits_per_enable", bpe) ); \
+    if (sram_image_filename(engine, engine_handle)) return sram_image_instance_fn(engine, engine_handle); \
     void *sram_mod = se_external_module_find("se_sram_srw"); \
     if (sram_mod) return se_external_module_instantiate(sram_mod, engine, engine_handle); \
     return error_level_fatal; \
@@ -52,6 +68,7 @@ static t_sl_error_level se_sram_mrw_2_ ## size ## x ## width ## _instance_fn(c_e
     engine->set_option_list( engine_handle, sl_option_list(engine->get_option_list( engine_handle ), "size", size) ); \
     engine->set_option_list( engine_handle, sl_option_list(engine->get_option_list( engine_handle ), "width", width) ); \
     engine->set_option_list( engine_handle, sl_option_list(engine->get_option_list( engine_handle ), "bits_per_enable", 0) ); \
+    if (sram_image_filename(engine, engine_handle)) return sram_image_instance_fn(engine, engine_handle); \
     void *sram_mod = se_external_module_find("se_sram_mrw"); \
     if (sram_mod) return se_external_module_instantiate(sram_mod, engine, engine_handle); \
     return error_level_fatal; \
@@ -68,6 +85,470 @@ static t_sl_error_level se_sram_mrw_2_ ## size ## x ## width ## _instance_fn(c_e
 #define SRAM_REGISTER_DP(size,width) \
     se_external_module_register( 1, "se_sram_mrw_2_" #size "x" #width, se_sram_mrw_2_ ## size ## x ## width ##_instance_fn );
 
+/*a Types for the image SRAM */
+/*t t_sram_image_header
+ *
+ * Header of a binary SRAM image; all fields are little-endian
+ */
+typedef struct t_sram_image_header {
+    char magic[8];
+    unsigned int version;
+    unsigned int width;
+    t_sl_uint64 depth;
+    t_sl_uint64 base_address;
+    unsigned int bytes_per_word;
+    unsigned int payload_offset;
+    char pad[24];
+} t_sram_image_header;
+static const char sram_image_magic[8] = {'C','D','L','S','R','A','M',0};
+#define SRAM_IMAGE_VERSION 1
+#define SRAM_IMAGE_MAX_PORTS 2
+
+/*t t_sram_image_port
+ *
+ * A port of an image SRAM; the port is the handle of its clock functions
+ */
+typedef struct t_sram_image_port {
+    class c_sram_image *sram;
+    char names[6][32];
+    struct {
+        t_sl_uint64 *select;
+        t_sl_uint64 *read_not_write;
+        t_sl_uint64 *write_enable;
+        t_sl_uint64 *address;
+        t_sl_uint64 *write_data;
+    } inputs;
+    struct {
+        t_sl_uint64 select;
+        t_sl_uint64 read_not_write;
+        t_sl_uint64 write_enable;
+        t_sl_uint64 address;
+        t_sl_uint64 write_data;
+    } input_values;
+    t_sl_uint64 data_out;
+    int inputs_captured;
+} t_sram_image_port;
+
+/*c c_sram_image
+ */
+class c_sram_image
+{
+public:
+    c_sram_image( class c_engine *eng, void *eng_handle );
+    ~c_sram_image();
+    t_sl_error_level delete_instance( void );
+    t_sl_error_level reset( int pass );
+    t_sl_error_level prepreclock( void );
+    t_sl_error_level preclock( t_sram_image_port *port );
+    t_sl_error_level clock( t_sram_image_port *port );
+    t_sl_error_level message( t_se_message *message );
+    void error( const char *format, ... );
+    void free_memory( void );
+    int load_image( void );
+    t_sl_uint64 read_word( t_sl_uint64 address );
+    void write_word( t_sl_uint64 address, t_sl_uint64 data );
+    c_engine *engine;
+    void *engine_handle;
+    const char *filename;
+    int size;
+    int width;
+    int bits_per_enable;
+    int num_enables;
+    int address_width;
+    int num_ports;
+    int bytes_per_word;
+    int verbose;
+    unsigned char *memory;
+    void *mapping;
+    size_t mapping_size;
+    t_sram_image_port ports[SRAM_IMAGE_MAX_PORTS];
+};
+
+/*a Static wrapper functions for the image SRAM */
+/*f sram_image_filename */
+/**
+ * Return the filename of an SRAM instance if it is a binary SRAM
+ * image, else NULL (for a MIF file, or no file)
+ */
+static const char *sram_image_filename( c_engine *engine, void *engine_handle )
+{
+    const char *filename;
+    char magic[sizeof(sram_image_magic)];
+    FILE *f;
+    int okay;
+    filename = sl_option_get_string( engine->get_option_list( engine_handle ), "filename" );
+    if (!filename || !filename[0]) return NULL;
+    f = fopen(filename, "rb");
+    if (!f) return NULL;
+    okay = (fread(magic, sizeof(magic), 1, f)==1) && !memcmp(magic, sram_image_magic, sizeof(magic));
+    fclose(f);
+    return okay ? filename : NULL;
+}
+
+/*f sram_image_instance_fn */
+static t_sl_error_level sram_image_instance_fn( c_engine *engine, void *engine_handle )
+{
+    c_sram_image *mod;
+    mod = new c_sram_image( engine, engine_handle );
+    if (!mod)
+        return error_level_fatal;
+    return error_level_okay;
+}
+
+/*f sram_image_delete_fn */
+static t_sl_error_level sram_image_delete_fn( void *handle )
+{
+    c_sram_image *mod;
+    t_sl_error_level result;
+    mod = (c_sram_image *)handle;
+    result = mod->delete_instance();
+    delete( mod );
+    return result;
+}
+
+/*f sram_image_reset_fn */
+static t_sl_error_level sram_image_reset_fn( void *handle, int pass )
+{
+    c_sram_image *mod;
+    mod = (c_sram_image *)handle;
+    return mod->reset( pass );
+}
+
+/*f sram_image_prepreclock_fn */
+static t_sl_error_level sram_image_prepreclock_fn( void *handle )
+{
+    c_sram_image *mod;
+    mod = (c_sram_image *)handle;
+    return mod->prepreclock();
+}
+
+/*f sram_image_preclock_posedge_fn - handle is the port */
+static t_sl_error_level sram_image_preclock_posedge_fn( void *handle )
+{
+    t_sram_image_port *port;
+    port = (t_sram_image_port *)handle;
+    return port->sram->preclock( port );
+}
+
+/*f sram_image_clock_fn - handle is the port */
+static t_sl_error_level sram_image_clock_fn( void *handle )
+{
+    t_sram_image_port *port;
+    port = (t_sram_image_port *)handle;
+    return port->sram->clock( port );
+}
+
+/*f sram_image_message */
+static t_sl_error_level sram_image_message( void *handle, void *arg )
+{
+    c_sram_image *mod;
+    mod = (c_sram_image *)handle;
+    return mod->message((t_se_message *)arg );
+}
+
+/*a Constructors and destructors for the image SRAM */
+/*f c_sram_image::c_sram_image */
+/**
+ * Registers simulation engine functions, and the clock, inputs and
+ * outputs of each port - with the names of the simulation library
+ * SRAM ('sram_clock', 'select', ... for a single port SRAM, and
+ * 'sram_clock_0', 'select_0', ... for a multiport SRAM)
+ */
+c_sram_image::c_sram_image( class c_engine *eng, void *eng_handle )
+{
+    engine = eng;
+    engine_handle = eng_handle;
+
+    engine->register_delete_function( engine_handle, (void *)this, sram_image_delete_fn );
+    engine->register_reset_function( engine_handle, (void *)this, sram_image_reset_fn );
+    engine->register_message_function( engine_handle, (void *)this, sram_image_message );
+
+    filename        = sram_image_filename( engine, engine_handle );
+    verbose         = engine->get_option_int( engine_handle, "verbose", 0 );
+    size            = engine->get_option_int( engine_handle, "size", 1024 );
+    width           = engine->get_option_int( engine_handle, "width", 32 );
+    bits_per_enable = engine->get_option_int( engine_handle, "bits_per_enable", 0 );
+    num_ports       = engine->get_option_int( engine_handle, "num_ports", 1 );
+    if (num_ports<1) num_ports=1;
+    if (num_ports>SRAM_IMAGE_MAX_PORTS) num_ports=SRAM_IMAGE_MAX_PORTS;
+    num_enables = (bits_per_enable>0) ? ((width+bits_per_enable-1)/bits_per_enable) : 0;
+    address_width = 1;
+    while ((1LL<<address_width)<size) address_width++;
+    bytes_per_word = 1;
+    while (bytes_per_word*8<width) bytes_per_word*=2;
+    memory = NULL;
+    mapping = NULL;
+    mapping_size = 0;
+
+    memset(ports, 0, sizeof(ports));
+    engine->register_prepreclock_fn( engine_handle, (void *)this, sram_image_prepreclock_fn );
+    for (int i=0; i<num_ports; i++) {
+        t_sram_image_port *port = &ports[i];
+        const char *signals[6] = {"sram_clock", "select", "read_not_write", "write_enable", "address", "write_data"};
+        port->sram = this;
+        for (int j=0; j<6; j++) {
+            if (num_ports==1) {
+                snprintf(port->names[j], sizeof(port->names[j]), "%s", signals[j]);
+            } else {
+                snprintf(port->names[j], sizeof(port->names[j]), "%s_%d", signals[j], i);
+            }
+        }
+        const char *clock = port->names[0];
+        char data_out[32];
+        if (num_ports==1) {
+            snprintf(data_out, sizeof(data_out), "data_out");
+        } else {
+            snprintf(data_out, sizeof(data_out), "data_out_%d", i);
+        }
+        engine->register_preclock_fns( engine_handle, (void *)port, clock, sram_image_preclock_posedge_fn, (t_engine_callback_fn) NULL );
+        engine->register_clock_fn( engine_handle, (void *)port, clock, engine_sim_function_type_posedge_clock, sram_image_clock_fn );
+
+#define REGISTER_INPUT(s,n,w) \
+        engine->register_input_signal(engine_handle, port->names[n], w, &port->inputs.s); \
+        engine->register_input_used_on_clock(engine_handle, port->names[n], clock, 1 );
+        REGISTER_INPUT(select,1,1);
+        REGISTER_INPUT(read_not_write,2,1);
+        if (num_enables>0) {
+            REGISTER_INPUT(write_enable,3,num_enables);
+        }
+        REGISTER_INPUT(address,4,address_width);
+        REGISTER_INPUT(write_data,5,width);
+        engine->register_output_signal(engine_handle, data_out, width, &port->data_out);
+        engine->register_output_generated_on_clock(engine_handle, data_out, clock, 1 );
+    }
+}
+
+/*f c_sram_image::~c_sram_image */
+c_sram_image::~c_sram_image()
+{
+    delete_instance();
+}
+
+/*f c_sram_image::delete_instance */
+t_sl_error_level c_sram_image::delete_instance( void )
+{
+    free_memory();
+    return error_level_okay;
+}
+
+/*a Memory methods for the image SRAM */
+/*f c_sram_image::free_memory */
+void c_sram_image::free_memory( void )
+{
+    if (mapping) {
+        munmap(mapping, mapping_size);
+    } else if (memory) {
+        free(memory);
+    }
+    mapping = NULL;
+    mapping_size = 0;
+    memory = NULL;
+}
+
+/*f c_sram_image::error */
+void c_sram_image::error( const char *format, ... )
+{
+    char buf[256];
+    va_list ap;
+    va_start(ap, format);
+    (void) vsnprintf(buf, sizeof(buf), format, ap);
+    va_end(ap);
+    engine->add_error( (void *)__FILE__,
+                       error_level_serious,
+                       error_number_general_error_ssd, 0,
+                       error_arg_type_const_string, "SRAM image",
+                       error_arg_type_malloc_string, buf,
+                       error_arg_type_integer, engine->cycle(),
+                       error_arg_type_const_filename, __FILE__,
+                       error_arg_type_line_number, __LINE__,
+                       error_arg_type_none );
+}
+
+/*f c_sram_image::load_image */
+/**
+ * (Re)load the memory from the image file; if the image exactly covers
+ * the SRAM then map it copy-on-write, else read the image in to zeroed
+ * memory. Returns 0 on success.
+ */
+int c_sram_image::load_image( void )
+{
+    t_sram_image_header header;
+    struct stat st;
+    int fd;
+    free_memory();
+    fd = open(filename, O_RDONLY);
+    if (fd<0) {
+        error("Failed to open SRAM image '%s'", filename);
+        return 1;
+    }
+    if ((fstat(fd, &st)!=0) || (read(fd, &header, sizeof(header))!=sizeof(header)) ||
+        memcmp(header.magic, sram_image_magic, sizeof(header.magic)) ||
+        (header.version!=SRAM_IMAGE_VERSION) ||
+        ((t_sl_uint64)st.st_size<header.payload_offset+header.depth*header.bytes_per_word)) {
+        error("Bad SRAM image header in '%s'", filename);
+        close(fd);
+        return 1;
+    }
+    if (header.width!=(unsigned int)width) {
+        error("SRAM image '%s' has width %d but the SRAM has width %d", filename, header.width, width);
+    }
+    if ((header.base_address==0) && (header.depth==(t_sl_uint64)size) &&
+        (header.bytes_per_word==(unsigned int)bytes_per_word)) {
+        mapping_size = header.payload_offset+header.depth*header.bytes_per_word;
+        mapping = mmap(NULL, mapping_size, PROT_READ|PROT_WRITE, MAP_PRIVATE, fd, 0);
+        if (mapping!=MAP_FAILED) {
+            memory = ((unsigned char *)mapping) + header.payload_offset;
+            close(fd);
+            if (verbose) fprintf(stderr, "SRAM image '%s' mapped\n", filename);
+            return 0;
+        }
+        mapping = NULL;
+        mapping_size = 0;
+    }
+    memory = (unsigned char *)calloc(size, bytes_per_word);
+    if (!memory) {
+        close(fd);
+        return 1;
+    }
+    t_sl_uint64 depth = header.depth;
+    if (header.base_address>=(t_sl_uint64)size) depth = 0;
+    if (header.base_address+depth>(t_sl_uint64)size) depth = size-header.base_address;
+    if (header.bytes_per_word==(unsigned int)bytes_per_word) {
+        if (pread(fd, memory+header.base_address*bytes_per_word, depth*bytes_per_word, header.payload_offset)!=(ssize_t)(depth*bytes_per_word)) {
+            error("Failed to read SRAM image '%s'", filename);
+        }
+    } else {
+        unsigned char *payload = (unsigned char *)malloc(depth*header.bytes_per_word+1);
+        if (payload && (pread(fd, payload, depth*header.bytes_per_word, header.payload_offset)==(ssize_t)(depth*header.bytes_per_word))) {
+            for (t_sl_uint64 i=0; i<depth; i++) {
+                t_sl_uint64 data = 0;
+                for (unsigned int j=0; j<header.bytes_per_word; j++) {
+                    data |= ((t_sl_uint64)payload[i*header.bytes_per_word+j])<<(8*j);
+                }
+                write_word(header.base_address+i, data);
+            }
+        } else {
+            error("Failed to read SRAM image '%s'", filename);
+        }
+        free(payload);
+    }
+    close(fd);
+    if (verbose) fprintf(stderr, "SRAM image '%s' read\n", filename);
+    return 0;
+}
+
+/*f c_sram_image::read_word */
+t_sl_uint64 c_sram_image::read_word( t_sl_uint64 address )
+{
+    if (!memory || (address>=(t_sl_uint64)size)) return 0;
+    t_sl_uint64 data = 0;
+    unsigned char *ptr = memory+address*bytes_per_word;
+    for (int j=0; j<bytes_per_word; j++) {
+        data |= ((t_sl_uint64)ptr[j])<<(8*j);
+    }
+    if (width<64) data &= (1ULL<<width)-1;
+    return data;
+}
+
+/*f c_sram_image::write_word */
+void c_sram_image::write_word( t_sl_uint64 address, t_sl_uint64 data )
+{
+    if (!memory || (address>=(t_sl_uint64)size)) return;
+    unsigned char *ptr = memory+address*bytes_per_word;
+    for (int j=0; j<bytes_per_word; j++) {
+        ptr[j] = (unsigned char)(data>>(8*j));
+    }
+}
+
+/*a Simulation methods for the image SRAM */
+/*f c_sram_image::reset */
+t_sl_error_level c_sram_image::reset( int pass )
+{
+    if (pass==0) {
+        load_image();
+        for (int i=0; i<num_ports; i++) {
+            memset(&ports[i].input_values, 0, sizeof(ports[i].input_values));
+            ports[i].data_out = 0;
+        }
+    }
+    return error_level_okay;
+}
+
+/*f c_sram_image::message */
+t_sl_error_level c_sram_image::message( t_se_message *message )
+{
+    switch (message->reason)
+    {
+    case se_message_reason_set_option:
+        const char *option_name;
+        option_name = (const char *)message->data.ptrs[0];
+        message->response_type = se_message_response_type_int;
+        message->response = 1;
+        if (!strcmp(option_name,"verbose"))
+        {
+            verbose = (int)(t_sl_uint64)message->data.ptrs[1];
+        }
+        else
+        {
+            message->response = -1;
+        }
+        break;
+    }
+    return error_level_okay;
+}
+
+/*f c_sram_image::prepreclock */
+t_sl_error_level c_sram_image::prepreclock( void )
+{
+    for (int i=0; i<num_ports; i++) {
+        ports[i].inputs_captured = 0;
+    }
+    return error_level_okay;
+}
+
+/*f c_sram_image::preclock */
+/**
+ * Capture the inputs of a port whose clock is going to fire
+ */
+t_sl_error_level c_sram_image::preclock( t_sram_image_port *port )
+{
+    if (port->inputs_captured) return error_level_okay;
+    port->input_values.select         = port->inputs.select[0];
+    port->input_values.read_not_write = port->inputs.read_not_write[0];
+    port->input_values.write_enable   = port->inputs.write_enable ? port->inputs.write_enable[0] : 1;
+    port->input_values.address        = port->inputs.address[0];
+    port->input_values.write_data     = port->inputs.write_data[0];
+    port->inputs_captured = 1;
+    return error_level_okay;
+}
+
+/*f c_sram_image::clock */
+/**
+ * Perform the access of a port: a read drives data_out, and a write
+ * updates the bits of each enabled byte lane (or all bits if the SRAM
+ * has no write enables)
+ */
+t_sl_error_level c_sram_image::clock( t_sram_image_port *port )
+{
+    if (!port->input_values.select) return error_level_okay;
+    t_sl_uint64 address = port->input_values.address;
+    if (port->input_values.read_not_write) {
+        port->data_out = read_word(address);
+        return error_level_okay;
+    }
+    t_sl_uint64 mask = (width<64) ? ((1ULL<<width)-1) : ~0ULL;
+    if (num_enables>0) {
+        t_sl_uint64 enable_mask = 0;
+        t_sl_uint64 lane_mask = (bits_per_enable<64) ? ((1ULL<<bits_per_enable)-1) : ~0ULL;
+        for (int i=0; i<num_enables; i++) {
+            if ((port->input_values.write_enable>>i)&1) enable_mask |= lane_mask<<(i*bits_per_enable);
+        }
+        mask &= enable_mask;
+    }
+    write_word(address, (read_word(address) &~ mask) | (port->input_values.write_data & mask));
+    return error_level_okay;
+}
+
 /*a Static SRAM wrappers */
 /**
  * Use the SRAM_WRAPPER macro to create instantiation functions that
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+"""
+Exhaustive truth tables for the 6502 ALU
+
+The tables are built with NumPy for every input (carry in, A, B) of
+each ALU operation, giving the result and the N, V, Z and C flags
+(packed as in the PSR, and as c_6502.alu_flags). The V flag input is
+taken as clear; operations that do not change V therefore give V
+clear.
+
+The model's alu() is checked against the tables in one vectorised
+comparison per operation, and the tables may be written out as test
+vectors for the CDL cpu6502 ALU.
+"""
+#a Imports
+import array
+import unittest
+try:
+    import numpy
+except ImportError:
+    numpy = None
+    pass
+from model6502 import c_6502, R_ALU, R_FLAGS, PSR_N, PSR_V, PSR_Z, PSR_C, CARRY_PSR
+from model6502 import SHIFT_NONE, SHIFT_INC, SHIFT_DEC, SHIFT_LSR, SHIFT_ROR, SHIFT_ASL, SHIFT_ROL
+from model6502 import ALU_NONE, ALU_ADC, ALU_ADD, ALU_SBC, ALU_CMP, ALU_AND, ALU_OR, ALU_EOR, ALU_BIT
+
+#a ALU operations
+# Operations covered by the truth tables, as (name, shift op, ALU op);
+# the index of an operation in this tuple is its number in test vectors
+alu_operations = ( ("adc", SHIFT_NONE, ALU_ADC),
+                   ("add", SHIFT_NONE, ALU_ADD),
+                   ("sbc", SHIFT_NONE, ALU_SBC),
+                   ("cmp", SHIFT_NONE, ALU_CMP),
+                   ("and", SHIFT_NONE, ALU_AND),
+                   ("or",  SHIFT_NONE, ALU_OR),
+                   ("eor", SHIFT_NONE, ALU_EOR),
+                   ("bit", SHIFT_NONE, ALU_BIT),
+                   ("asl", SHIFT_ASL,  ALU_NONE),
+                   ("lsr", SHIFT_LSR,  ALU_NONE),
+                   ("rol", SHIFT_ROL,  ALU_NONE),
+                   ("ror", SHIFT_ROR,  ALU_NONE),
+                   ("inc", SHIFT_INC,  ALU_NONE),
+                   ("dec", SHIFT_DEC,  ALU_NONE),
+                   )
+alu_operation_names = [op[0] for op in alu_operations]
+
+#a Truth tables
+#f alu_inputs
+def alu_inputs():
+    """
+    Return (a, b, carry) arrays of shape (2,256,256) covering all inputs, indexed by [carry, a, b]
+    """
+    (carry, a, b) = numpy.indices((2,256,256), dtype=numpy.int32)
+    return (a, b, carry)
+
+#f alu_truth_table
+def alu_truth_table(name):
+    """
+    Return (value, flags) uint8 arrays of shape (2,256,256), indexed by
+    [carry, a, b], for the named ALU operation
+    """
+    (a, b, carry) = alu_inputs()
+    v = numpy.zeros_like(a)
+    c = carry
+    if name in ("adc", "add", "sbc", "cmp"):
+        if name in ("sbc", "cmp"): b = b ^ 0xff
+        if name=="add": carry = numpy.zeros_like(carry)
+        total = a + b + carry
+        value = total & 0xff
+        c = total >> 8
+        if name!="cmp": v = ((a ^ value) & (b ^ value)) >> 7
+        pass
+    elif name=="and": value = a & b
+    elif name=="or":  value = a | b
+    elif name=="eor": value = a ^ b
+    elif name=="bit": value = a
+    elif name=="asl": (value, c) = ((b<<1) & 0xff, b>>7)
+    elif name=="lsr": (value, c) = (b>>1, b&1)
+    elif name=="rol": (value, c) = (((b<<1) | carry) & 0xff, b>>7)
+    elif name=="ror": (value, c) = ((b>>1) | (carry<<7), b&1)
+    elif name=="inc": value = (b+1) & 0xff
+    elif name=="dec": value = (b-1) & 0xff
+    else: raise Exception("Unknown ALU operation '%s'"%name)
+    n = value & PSR_N
+    z = (value==0)
+    if name=="bit":
+        n = b & PSR_N
+        v = (b>>6) & 1
+        z = ((a & b)==0)
+        pass
+    flags = n | (v*PSR_V) | (z*PSR_Z) | (c*PSR_C)
+    return (value.astype(numpy.uint8), flags.astype(numpy.uint8))
+
+#f model_alu_table
+def model_alu_table(name, cpu=None):
+    """
+    Return (value, flags) uint8 arrays of shape (2,256,256), indexed by
+    [carry, a, b], of the named ALU operation as performed by c_6502.alu
+    """
+    (shift_op, alu_op) = alu_operations[alu_operation_names.index(name)][1:]
+    if cpu is None: cpu = c_6502()
+    registers = cpu.registers
+    alu = cpu.alu
+    values = array.array('B')
+    flags = array.array('B')
+    for carry in (0,1):
+        registers[R_FLAGS] = carry * PSR_C
+        for a in range(256):
+            for b in range(256):
+                alu(shift_op, alu_op, CARRY_PSR, a, b)
+                values.append(registers[R_ALU])
+                flags.append(cpu.alu_flags)
+                pass
+            pass
+        pass
+    values = numpy.frombuffer(values.tostring(), dtype=numpy.uint8).reshape((2,256,256))
+    flags = numpy.frombuffer(flags.tostring(), dtype=numpy.uint8).reshape((2,256,256))
+    return (values, flags)
+
+#f check_alu
+def check_alu(name, cpu=None):
+    """
+    Compare the model's ALU with the truth table for the named operation
+
+    Returns an array of (carry, a, b) inputs for which they differ
+    """
+    (value, flags) = alu_truth_table(name)
+    (model_value, model_flags) = model_alu_table(name, cpu)
+    return numpy.argwhere((value!=model_value) | (flags!=model_flags))
+
+#f alu_test_vectors
+def alu_test_vectors(names=None):
+    """
+    Return an (N,6) uint8 array of test vectors, each (operation, a, b,
+    carry, value, flags), for the named operations (default all)
+    """
+    if names is None: names = alu_operation_names
+    (a, b, carry) = alu_inputs()
+    vectors = []
+    for name in names:
+        (value, flags) = alu_truth_table(name)
+        op = numpy.empty_like(value)
+        op.fill(alu_operation_names.index(name))
+        vectors.append(numpy.column_stack([x.ravel() for x in (op, a, b, carry, value, flags)]).astype(numpy.uint8))
+        pass
+    return numpy.concatenate(vectors)
+
+#f write_test_vectors
+def write_test_vectors(filename, names=None, binary=False):
+    """
+    Write test vectors for the named operations (default all) to a file
+
+    As text each line is 'op a b carry value flags' in hex; as binary
+    each vector is those six bytes. Operations are numbered by their
+    index in alu_operations.
+    """
+    vectors = alu_test_vectors(names)
+    if binary:
+        vectors.tofile(filename)
+        return
+    header = "6502 ALU test vectors: op a b carry value flags (NV--DIZC); ops "
+    header += " ".join(["%d:%s"%(i,n) for (i,n) in enumerate(alu_operation_names)])
+    numpy.savetxt(filename, vectors, fmt="%02x", header=header)
+    pass
+
+#a Tests
+#c Test6502_ALU_Tables
+class Test6502_ALU_Tables(unittest.TestCase):
+    #f check_operation
+    def check_operation(self, name):
+        mismatches = check_alu(name, self.cpu)
+        if len(mismatches)>0:
+            (carry, a, b) = mismatches[0]
+            self.fail("ALU %s mismatches truth table for %d inputs, first a=%02x b=%02x carry=%d"%(name, len(mismatches), a, b, carry))
+            pass
+        pass
+    #f setUp
+    def setUp(self):
+        if numpy is None: self.skipTest("NumPy is not available")
+        self.cpu = c_6502()
+        pass
+    #f test_add
+    def test_add(self):
+        for name in ("adc", "add", "sbc", "cmp"):
+            self.check_operation(name)
+            pass
+        pass
+    #f test_logical
+    def test_logical(self):
+        for name in ("and", "or", "eor", "bit"):
+            self.check_operation(name)
+            pass
+        pass
+    #f test_shift
+    def test_shift(self):
+        for name in ("asl", "lsr", "rol", "ror", "inc", "dec"):
+            self.check_operation(name)
+            pass
+        pass
+    #f test_vectors
+    def test_vectors(self):
+        vectors = alu_test_vectors(["adc"])
+        self.assertEqual(vectors.shape, (2*256*256, 6))
+        self.assertEqual(list(vectors[(1*256+0x7f)*256+0x00]), [0, 0x7f, 0x00, 1, 0x80, PSR_N|PSR_V])
+        pass
+    pass
+
+#a Toplevel
+if __name__=="__main__":
+    unittest.main()
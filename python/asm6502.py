@@ -17,7 +17,12 @@ class c_assembler_line(object):
         self.assembly = None
         self.data_define = None
         self.value = None
+        self.unresolved = False
         pass
+    def clone(self):
+        l = c_assembler_line.__new__(c_assembler_line)
+        l.__dict__.update(self.__dict__)
+        return l
     def set_label(self, label):
         self.label = label
         pass
@@ -39,6 +44,13 @@ class c_assembler_line(object):
         self.value = value
         pass
     def assemble(self, instruction_set, scope, asm_pass):
+        """
+        Assemble the line at the current PC of the scope, returning its length
+
+        In pass 0 an operand that is not yet resolved is assembled as
+        zero (or None) at its largest size, and the line is marked as
+        unresolved; resolve() then completes it in a later pass
+        """
         self.pc = scope.pc
         if self.label: scope.set_symbol(self.label, self.pc)
         if self.assignment is not None:
@@ -54,6 +66,7 @@ class c_assembler_line(object):
         if self.data_define is not None:
             e = scope.evaluate(self.value, relative=False)
             if (asm_pass>=1) and (e is None): raise Exception("Could not resolve '%s' in data definition"%str(self.value))
+            self.unresolved = (e is None)
             if e is None: e=0
             a = []
             if self.data_define[-1] in "bBwW":
@@ -67,7 +80,21 @@ class c_assembler_line(object):
         if self.mnemonic is None:
             return 0
         self.assembly = instruction_set.assemble(self.addressing, self.ie, scope, asm_pass)
+        self.unresolved = (None in self.assembly)
         return len(self.assembly)
+    def resolve(self, instruction_set, scope):
+        """
+        Resolve the forward references of an unresolved line, keeping its length
+        """
+        scope.set_pc(self.pc)
+        if self.data_define is not None:
+            self.assemble(instruction_set, scope, asm_pass=1)
+            pass
+        else:
+            self.assembly = instruction_set.assemble(self.addressing, self.ie, scope, asm_pass=1, length=len(self.assembly))
+            pass
+        self.unresolved = False
+        pass
     def __str__(self):
         r = ""
         if self.pc is not None: r += "%04x "%self.pc
@@ -84,9 +111,14 @@ class c_assembler_line(object):
 
 #c c_assembler_scope
 class c_assembler_scope(object):
+    local_label_re = re.compile("%([fFbF])([0-9][0-9])")
+    hex_re = re.compile("^([$&]|0x|0X)([0-9a-fA-f]+)$")
+    decimal_re = re.compile("^([0-9]+)$")
+    number_start_chars = "$&0123456789"
     def __init__(self):
         self.pc = None
         self.labels = {}
+        self.constants = {}
         pass
     def set_pc(self, value):
         self.pc = value
@@ -104,7 +136,7 @@ class c_assembler_scope(object):
         pass
     def resolve_symbol(self, symbol):
         if symbol==".": return self.pc
-        if re.match("%([fFbF])([0-9][0-9])",symbol): die
+        if self.local_label_re.match(symbol): die
         if symbol not in self.labels: return None
         return self.labels[symbol]
     def evaluate(self, string, relative):
@@ -116,54 +148,61 @@ class c_assembler_scope(object):
             if (v<-128) or (v>127): return None
             return (v&0xff)
             pass
-        m=re.match("^([$&]|0x|0X)([0-9a-fA-f]+)$",string)
-        if m: return int(m.group(2),16)
-        m=re.match("^([0-9]+)$",string)
-        if m: return int(m.group(1))
+        if (string=="") or (string[0] not in self.number_start_chars):
+            return self.resolve_symbol(string)
+        if string in self.constants: return self.constants[string]
+        m=self.hex_re.match(string)
+        if m:
+            self.constants[string] = int(m.group(2),16)
+            return self.constants[string]
+        m=self.decimal_re.match(string)
+        if m:
+            self.constants[string] = int(m.group(1))
+            return self.constants[string]
         return self.resolve_symbol(string)
 
 #c c_assembler
 class c_assembler(object):
-    blank_re = "^ *$"
-    strip_comment_re = "^([^;]*);(.*)"
-    assignment_directive_re = "^ *([.]) *= *(.*)$"
-    define_directive_re = "^ *define *([a-zA-Z0-9_]*) *(.*)$"
-    label_re = "^ *([a-z0-9A-Z_]+): *(.*)"
-    define_data_re = "^ *(dcb|dcw) *(.*)"
-    mnemonic_re = "^ *([a-zA-Z]+) *(.*)"
+    blank_re = re.compile("^ *$")
+    strip_comment_re = re.compile("^([^;]*);(.*)")
+    assignment_directive_re = re.compile("^ *([.]) *= *(.*)$")
+    define_directive_re = re.compile("^ *define *([a-zA-Z0-9_]*) *(.*)$")
+    label_re = re.compile("^ *([a-z0-9A-Z_]+): *(.*)")
+    define_data_re = re.compile("^ *(dcb|dcw) *(.*)")
+    mnemonic_re = re.compile("^ *([a-zA-Z]+) *(.*)")
     def __init__(self, instruction_set):
         self.instruction_set = instruction_set
         pass
     def parse_line(self, string):
         l = c_assembler_line()
-        m = re.match(self.strip_comment_re, string)
+        m = self.strip_comment_re.match(string)
         if m:
             string = m.group(1)
             l.set_comment(m.group(2))
             pass
-        m = re.match(self.assignment_directive_re, string)
+        m = self.assignment_directive_re.match(string)
         if m:
             l.set_assignment(m.group(1),m.group(2))
             string = ""
             pass
-        m = re.match(self.define_directive_re, string)
+        m = self.define_directive_re.match(string)
         if m:
             l.set_assignment(m.group(1),m.group(2))
             string = ""
             pass
-        m = re.match(self.label_re, string)
+        m = self.label_re.match(string)
         if m:
             l.set_label(m.group(1))
             string = m.group(2)
             pass
-        m = re.match(self.define_data_re, string)
+        m = self.define_data_re.match(string)
         if m:
             data_define = m.group(1)
             value = m.group(2)
             l.set_data_definition(data_define,value)
             string = ""
             pass
-        m = re.match(self.mnemonic_re, string)
+        m = self.mnemonic_re.match(string)
         if m:
             mnemonic = m.group(1)
             addressing = m.group(2)
@@ -174,22 +213,30 @@ class c_assembler(object):
                 string = ""
                 pass
             pass
-        if re.match(self.blank_re,string):
+        if self.blank_re.match(string):
             return l
         raise Exception("Unparsed assembler line (what remains...) %s"%string)
     def assemble(self, program, base_address=0, verbose=False):
         code = []
         parsed_program = []
+        parsed_lines = {}
         for l in program.split("\n"):
-            parsed_program.append(self.parse_line(l))
+            if l in parsed_lines:
+                parsed_program.append(parsed_lines[l].clone())
+                continue
+            parsed_lines[l] = self.parse_line(l)
+            parsed_program.append(parsed_lines[l])
             pass
         scope = c_assembler_scope()
-        for asm_pass in range(2):
-            scope.set_pc(base_address)
-            for p in parsed_program:
-                n = p.assemble(self.instruction_set, scope, asm_pass)
-                scope.advance_pc(n)
-                pass
+        scope.set_pc(base_address)
+        fixups = []
+        for p in parsed_program:
+            n = p.assemble(self.instruction_set, scope, asm_pass=0)
+            if p.unresolved: fixups.append(p)
+            scope.advance_pc(n)
+            pass
+        for p in fixups:
+            p.resolve(self.instruction_set, scope)
             pass
         code_fragment = None
         for p in parsed_program:
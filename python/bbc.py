@@ -4,8 +4,8 @@ class c_bbc(object):
     def __init__(self):
         self.cpu = c_6502()
         self.memory = c_memory()
-        self.memory.load_binary(0xc000, file("../../BeebEm3/BeebFile/BBCINT/OS12.ROM","r"))
-        self.memory.load_binary(0x8000, file("../../BeebEm3/BeebFile/BBCINT/BASIC2.ROM","r"))
+        self.memory.load_binary(0xc000, file("../../BeebEm3/BeebFile/BBCINT/OS12.ROM","r"), rom=True)
+        self.memory.load_binary(0x8000, file("../../BeebEm3/BeebFile/BBCINT/BASIC2.ROM","r"), rom=True)
         self.cpu.reset()
         pass
     def tick(self, n):
@@ -20,8 +20,8 @@ class c_bbc(object):
                     self.memory.write(ts["mem"][1], ts["mem"][2])
                     pass
                 pass
-            te = self.cpu.tick_end(data_in=data_in)
-            print "%02x"%data_in, te
+            self.cpu.tick_end(data_in=data_in)
+            print "%02x"%data_in, self.cpu.get_alu_result()
             print self.cpu
             pass
         pass
@@ -1,15 +1,21 @@
 #!/usr/bin/env python
 import sys
+import array
+import dump
 disk_filename = sys.argv[1]
+sram_image_filename = None
+if len(sys.argv)>2: sram_image_filename = sys.argv[2]
 a = open(disk_filename)
 num_tracks = 40
 sectors_per_track = 10
+words = array.array('I')
 address = 0
 r = "%04x: "%address    
 while True:
     ch = a.read(4)
     if len(ch)==0: break
     r += "%02x%02x%02x%02x "%(ord(ch[3]),ord(ch[2]),ord(ch[1]),ord(ch[0]))
+    words.append((ord(ch[3])<<24) | (ord(ch[2])<<16) | (ord(ch[1])<<8) | ord(ch[0]))
     address = address+1
     if (address%16)==0:
         print r
@@ -18,11 +24,18 @@ while True:
     if address>=0x7000: break
     pass
 address = 0x7000
+words.extend([0]*(address-len(words)))
 for track in range(num_tracks):
     for sector in range(sectors_per_track):
         r = "%04x: "%address    
         r += "%08x" % ((track<<0) | (sector<<8) | (1<<16) | (0<<24)) # head 0, no errors etc
+        words.append((track<<0) | (sector<<8) | (1<<16) | (0<<24))
         print r
         address = address + 1
         pass
     pass
+if sram_image_filename is not None:
+    f = open(sram_image_filename, "wb")
+    dump.write_sram_image(f, 32, 0, words)
+    f.close()
+    pass
@@ -1,10 +1,413 @@
 #!/usr/bin/env python
 #a Imports
 import re
+import os
 import sys, inspect
+import time
+import hashlib
+import tempfile
+import array
+import struct
+import binascii
+import bisect
+import itertools
 import elftools.elf.elffile
 
+#a Loader version
+# Version of the loading of images, part of the keys of c_mif_cache; it
+# must be bumped by any change to the loaders that changes what they load
+loader_version = 2
+
+#a SRAM images
+sram_image_magic = "CDLSRAM\0"
+sram_image_version = 1
+sram_image_header = struct.Struct("<8sIIQQII24x")
+
+#f write_sram_image
+def write_sram_image(f, width, base_address, payload):
+    """
+    Write a binary SRAM image (as read by the srams C model) of a payload of
+    little-endian words, given as a string or an array whose item size is the
+    bytes per word (1, 2, 4 or 8)
+    """
+    if isinstance(payload, array.array):
+        bytes_per_word = payload.itemsize
+        if sys.byteorder!="little":
+            payload = array.array(payload.typecode, payload)
+            payload.byteswap()
+            pass
+        payload = payload.tostring()
+        pass
+    else:
+        bytes_per_word = 1
+        while bytes_per_word*8<width: bytes_per_word *= 2
+        pass
+    depth = len(payload)/bytes_per_word
+    f.write(sram_image_header.pack(sram_image_magic, sram_image_version, width, depth, base_address,
+                                   bytes_per_word, sram_image_header.size))
+    f.write(payload)
+    pass
+
+#a Intel HEX
+ihex_block_records = 4096
+ihex_block_size = 1<<18
+ihex_negate = "".join([chr((-i) & 0xff) for i in range(256)])
+
+#f ihex_row_sums
+def ihex_row_sums(rows, width):
+    """
+    Return a string of the sums (modulo 256) of the bytes of each row of a
+    string of rows of width bytes
+
+    The byte columns are summed as big integers with a 16-bit lane per row
+    (which cannot overflow for rows of up to 257 bytes), so that the sums
+    take a handful of operations per column rather than per row.
+    """
+    num_rows = len(rows)/width
+    if num_rows==0: return ""
+    lanes = bytearray(2*num_rows)
+    total = 0
+    for i in range(width):
+        lanes[1::2] = rows[i:num_rows*width:width]
+        total += int(binascii.hexlify(lanes), 16)
+        pass
+    return binascii.unhexlify("%0*x"%(4*num_rows, total))[1::2]
+
+#f ihex_record
+def ihex_record(record_type, address, data):
+    record = struct.pack(">BHB", len(data), address, record_type) + data
+    return ":%s%02X\n"%(binascii.hexlify(record).upper(), (-sum(bytearray(record))) & 0xff)
+
+#f write_ihex_data
+def write_ihex_data(f, address, data, bytes_per_record=16):
+    """
+    Write data records for a string of bytes at a 16-bit address, which must
+    not cross a 64kB boundary; full records are built a block at a time by
+    columns
+    """
+    width = bytes_per_record+5
+    line_length = 2*width+2
+    n = 0
+    while len(data)-n>=bytes_per_record:
+        num_records = min((len(data)-n)/bytes_per_record, ihex_block_records)
+        addresses = array.array('H', xrange(address, address+num_records*bytes_per_record, bytes_per_record))
+        if sys.byteorder=="little": addresses.byteswap()
+        addresses = addresses.tostring()
+        records = bytearray(width*num_records)
+        records[0::width] = chr(bytes_per_record)*num_records
+        records[1::width] = addresses[0::2]
+        records[2::width] = addresses[1::2]
+        for i in range(bytes_per_record):
+            records[4+i::width] = data[n+i:n+num_records*bytes_per_record:bytes_per_record]
+            pass
+        records[width-1::width] = ihex_row_sums(str(records), width).translate(ihex_negate)
+        hex_records = binascii.hexlify(records).upper()
+        text = bytearray(line_length*num_records)
+        text[0::line_length] = ":"*num_records
+        for i in range(2*width):
+            text[1+i::line_length] = hex_records[i::2*width]
+            pass
+        text[line_length-1::line_length] = "\n"*num_records
+        f.write(text)
+        address += num_records*bytes_per_record
+        n += num_records*bytes_per_record
+        pass
+    if n<len(data): f.write(ihex_record(0, address, data[n:]))
+    pass
+
+#c c_ihex_reader
+class c_ihex_reader(object):
+    """
+    Reader of the lines of an Intel HEX file in to a c_dump, gathering
+    consecutive data in to runs
+
+    A block of lines of one length that are data records at consecutive
+    addresses (the bulk of most files) is decoded and checksummed by
+    columns; any other lines are handled a record at a time.
+    """
+    #f __init__
+    def __init__(self, dump, base_address=0, address_mask=0xffffffff):
+        self.dump = dump
+        self.base_address = base_address
+        self.address_mask = address_mask
+        self.upper = 0
+        self.run_address = None
+        self.run_end = None
+        self.run = []
+        self.line_number = 0
+        self.done = False
+        pass
+    #f add_data
+    def add_data(self, address, data):
+        if address!=self.run_end:
+            self.flush()
+            self.run_address = address
+            pass
+        self.run.append(data)
+        self.run_end = address+len(data)
+        pass
+    #f flush
+    def flush(self):
+        if len(self.run)>0:
+            self.dump.add_data_bytes("".join(self.run), self.run_address, self.base_address, self.address_mask)
+            pass
+        self.run = []
+        self.run_end = None
+        pass
+    #f add_lines
+    def add_lines(self, lines):
+        """
+        Add lines, as blocks of consecutive lines of the same length
+        """
+        for (length, block) in itertools.groupby(lines, len):
+            if self.done: return
+            block = list(block)
+            if (len(block)>1) and self.add_data_block(block): continue
+            for l in block: self.add_record(l)
+            pass
+        pass
+    #f add_data_block
+    def add_data_block(self, lines):
+        """
+        Add a block of lines if they are data records of one length at
+        consecutive addresses, returning False (having added nothing) if not
+        """
+        num_lines = len(lines)
+        record = lines[0].rstrip()
+        eol = lines[0][len(record):]
+        line_length = len(lines[0])
+        if (eol not in ("\n", "\r\n")) or (len(record)<13) or (len(record)%2==0): return False
+        text = "".join(lines)
+        if len(text)!=num_lines*line_length: return False
+        if text[line_length-1::line_length]!="\n"*num_lines: return False
+        if (len(eol)==2) and (text[line_length-2::line_length]!="\r"*num_lines): return False
+        if text[0::line_length]!=":"*num_lines: return False
+        count = (len(record)-11)/2
+        width = count+5
+        hex_records = bytearray(2*width*num_lines)
+        for i in range(2*width):
+            hex_records[i::2*width] = text[1+i::line_length]
+            pass
+        try:
+            records = binascii.unhexlify(hex_records)
+            pass
+        except TypeError:
+            return False
+        if records[0::width]!=chr(count)*num_lines: return False
+        if records[3::width]!="\0"*num_lines: return False
+        address = (ord(records[1])<<8) | ord(records[2])
+        if address+num_lines*count>0x10000: return False
+        addresses = array.array('H', xrange(address, address+num_lines*count, count))
+        if sys.byteorder=="little": addresses.byteswap()
+        addresses = addresses.tostring()
+        if (records[1::width]!=addresses[0::2]) or (records[2::width]!=addresses[1::2]): return False
+        if ihex_row_sums(records, width)!="\0"*num_lines: return False
+        data = bytearray(count*num_lines)
+        for i in range(count):
+            data[i::count] = records[4+i::width]
+            pass
+        self.line_number += num_lines
+        self.add_data(self.upper+address, str(data))
+        return True
+    #f add_record
+    def add_record(self, l):
+        self.line_number += 1
+        if self.done: return
+        l = l.strip()
+        if len(l)==0: return
+        if l[0]!=':': raise Exception("Bad Intel HEX record at line %d"%self.line_number)
+        try:
+            record = binascii.unhexlify(l[1:])
+            pass
+        except TypeError:
+            raise Exception("Bad Intel HEX record at line %d"%self.line_number)
+        if (len(record)<5) or (len(record)!=5+ord(record[0])) or (sum(bytearray(record)) & 0xff):
+            raise Exception("Bad Intel HEX record at line %d"%self.line_number)
+        record_type = ord(record[3])
+        data = record[4:-1]
+        if record_type==0:
+            self.add_data(self.upper + ((ord(record[1])<<8) | ord(record[2])), data)
+            pass
+        elif record_type==1:
+            self.done = True
+            pass
+        elif record_type==2:
+            self.upper = ((ord(data[0])<<8) | ord(data[1])) << 4
+            pass
+        elif record_type==4:
+            self.upper = ((ord(data[0])<<8) | ord(data[1])) << 16
+            pass
+        pass
+    pass
+
 #a Classes
+#c c_dump_memory
+class c_dump_memory(object):
+    """
+    Sparse memory of 32-bit words by word address, behaving as a dictionary
+
+    Words are held in fixed-size pages of array('I'); each page keeps the
+    runs of its words that have been written, as sorted [start, end)
+    offsets, so the populated words can be walked in address order in
+    linear time.
+    """
+    page_shift = 10
+    page_words = 1<<page_shift
+    #f __init__
+    def __init__(self):
+        self.pages = {}
+        self.runs = {}
+        self.num_words = 0
+        pass
+    #f __len__
+    def __len__(self):
+        return self.num_words
+    #f __contains__
+    def __contains__(self, address):
+        runs = self.runs.get(address >> self.page_shift)
+        if runs is None: return False
+        offset = address & (self.page_words-1)
+        i = bisect.bisect_right(runs, [offset, self.page_words])
+        return (i>0) and (offset<runs[i-1][1])
+    #f __getitem__
+    def __getitem__(self, address):
+        if address not in self: raise KeyError(address)
+        return self.pages[address >> self.page_shift][address & (self.page_words-1)]
+    #f get
+    def get(self, address, default=None):
+        if address not in self: return default
+        return self.pages[address >> self.page_shift][address & (self.page_words-1)]
+    #f populate
+    def populate(self, page, offset):
+        """
+        Mark a word as written, returning True if it already was
+        """
+        runs = self.runs.get(page)
+        if runs is None:
+            self.pages[page] = array.array('I', [0])*self.page_words
+            runs = []
+            self.runs[page] = runs
+            pass
+        # Fast path for extending the last run, as loading sequential data does
+        if (len(runs)>0) and (runs[-1][0]<=offset<=runs[-1][1]):
+            if offset<runs[-1][1]: return True
+            runs[-1][1] = offset+1
+            self.num_words += 1
+            return False
+        i = bisect.bisect_right(runs, [offset, self.page_words])
+        if (i>0) and (offset<runs[i-1][1]): return True
+        self.num_words += 1
+        if (i>0) and (offset==runs[i-1][1]):
+            runs[i-1][1] = offset+1
+            if (i<len(runs)) and (runs[i][0]==offset+1):
+                runs[i-1][1] = runs[i][1]
+                del runs[i]
+                pass
+            return False
+        if (i<len(runs)) and (runs[i][0]==offset+1):
+            runs[i][0] = offset
+            return False
+        runs.insert(i, [offset, offset+1])
+        return False
+    #f __setitem__
+    def __setitem__(self, address, data):
+        (page, offset) = (address >> self.page_shift, address & (self.page_words-1))
+        self.populate(page, offset)
+        self.pages[page][offset] = data
+        pass
+    #f populate_run
+    def populate_run(self, page, start, end):
+        """
+        Mark the words from offset start up to end of a page as written
+        """
+        runs = self.runs.get(page)
+        if runs is None:
+            self.pages[page] = array.array('I', [0])*self.page_words
+            runs = []
+            self.runs[page] = runs
+            pass
+        # Replace the runs that overlap or adjoin [start, end) with their union
+        lo = bisect.bisect_left(runs, [start, 0])
+        if (lo>0) and (runs[lo-1][1]>=start): lo -= 1
+        (hi, covered, new_start, new_end) = (lo, 0, start, end)
+        while (hi<len(runs)) and (runs[hi][0]<=end):
+            covered += max(0, min(runs[hi][1], end) - max(runs[hi][0], start))
+            new_start = min(new_start, runs[hi][0])
+            new_end = max(new_end, runs[hi][1])
+            hi += 1
+            pass
+        runs[lo:hi] = [[new_start, new_end]]
+        self.num_words += (end-start) - covered
+        pass
+    #f set_words
+    def set_words(self, address, words):
+        """
+        Write an array('I') of words from a word address
+        """
+        n = 0
+        while n<len(words):
+            (page, offset) = (address >> self.page_shift, address & (self.page_words-1))
+            count = min(len(words)-n, self.page_words-offset)
+            self.populate_run(page, offset, offset+count)
+            self.pages[page][offset:offset+count] = words[n:n+count]
+            address += count
+            n += count
+            pass
+        pass
+    #f merge
+    def merge(self, address, data, mask=0):
+        """
+        Set a word to data, ORed with the bits of mask of its current value if it has been written
+        """
+        (page, offset) = (address >> self.page_shift, address & (self.page_words-1))
+        if self.populate(page, offset): data |= self.pages[page][offset] & mask
+        self.pages[page][offset] = data
+        pass
+    #f regions
+    def regions(self):
+        """
+        Generate (address, array('I')) for each run of consecutive populated words, in address order
+        """
+        (base, data) = (None, None)
+        for page in sorted(self.pages.keys()):
+            words = self.pages[page]
+            for (start, end) in self.runs[page]:
+                address = page*self.page_words + start
+                if (base is not None) and (base+len(data)==address):
+                    data.extend(words[start:end])
+                    continue
+                if base is not None: yield (base, data)
+                (base, data) = (address, words[start:end])
+                pass
+            pass
+        if base is not None: yield (base, data)
+        pass
+    #f iteritems
+    def iteritems(self):
+        for (base, data) in self.regions():
+            for (i, d) in enumerate(data):
+                yield (base+i, d)
+                pass
+            pass
+        pass
+    #f iterkeys
+    def iterkeys(self):
+        for (a, d) in self.iteritems(): yield a
+        pass
+    #f __iter__
+    def __iter__(self):
+        return self.iterkeys()
+    #f keys
+    def keys(self):
+        return list(self.iterkeys())
+    #f items
+    def items(self):
+        return list(self.iteritems())
+    #f values
+    def values(self):
+        return [d for (a, d) in self.iteritems()]
+    pass
+
 #c c_dump
 class c_dump(object):
     #b Static properties
@@ -16,7 +419,7 @@ class c_dump(object):
     res["label_match"] = re.compile(r"%s%s%s<%s>:"%(res["opt_whitespace"], res["hex"], res["whitespace"], res["uid"]))
     res["data_match"]  = re.compile(r"%s%s:%s%s.*"%(res["opt_whitespace"], res["hex"], res["whitespace"], res["hex"]))
     res["data_label_match"]  = re.compile(r"#%s%s%s<%s>"%(res["whitespace"], res["hex"], res["whitespace"], res["uid"]))
-    res["mif_label_match"]       = re.compile(r"#%s%s:%s:"%(res["whitespace"], res["hex"], res["uid"]))
+    res["mif_label_match"]       = re.compile(r"#%s%s:%s"%(res["opt_whitespace"], res["hex"], res["uid"]))
     res["mif_data_match"]        = re.compile(r"%s:%s%s.*"%(res["hex"], res["whitespace"], res["hex"]))
     res["mif_data_label_match"]  = re.compile(r"#%s%s%s<%s>"%(res["whitespace"], res["hex"], res["whitespace"], res["uid"]))
     def __init__(self):
@@ -26,7 +429,7 @@ class c_dump(object):
     #f reset
     def reset(self):
         self.labels = {}
-        self.data   = {}
+        self.data   = c_dump_memory()
         pass
     #f load
     def load(self, f, base_address=0, address_mask=0xffffffff):
@@ -54,7 +457,7 @@ class c_dump(object):
             data_match  = self.res["mif_data_match"].match(l)
             data_label_match  = self.res["mif_data_label_match"].search(l)
             if label_match:
-                self.add_label(label_match.group(3), int(label_match.group(1),16), base_address, address_mask)
+                self.add_label(label_match.group(2), int(label_match.group(1),16), base_address, address_mask)
                 pass
             if data_match:
                 self.add_data(int(data_match.group(3),16), 4*int(data_match.group(1),16), base_address, address_mask)
@@ -64,19 +467,102 @@ class c_dump(object):
                 pass
             pass
         pass
+    #f load_mif_labels
+    def load_mif_labels(self, f, base_address=0, address_mask=0xffffffff):
+        """
+        Load just the labels of a MIF file written by write_mif, which puts them before the data
+        """
+        self.reset()
+        for l in f:
+            label_match = self.res["mif_label_match"].match(l)
+            if not label_match: break
+            self.add_label(label_match.group(2), int(label_match.group(1),16), base_address, address_mask)
+            pass
+        pass
+    #f load_ihex
+    def load_ihex(self, f, base_address=0, address_mask=0xffffffff):
+        """
+        Load an Intel HEX file, with extended segment and linear addressing
+        """
+        self.reset()
+        reader = c_ihex_reader(self, base_address, address_mask)
+        while True:
+            lines = f.readlines(ihex_block_size)
+            if len(lines)==0: break
+            reader.add_lines(lines)
+            pass
+        reader.flush()
+        pass
+    #f load_bin
+    def load_bin(self, f, base_address=0, address_mask=0xffffffff, address=None):
+        """
+        Load a raw binary file at an address (default base_address)
+        """
+        self.reset()
+        if address is None: address = base_address
+        while True:
+            data = f.read(1<<20)
+            if len(data)==0: break
+            self.add_data_bytes(data, address, base_address, address_mask)
+            address += len(data)
+            pass
+        pass
+    #f load_file
+    def load_file(self, filename, base_address=0, address_mask=0xffffffff):
+        """
+        Load a file with the loader for its extension (see file_loaders), as a dump file by default
+        """
+        loader = file_loaders.get(os.path.splitext(filename)[1].lower(), c_dump.load)
+        f = open(filename, "rb")
+        loader(self, f, base_address, address_mask)
+        f.close()
+        pass
     #f load_elf
     def load_elf(self, f, base_address=0, address_mask=0xffffffff):
+        """
+        Load the PT_LOAD segments of an ELF file, zero-filling beyond their
+        file data (such as .bss), or its allocated PROGBITS sections if it
+        has no segments, and the labels of its symbol tables
+        """
         self.reset()
         elf = elftools.elf.elffile.ELFFile(f)
+        segments = [s for s in elf.iter_segments() if s.header.p_type=='PT_LOAD']
         for i in elf.iter_sections():
             #print i.name, i.header
             if i.header.sh_type=='SHT_SYMTAB':   self.load_elf_symtab_section(i, base_address, address_mask)
+            if len(segments)>0: continue
             if i.header.sh_type=='SHT_PROGBITS': self.load_elf_data_section(i, base_address, address_mask)
+        for s in segments:
+            self.load_elf_segment(s, base_address, address_mask)
+            pass
         pass
     #f load_elf_symtab_section
     def load_elf_symtab_section(self, section, base_address=0, address_mask=0xffffffff):
-        for s in section.iter_symbols():
-            self.add_label(s.name, s.entry.st_value)
+        """
+        Add a label for each symbol, unpacking the symbol table directly
+        """
+        elf = section.elffile
+        (fmt, value_field) = ("IIIBBH", 1)
+        if elf.elfclass==64: (fmt, value_field) = ("IBBHQQ", 4)
+        if elf.little_endian: fmt = "<"+fmt
+        else: fmt = ">"+fmt
+        symbol = struct.Struct(fmt)
+        strings = section.stringtable.data()
+        data = section.data()
+        for ofs in range(0, len(data)-symbol.size+1, section.header.sh_entsize):
+            fields = symbol.unpack_from(data, ofs)
+            name = strings[fields[0]:strings.find("\0", fields[0])]
+            self.add_label(name, fields[value_field], base_address, address_mask)
+            pass
+        pass
+    #f load_elf_segment
+    def load_elf_segment(self, segment, base_address=0, address_mask=0xffffffff):
+        address = segment.header.p_vaddr
+        size = segment.header.p_filesz
+        print "Load segment of %d bytes to %08x"%(size,address)
+        self.add_data_bytes(segment.data()[:size], address, base_address, address_mask)
+        if segment.header.p_memsz>size:
+            self.add_data_bytes("\0"*(segment.header.p_memsz-size), address+size, base_address, address_mask)
             pass
         pass
     #f load_elf_data_section
@@ -87,13 +573,8 @@ class c_dump(object):
             return
         address = section.header.sh_addr
         size = section.data_size
-        data = section.data()
         print "Load section %s of %d bytes to %08x"%(section.name,size,address)
-        n = 0
-        for d in data:
-            self.add_data_byte(ord(d),address+n,base_address,address_mask)
-            n += 1
-            pass
+        self.add_data_bytes(section.data(), address, base_address, address_mask)
         pass
     #f add_label
     def add_label(self,label,address,base_address=0, address_mask=0xffffffff):
@@ -106,11 +587,31 @@ class c_dump(object):
         offset = address&3
         address = address/4
         data = data << (8*offset)
-        if address in self.data:
-            mask = (0xff << (8*offset)) ^ 0xffffffff
-            data = data | (self.data[address] & mask)
+        self.data.merge(address, data, (0xff << (8*offset)) ^ 0xffffffff)
+        pass
+    #f add_data_bytes
+    def add_data_bytes(self,data,address,base_address=0, address_mask=0xffffffff):
+        """
+        Add a string of bytes, copying whole words into the memory at once
+        """
+        address = (address-base_address) & address_mask
+        n = 0
+        while (n<len(data)) and ((address+n)&3):
+            self.add_data_byte(ord(data[n]),address+n)
+            n += 1
+            pass
+        num_words = (len(data)-n)/4
+        if num_words>0:
+            words = array.array('I')
+            words.fromstring(data[n:n+4*num_words])
+            if sys.byteorder=="big": words.byteswap()
+            self.data.set_words((address+n)/4, words)
+            n += 4*num_words
+            pass
+        while n<len(data):
+            self.add_data_byte(ord(data[n]),address+n)
+            n += 1
             pass
-        self.data[address] = data
         pass
     #f add_data
     def add_data(self,data,address,base_address=0, address_mask=0xffffffff):
@@ -121,10 +622,7 @@ class c_dump(object):
             self.add_data((data<<(8*offset))&0xffffffff,address*4,base_address=0)
             self.add_data((data>>(32-8*offset))&0xffffffff,address*4+4,base_address=0)
             return
-        if address in self.data:
-            data = data | self.data[address]
-            pass
-        self.data[address] = data
+        self.data.merge(address, data, 0xffffffff)
         pass
     #f resolve_label
     def resolve_label(self, label):
@@ -137,18 +635,10 @@ class c_dump(object):
         Package data in to a list of (base, [data*])
         """
         package = []
-        addresses = self.data.keys()
-        addresses.sort()
-        while len(addresses)>0:
-            base = addresses[0]
-            data = []
-            i = base
-            while (len(addresses)>0) and (i==addresses[0]) and (len(data)<max_per_base):
-                data.append(self.data[i])
-                addresses.pop(0)
-                i += 1
+        for (base, data) in self.data.regions():
+            for i in range(0, len(data), max_per_base):
+                package.append((base+i, data[i:i+max_per_base].tolist()))
                 pass
-            package.append((base,data))
             pass
         return package
     #f write_mif
@@ -167,11 +657,9 @@ class c_dump(object):
             print >>f, "#%8x:%s"%(self.labels[l],l)
             pass
 
-        addresses = self.data.keys()
-        addresses.sort()
-        for a in addresses:
+        for (a, d) in self.data.iteritems():
             r = "%08x: "%a
-            r += "%08x" % self.data[a]
+            r += "%08x" % d
             if a in label_addresses_map:
                 r += " #"
                 for l in label_addresses_map[a]:
@@ -181,25 +669,97 @@ class c_dump(object):
             print >>f, r
             pass
         pass
+    #f image_words
+    def image_words(self, base_address=None, depth=None):
+        """
+        Return an array('I') of depth words from word address base_address
+        (default the lowest populated word, up to the highest), with
+        unpopulated words zero, and the base address used
+        """
+        regions = list(self.data.regions())
+        if base_address is None:
+            base_address = 0
+            if len(regions)>0: base_address = regions[0][0]
+            pass
+        if depth is None:
+            depth = 0
+            if len(regions)>0: depth = max(0, regions[-1][0]+len(regions[-1][1])-base_address)
+            pass
+        words = array.array('I', [0])*depth
+        for (base, data) in regions:
+            start = max(base, base_address)
+            end   = min(base+len(data), base_address+depth)
+            if start<end: words[start-base_address:end-base_address] = data[start-base:end-base]
+            pass
+        return (base_address, words)
+    #f write_sram_image
+    def write_sram_image(self, f, base_address=None, depth=None):
+        """
+        Write a binary SRAM image of 32-bit words, from word address
+        base_address for depth words (as for image_words)
+        """
+        (base_address, words) = self.image_words(base_address, depth)
+        write_sram_image(f, 32, base_address, words)
+        pass
+    #f write_bin
+    def write_bin(self, f, base_address=None, size=None):
+        """
+        Write a raw binary file of the memory from byte address base_address
+        for size bytes (default from the lowest populated word to the highest),
+        with unpopulated words zero
+        """
+        depth = None
+        if base_address is not None: base_address = base_address/4
+        if size is not None: depth = (size+3)/4
+        (base_address, words) = self.image_words(base_address, depth)
+        if sys.byteorder=="big": words.byteswap()
+        for i in range(0, len(words), 1<<18):
+            f.write(words[i:i+(1<<18)].tostring())
+            pass
+        pass
+    #f write_ihex
+    def write_ihex(self, f, bytes_per_record=16):
+        """
+        Write an Intel HEX file of the populated words, with extended linear
+        address records as required; records do not cross 64kB boundaries
+        """
+        upper = 0
+        for (base, data) in self.data.regions():
+            if sys.byteorder=="big":
+                data = array.array('I', data)
+                data.byteswap()
+                pass
+            data = data.tostring()
+            address = base*4
+            n = 0
+            while n<len(data):
+                if (address>>16)!=upper:
+                    upper = address>>16
+                    f.write(ihex_record(4, 0, struct.pack(">H", upper)))
+                    pass
+                count = min(len(data)-n, 0x10000-(address&0xffff))
+                write_ihex_data(f, address&0xffff, data[n:n+count], bytes_per_record)
+                address += count
+                n += count
+                pass
+            pass
+        f.write(ihex_record(1, 0, ""))
+        pass
     #f write_mem
     def write_mem(self, f):
         fmt = "%08x"
-        addresses = self.data.keys()
-        addresses.sort()
-        for a in addresses:
+        for (a, d) in self.data.iteritems():
             r = "@%08x "%a
-            r += fmt % self.data[a]
+            r += fmt % d
             print >>f, r
             pass
         pass
     #f write_c_data
     def write_c_data(self, f):
         print >>f, "static uint32_t data[] = {"
-        addresses = self.data.keys()
-        addresses.sort()
         r = ""
-        for a in addresses:
-            r += " %d, 0x%08x,"%(a,self.data[a])
+        for (a, d) in self.data.iteritems():
+            r += " %d, 0x%08x,"%(a,d)
             if (len(r)>50):
                 print >>f, r
                 r = ""
@@ -211,6 +771,128 @@ class c_dump(object):
         pass
     #f All done
     pass
+#c c_mif_cache
+class c_mif_cache(object):
+    """
+    Persistent on-disk cache of MIF files written from images
+
+    Entries are named by a hash of the source image, its extension (which
+    selects its loader), the loader version and the parameters it is
+    loaded with, and are written under a temporary name and renamed in
+    to place, so concurrent processes can share a cache directory. A hit
+    touches its entry; the least recently used entries beyond the size
+    limit are evicted when an entry is stored, except for those used within
+    the last min_age seconds (which a simulation may be about to read).
+    """
+    version = 1
+    #f __init__
+    def __init__(self, directory, max_bytes=256<<20, min_age=300):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        pass
+    #f key
+    def key(self, filename, *parameters):
+        """
+        Return the cache key of an image file loaded with the given parameters
+        """
+        h = hashlib.sha1()
+        h.update(repr((self.version, loader_version, os.path.splitext(filename)[1].lower())+parameters))
+        f = open(filename, "rb")
+        while True:
+            data = f.read(1<<20)
+            if len(data)==0: break
+            h.update(data)
+            pass
+        f.close()
+        return h.hexdigest()
+    #f filename
+    def filename(self, key):
+        return os.path.join(self.directory, key+".mif")
+    #f lookup
+    def lookup(self, key):
+        """
+        Return the filename of the MIF cached for a key, or None if there is none
+        """
+        filename = self.filename(key)
+        try:
+            os.utime(filename, None)
+            pass
+        except OSError:
+            return None
+        return filename
+    #f store
+    def store(self, key, dump):
+        """
+        Write the MIF of a dump to the cache, returning its filename
+        """
+        try:
+            os.makedirs(self.directory)
+            pass
+        except OSError:
+            if not os.path.isdir(self.directory): raise
+            pass
+        (fd, temp_filename) = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=".tmp")
+        try:
+            f = os.fdopen(fd, "w")
+            dump.write_mif(f)
+            f.close()
+            os.rename(temp_filename, self.filename(key))
+            pass
+        except:
+            os.unlink(temp_filename)
+            raise
+        self.evict()
+        return self.filename(key)
+    #f evict
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is within its size limit
+        """
+        entries = []
+        for f in os.listdir(self.directory):
+            if not f.endswith(".mif"): continue
+            filename = os.path.join(self.directory, f)
+            try:
+                stat = os.stat(filename)
+                pass
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+            pass
+        entries.sort()
+        total = sum([e[1] for e in entries])
+        now = time.time()
+        for (mtime, size, filename) in entries:
+            if total<=self.max_bytes: break
+            if now-mtime<self.min_age: break
+            try:
+                os.unlink(filename)
+                pass
+            except OSError:
+                pass
+            total -= size
+            pass
+        pass
+    pass
+
+#a File formats by extension
+file_loaders = {".dump":c_dump.load,
+                ".mif":c_dump.load_mif,
+                ".elf":c_dump.load_elf,
+                ".hex":c_dump.load_ihex,
+                ".ihex":c_dump.load_ihex,
+                ".bin":c_dump.load_bin,
+                }
+file_writers = {".mif":c_dump.write_mif,
+                ".mem":c_dump.write_mem,
+                ".c":c_dump.write_c_data,
+                ".sram":c_dump.write_sram_image,
+                ".hex":c_dump.write_ihex,
+                ".ihex":c_dump.write_ihex,
+                ".bin":c_dump.write_bin,
+                }
+
 #a Useful invocation function
 def get_define_int(defines, k, default):
     if k in defines:
@@ -223,7 +905,7 @@ def file_write(filename, fn):
         fn(sys.stdout)
         pass
     else:
-        f = open(filename,"w")
+        f = open(filename,"wb")
         fn(f)
         f.close()
         pass
@@ -233,7 +915,7 @@ def file_read(filename, args, fn):
     must_close = False
     f = sys.stdin
     if filename!='-':
-        f = open(filename,"r")
+        f = open(filename,"rb")
         must_close = True
         pass
     mem = c_dump()
@@ -243,7 +925,7 @@ def file_read(filename, args, fn):
         pass
     return mem
 
-def dump_main(dump=None, allow_load=True, description='Generate MEM, MIF or C data of memory'):
+def dump_main(dump=None, allow_load=True, description='Generate MEM, MIF, C data, Intel HEX or binary of memory'):
     import argparse, sys, re
     parser = argparse.ArgumentParser(description=description)
     parser.add_argument('--mif', type=str, default=None,
@@ -252,6 +934,14 @@ def dump_main(dump=None, allow_load=True, description='Generate MEM, MIF or C da
                     help='Output READMEMH filename')
     parser.add_argument('--c_data', type=str, default=None,
                     help='Output C data filename')
+    parser.add_argument('--sram_image', type=str, default=None,
+                    help='Output binary SRAM image filename')
+    parser.add_argument('--ihex', type=str, default=None,
+                    help='Output Intel HEX filename')
+    parser.add_argument('--bin', type=str, default=None,
+                    help='Output raw binary filename')
+    parser.add_argument('--output', type=str, action='append', default=[],
+                    help='Output filename, of a format given by its extension (%s)'%(", ".join(sorted(file_writers.keys()))))
     if allow_load:
         parser.add_argument('--load_mif', type=str, default=None,
                             help='MIF file to load')
@@ -259,22 +949,55 @@ def dump_main(dump=None, allow_load=True, description='Generate MEM, MIF or C da
                             help='ELF file to load')
         parser.add_argument('--load_dump', type=str, default=None,
                             help='Dump file to load')
+        parser.add_argument('--load_ihex', type=str, default=None,
+                            help='Intel HEX file to load')
+        parser.add_argument('--load_bin', type=str, default=None,
+                            help='Raw binary file to load, at the base address')
+        parser.add_argument('--load', type=str, default=None,
+                            help='File to load, of a format given by its extension (%s; dump otherwise)'%(", ".join(sorted(file_loaders.keys()))))
+        parser.add_argument('--base_address', type=lambda x:int(x,0), default=0,
+                            help='Base address subtracted from the addresses of loaded data (and the address of a raw binary)')
+        parser.add_argument('--address_mask', type=lambda x:int(x,0), default=0xffffffff,
+                            help='Mask applied to the addresses of loaded data')
     args = parser.parse_args()
-    if args.load_mif is not None:
-        dump = file_read(args.load_mif, args, c_dump.load_mif)
-        pass
-    if args.load_elf is not None:
-        dump = file_read(args.load_elf, args, c_dump.load_elf)
-        pass
-    if args.load_dump is not None:
-        dump = file_read(args.load_dump, args, c_dump.load_dump)
+    if allow_load:
+        load = lambda fn: (lambda mem, f: fn(mem, f, args.base_address, args.address_mask))
+        if args.load_mif is not None:
+            dump = file_read(args.load_mif, args, load(c_dump.load_mif))
+            pass
+        if args.load_elf is not None:
+            dump = file_read(args.load_elf, args, load(c_dump.load_elf))
+            pass
+        if args.load_dump is not None:
+            dump = file_read(args.load_dump, args, load(c_dump.load))
+            pass
+        if args.load_ihex is not None:
+            dump = file_read(args.load_ihex, args, load(c_dump.load_ihex))
+            pass
+        if args.load_bin is not None:
+            dump = file_read(args.load_bin, args, load(c_dump.load_bin))
+            pass
+        if args.load is not None:
+            dump = c_dump()
+            dump.load_file(args.load, args.base_address, args.address_mask)
+            pass
         pass
     if dump is None:
-        parse_args.print_help()
-        pass
+        parser.print_help()
+        return
     if args.mif    is not None: file_write(args.mif,    dump.write_mif)
     if args.mem    is not None: file_write(args.mem,    dump.write_mem)
     if args.c_data is not None: file_write(args.c_data, dump.write_c_data)
+    if args.sram_image is not None: file_write(args.sram_image, dump.write_sram_image)
+    if args.ihex   is not None: file_write(args.ihex,   dump.write_ihex)
+    if args.bin    is not None: file_write(args.bin,    dump.write_bin)
+    for filename in args.output:
+        extension = os.path.splitext(filename)[1].lower()
+        if extension not in file_writers:
+            parser.error("Unknown output format for '%s'"%filename)
+            pass
+        file_write(filename, lambda f: file_writers[extension](dump, f))
+        pass
     pass
 
 if __name__ == "__main__":
@@ -0,0 +1,447 @@
+#!/usr/bin/env python
+#a Documentation
+"""
+Functional (instruction-at-a-time) 6502 model
+
+c_6502_fast executes a whole instruction per step, using the same
+instruction set (and the same ALU/flag/destination micro-ops) as the
+cycle-accurate c_6502, and keeps the number of cycles the
+cycle-accurate model would have taken for each instruction (including
+the skipped cycle for indexed accesses that do not cross a page, and
+branch taken/page cross cycles).
+
+Handoff
+-------
+Both models are at an 'instruction boundary' when the cycle-accurate
+model has instr_cycle==0: the opcode of the instruction in hand has
+been fetched into IR, and PC is the address after the opcode. (Just
+after reset the instruction in hand is the reset pseudo-instruction.)
+
+load_from_cpu copies A, X, Y, SP, PC, PSR and the instruction in hand
+from a c_6502 at an instruction boundary; store_to_cpu copies them
+back, and sets ADL/ADH to the address of the last opcode fetch as the
+cycle-accurate model would have. DL is left untouched, as every
+addressing mode loads DL in its first cycle before using it.
+
+The functional model does not perform the dummy reads the
+cycle-accurate model makes (e.g. of the byte after an implied
+instruction), so devices with read side effects may see fewer reads.
+"""
+
+#a Imports
+from instr6502 import c_6502_instruction_set, c65am_reset, c65am_acc, c65am_imm
+from instr6502 import c65am_imp_incdec, c65am_imp_flag, c65am_imp_transfer, c65am_imp_push, c65am_imp_pull
+from instr6502 import c65am_abs_jmp, c65am_ind_jmp, c65am_abs_jsr, c65am_imp_rts, c65am_bcc
+from instr6502 import c65am_zp_in, c65am_zp_out, c65am_zp_rw, c65am_zx_in, c65am_zx_out, c65am_zx_rw, c65am_zy_in, c65am_zy_out
+from instr6502 import c65am_abs_in, c65am_abs_out, c65am_abs_rw, c65am_absx_in, c65am_absx_out, c65am_absx_rw, c65am_absy_in, c65am_absy_out
+from instr6502 import c65am_indx_in, c65am_indx_out, c65am_indx_rw, c65am_indy_in, c65am_indy_out, c65am_indy_rw
+from model6502 import c_6502_microcode
+from model6502 import IDB_NONE, IDB_ZERO, IDB_ACC, IDB_X, IDB_Y, IDB_SP, IDB_FLAGS
+from model6502 import SHIFT_NONE, SHIFT_INC, SHIFT_DEC, SHIFT_LSR, SHIFT_ROR, SHIFT_ASL, SHIFT_ROL
+from model6502 import ALU_NONE, ALU_SRC, ALU_ADD, ALU_SBC, ALU_CMP, ALU_AND, ALU_OR, ALU_EOR, ALU_BIT
+from model6502 import CARRY_PSR, CARRY_0, MEM_WRITE, FLAGS_NONE, FLAGS_ALU, FLAGS_SETCLR
+from model6502 import DEST_NONE, DEST_ACC, DEST_X, DEST_Y, DEST_SP, DEST_FLAGS
+
+#a Functional instruction kinds
+# Kinds of instruction
+(K_IN, K_OUT, K_RW, K_SRC, K_IMP, K_PUSH, K_PULL, K_JMP, K_JMP_IND,
+ K_JSR, K_RTS, K_BRANCH, K_RESET) = range(13)
+# Addressing of operands for K_IN, K_OUT and K_RW
+F_IMM, F_ZP, F_ZI, F_ABS, F_ABSI, F_INDX, F_INDY = range(7)
+
+#c c_6502_fast
+class c_6502_fast(object):
+    """
+    Functional 6502 sharing a c_memory with a system
+    """
+    am_kinds = { c65am_reset:(K_RESET, None),
+                 c65am_acc:(K_SRC, None),
+                 c65am_imp_incdec:(K_SRC, None),
+                 c65am_imp_flag:(K_IMP, None),
+                 c65am_imp_transfer:(K_IMP, None),
+                 c65am_imp_push:(K_PUSH, None),
+                 c65am_imp_pull:(K_PULL, None),
+                 c65am_abs_jmp:(K_JMP, None),
+                 c65am_ind_jmp:(K_JMP_IND, None),
+                 c65am_abs_jsr:(K_JSR, None),
+                 c65am_imp_rts:(K_RTS, None),
+                 c65am_bcc:(K_BRANCH, None),
+                 c65am_imm:(K_IN, F_IMM),
+                 c65am_zp_in:(K_IN, F_ZP),
+                 c65am_zp_out:(K_OUT, F_ZP),
+                 c65am_zp_rw:(K_RW, F_ZP),
+                 c65am_zx_in:(K_IN, F_ZI),
+                 c65am_zx_out:(K_OUT, F_ZI),
+                 c65am_zx_rw:(K_RW, F_ZI),
+                 c65am_zy_in:(K_IN, F_ZI),
+                 c65am_zy_out:(K_OUT, F_ZI),
+                 c65am_abs_in:(K_IN, F_ABS),
+                 c65am_abs_out:(K_OUT, F_ABS),
+                 c65am_abs_rw:(K_RW, F_ABS),
+                 c65am_absx_in:(K_IN, F_ABSI),
+                 c65am_absx_out:(K_OUT, F_ABSI),
+                 c65am_absx_rw:(K_RW, F_ABSI),
+                 c65am_absy_in:(K_IN, F_ABSI),
+                 c65am_absy_out:(K_OUT, F_ABSI),
+                 c65am_indx_in:(K_IN, F_INDX),
+                 c65am_indx_out:(K_OUT, F_INDX),
+                 c65am_indx_rw:(K_RW, F_INDX),
+                 c65am_indy_in:(K_IN, F_INDY),
+                 c65am_indy_out:(K_OUT, F_INDY),
+                 c65am_indy_rw:(K_RW, F_INDY),
+                 }
+    compiled = {}
+    #f compile_instruction
+    @classmethod
+    def compile_instruction(cls, instr, am, uops):
+        """
+        Compile an instruction to a tuple of
+        (kind, addressing, index, src, shift_op, alu_op, carry_in, flags_op, flag, dest, cycles, skip, condition)
+
+        The ALU operation, flags and destination are taken from the
+        micro-op of the cycle-accurate model that writes the
+        destination; the source of a store is that of the micro-op
+        that writes memory.
+        """
+        if am not in cls.am_kinds:
+            raise Exception("Addressing mode %s not supported by fast model"%am.__name__)
+        (kind, addressing) = cls.am_kinds[am]
+        index = {"x":IDB_X, "y":IDB_Y}[am.index]
+        (src, shift_op, alu_op, carry_in, flags_op, flag, dest) = (IDB_NONE, SHIFT_NONE, ALU_NONE, CARRY_PSR, FLAGS_NONE, None, DEST_NONE)
+        for uop in uops:
+            (idb_a, idb_b, idb_c, u_shift_op, u_alu_op, u_carry_in,
+             mem_op, mem_low, mem_high, adl_op, pc_op, sp_op, dl_op,
+             u_flags_op, u_flag, u_dest, seq_op, seq_arg, seq_flag, seq_value, cycle) = uop
+            if cycle.write_dest:
+                (src, shift_op, alu_op, carry_in, flags_op, dest) = (idb_a, u_shift_op, u_alu_op, u_carry_in, u_flags_op, u_dest)
+                if flags_op==FLAGS_SETCLR: flag = instr.flag
+                pass
+            if (mem_op==MEM_WRITE) and (kind in (K_OUT, K_PUSH)):
+                src = idb_a
+                pass
+            pass
+        if (kind==K_IMP) and (alu_op!=ALU_SRC):
+            raise Exception("Implied instruction %s must use the source ALU op"%instr.mnemonic)
+        skip = (am.skip_if is not None)
+        condition = instr.condition
+        return (kind, addressing, index, src, shift_op, alu_op, carry_in, flags_op, flag, dest,
+                len(am.cycles), skip, condition)
+    #f of_microcode
+    @classmethod
+    def of_microcode(cls, microcode):
+        """
+        Return the (cached) decode table of 256 entries (None if undecodable) and the reset entry
+        """
+        if microcode not in cls.compiled:
+            decodes = [None]*256
+            for opcode in range(256):
+                if microcode.decodes[opcode] is not None:
+                    decodes[opcode] = cls.compile_instruction(*microcode.decodes[opcode])
+                    pass
+                pass
+            cls.compiled[microcode] = (decodes, cls.compile_instruction(*microcode.reset))
+            pass
+        return cls.compiled[microcode]
+    #f __init__
+    def __init__(self, memory, microcode=None):
+        if microcode is None:
+            microcode = c_6502_microcode.of_instruction_set(c_6502_instruction_set())
+            pass
+        (self.decodes, self.reset_decode) = self.of_microcode(microcode)
+        self.memory = memory
+        self.a = 0
+        self.x = 0
+        self.y = 0
+        self.sp = 0
+        self.pc = 0
+        (self.n, self.v, self.b, self.d, self.i, self.z, self.c) = (0,0,0,0,0,0,0)
+        self.ir = 0
+        self.cycles = 0
+        self.reset()
+        pass
+    #f reset
+    def reset(self):
+        self.decode = self.reset_decode
+        pass
+    #f get_flags
+    def get_flags(self):
+        return ( (self.n<<7) | (self.v<<6) | (self.b<<4) | (self.d<<3) |
+                 (self.i<<2) | (self.z<<1) | (self.c<<0) )
+    #f set_flags
+    def set_flags(self, flags):
+        self.n = (flags>>7)&1
+        self.v = (flags>>6)&1
+        self.b = (flags>>4)&1
+        self.d = (flags>>3)&1
+        self.i = (flags>>2)&1
+        self.z = (flags>>1)&1
+        self.c = (flags>>0)&1
+        pass
+    #f get_reg
+    def get_reg(self, src):
+        if src==IDB_ACC:   return self.a
+        if src==IDB_X:     return self.x
+        if src==IDB_Y:     return self.y
+        if src==IDB_SP:    return self.sp
+        if src==IDB_FLAGS: return self.get_flags()
+        if src==IDB_ZERO:  return 0
+        return 0xff
+    #f set_dest
+    def set_dest(self, dest, value):
+        if dest==DEST_ACC:     self.a = value
+        elif dest==DEST_X:     self.x = value
+        elif dest==DEST_Y:     self.y = value
+        elif dest==DEST_SP:    self.sp = value
+        elif dest==DEST_FLAGS: self.set_flags(value)
+        pass
+    #f alu
+    def alu(self, decode, a, b):
+        """
+        Perform the ALU operation of an instruction, setting flags and destination
+
+        This matches c_6502.alu and the flag/destination writes of c_6502.tick_end
+        """
+        (kind, addressing, index, src, shift_op, alu_op, carry_in, flags_op, flag, dest) = decode[:10]
+        if carry_in==CARRY_PSR: carry_in = self.c
+        elif carry_in==CARRY_0: carry_in = 0
+        else:                   carry_in = 1
+        carry = carry_in
+        if shift_op==SHIFT_NONE: pass
+        elif shift_op==SHIFT_INC: b = (b+1)&0xff
+        elif shift_op==SHIFT_DEC: b = (b-1)&0xff
+        elif shift_op==SHIFT_LSR: (carry, b) = (b&1, b>>1)
+        elif shift_op==SHIFT_ROR: (carry, b) = (b&1, (b>>1)|(carry_in<<7))
+        elif shift_op==SHIFT_ASL: (carry, b) = ((b>>7)&1, (b<<1)&0xff)
+        elif shift_op==SHIFT_ROL: (carry, b) = ((b>>7)&1, ((b<<1)|carry_in)&0xff)
+        v = self.v
+        if alu_op==ALU_NONE:  value = b
+        elif alu_op==ALU_SRC: value = a
+        elif alu_op==ALU_AND: value = a&b
+        elif alu_op==ALU_OR:  value = a|b
+        elif alu_op==ALU_EOR: value = a^b
+        elif alu_op==ALU_BIT:
+            value = a
+            if flags_op==FLAGS_ALU:
+                self.z = int((a&b)==0)
+                self.n = (b>>7)&1
+                self.c = carry
+                self.v = (b>>6)&1
+                pass
+            self.set_dest(dest, value)
+            return value
+        else:
+            if alu_op in (ALU_SBC, ALU_CMP): b = b^0xff
+            if alu_op==ALU_ADD: carry_in = 0
+            value = a+b+carry_in
+            carry = (value>>8)&1
+            value = value&0xff
+            if alu_op!=ALU_CMP:
+                v = int((((a^value)&(b^value))&0x80)!=0)
+                pass
+            pass
+        if flags_op==FLAGS_ALU:
+            self.z = int(value==0)
+            self.n = (value>>7)&1
+            self.c = carry
+            self.v = v
+            pass
+        elif flags_op==FLAGS_SETCLR:
+            setattr(self, flag, value&1)
+            pass
+        self.set_dest(dest, value)
+        return value
+    #f operand_address
+    def operand_address(self, addressing, index):
+        """
+        Read the operand bytes of an instruction and return (address, page_crossed)
+        """
+        read = self.memory.read
+        pc = self.pc
+        if addressing==F_ZP:
+            self.pc = (pc+1)&0xffff
+            return (read(pc), False)
+        if addressing==F_ABS:
+            self.pc = (pc+2)&0xffff
+            return (read(pc) | (read((pc+1)&0xffff)<<8), False)
+        if addressing==F_ZI:
+            self.pc = (pc+1)&0xffff
+            return ((read(pc)+self.get_reg(index))&0xff, False)
+        if addressing==F_ABSI:
+            self.pc = (pc+2)&0xffff
+            low = read(pc)+self.get_reg(index)
+            address = ((read((pc+1)&0xffff)<<8)+low)&0xffff
+            return (address, low>=0x100)
+        if addressing==F_INDX:
+            self.pc = (pc+1)&0xffff
+            zp = (read(pc)+self.x)&0xff
+            return (read(zp) | (read((zp+1)&0xff)<<8), False)
+        # F_INDY
+        self.pc = (pc+1)&0xffff
+        zp = read(pc)
+        low = read(zp)+self.y
+        address = ((read((zp+1)&0xff)<<8)+low)&0xffff
+        return (address, low>=0x100)
+    #f push
+    def push(self, data):
+        self.memory.write(0x100|self.sp, data)
+        self.sp = (self.sp-1)&0xff
+        pass
+    #f pull
+    def pull(self):
+        self.sp = (self.sp+1)&0xff
+        return self.memory.read(0x100|self.sp)
+    #f step
+    def step(self):
+        """
+        Execute the instruction in hand, fetch the next opcode, and return the cycles taken
+        """
+        decode = self.decode
+        if decode is None:
+            raise Exception("Could not find encoding for %02x at %04x"%(self.ir, (self.pc-1)&0xffff))
+        kind = decode[0]
+        cycles = decode[10]
+        memory = self.memory
+        if kind==K_IN:
+            addressing = decode[1]
+            if addressing==F_IMM:
+                b = memory.read(self.pc)
+                self.pc = (self.pc+1)&0xffff
+                pass
+            else:
+                (address, page_crossed) = self.operand_address(addressing, decode[2])
+                if decode[11] and not page_crossed: cycles -= 1
+                b = memory.read(address)
+                pass
+            self.alu(decode, self.get_reg(decode[3]), b)
+            pass
+        elif kind==K_OUT:
+            (address, page_crossed) = self.operand_address(decode[1], decode[2])
+            if decode[11] and not page_crossed: cycles -= 1
+            memory.write(address, self.get_reg(decode[3]))
+            pass
+        elif kind==K_RW:
+            (address, page_crossed) = self.operand_address(decode[1], decode[2])
+            if decode[11] and not page_crossed: cycles -= 1
+            value = self.alu(decode, self.get_reg(decode[3]), memory.read(address))
+            memory.write(address, value)
+            pass
+        elif kind==K_SRC:
+            src = self.get_reg(decode[3])
+            self.alu(decode, src, src)
+            pass
+        elif kind==K_IMP:
+            self.alu(decode, self.get_reg(decode[3]), 0xff)
+            pass
+        elif kind==K_BRANCH:
+            offset = memory.read(self.pc)
+            pc = (self.pc+1)&0xffff
+            (flag, value) = decode[12]
+            if getattr(self, flag)!=value:
+                cycles = 2
+                pass
+            else:
+                if offset&0x80: offset -= 256
+                target = (pc+offset)&0xffff
+                if (target^pc)&0xff00: cycles = 4
+                else:                  cycles = 3
+                pc = target
+                pass
+            self.pc = pc
+            pass
+        elif kind==K_JMP:
+            self.pc = memory.read(self.pc) | (memory.read((self.pc+1)&0xffff)<<8)
+            pass
+        elif kind==K_JMP_IND:
+            pointer = memory.read(self.pc) | (memory.read((self.pc+1)&0xffff)<<8)
+            self.pc = memory.read(pointer) | (memory.read((pointer+1)&0xffff)<<8)
+            pass
+        elif kind==K_JSR:
+            low = memory.read(self.pc)
+            pc = (self.pc+1)&0xffff
+            self.push(pc>>8)
+            self.push(pc&0xff)
+            self.pc = low | (memory.read(pc)<<8)
+            pass
+        elif kind==K_RTS:
+            low = self.pull()
+            self.pc = ((low | (self.pull()<<8))+1)&0xffff
+            pass
+        elif kind==K_PUSH:
+            self.push(self.get_reg(decode[3]))
+            pass
+        elif kind==K_PULL:
+            self.alu(decode, 0xff, self.pull())
+            pass
+        elif kind==K_RESET:
+            self.pc = memory.read(0xfffc) | (memory.read(0xfffd)<<8)
+            pass
+        self.ir = memory.read(self.pc)
+        self.pc = (self.pc+1)&0xffff
+        self.decode = self.decodes[self.ir]
+        self.cycles += cycles
+        return cycles
+    #f run
+    def run(self, num_instructions=None, num_cycles=None):
+        """
+        Run for num_instructions or until at least num_cycles have elapsed (whichever is first)
+
+        Returns (instructions, cycles) executed
+        """
+        instructions = 0
+        cycles = 0
+        while True:
+            if (num_instructions is not None) and (instructions>=num_instructions): break
+            if (num_cycles is not None) and (cycles>=num_cycles): break
+            cycles += self.step()
+            instructions += 1
+            pass
+        return (instructions, cycles)
+    #f load_from_cpu
+    def load_from_cpu(self, cpu):
+        """
+        Take the architectural state from a cycle-accurate c_6502 at an instruction boundary
+        """
+        if cpu.instr_cycle!=0:
+            raise Exception("Cycle-accurate CPU is not at an instruction boundary (cycle %d)"%cpu.instr_cycle)
+        self.a  = cpu.acc.get()
+        self.x  = cpu.x.get()
+        self.y  = cpu.y.get()
+        self.sp = cpu.sp.get()
+        self.pc = cpu.pcl.get() | (cpu.pch.get()<<8)
+        self.ir = cpu.ir.get()
+        self.set_flags(cpu.get_flags())
+        if cpu.instr[1] is c65am_reset:
+            self.decode = self.reset_decode
+            pass
+        else:
+            self.decode = self.decodes[self.ir]
+            pass
+        pass
+    #f store_to_cpu
+    def store_to_cpu(self, cpu):
+        """
+        Set the state of a cycle-accurate c_6502 so that it continues from this instruction boundary
+        """
+        cpu.acc.set(self.a)
+        cpu.x.set(self.x)
+        cpu.y.set(self.y)
+        cpu.sp.set(self.sp)
+        cpu.pcl.set(self.pc&0xff)
+        cpu.pch.set(self.pc>>8)
+        fetch_address = (self.pc-1)&0xffff
+        cpu.adl.set(fetch_address&0xff)
+        cpu.adh.set(fetch_address>>8)
+        cpu.set_flags(self.get_flags())
+        cpu.ir.set(self.ir)
+        if self.decode is self.reset_decode:
+            cpu.reset()
+            pass
+        else:
+            cpu.decode(self.ir)
+            cpu.instr_cycle = 0
+            pass
+        pass
+    #f __str__
+    def __str__(self):
+        return "A:%02x X:%02x Y:%02x SP:%02x PC:%04x IR:%02x PSR:%02x"%(self.a, self.x, self.y, self.sp, self.pc, self.ir, self.get_flags())
+    pass
@@ -84,19 +84,9 @@ class hps_remote_socket:
         pass
 
     def send_dump(self, image):
-        addresses = image.data.keys()
-        addresses.sort()
-        while len(addresses)>0:
-            base = addresses[0]
-            data = []
-            i = base
-            while (len(addresses)>0) and (i==addresses[0]):
-                data.append(image.data[i])
-                addresses.pop(0)
-                i += 1
-                pass
+        for (base, data) in image.data.regions():
             print "Sending sram from base %d length %d"%(base, len(data))
-            self.send_sram_data(4, base, data)
+            self.send_sram_data(4, base, data.tolist())
             pass
         self.get_responses()
         pass
@@ -1453,12 +1453,19 @@ class c_instruction_set(object):
     def __init__(self):
         self.decodings = {}
         self.mnemonics = {}
+        self.matchers = {}
+        compiled_res = {}
         for ie in self.encodings:
-            self.mnemonics[ie.instruction.mnemonic.lower()] = ie
+            mnemonic = ie.instruction.mnemonic.lower()
+            self.mnemonics[mnemonic] = ie
+            matchers = []
             for (e,am) in ie.encodings:
                 if e in self.decodings: raise Exception("Duplicate instruction encoding %s"%(str((e,ie,ie.instruction,am))))
                 self.decodings[e] = (ie.instruction, am)
+                if am.assembler_re not in compiled_res: compiled_res[am.assembler_re] = re.compile(am.assembler_re)
+                matchers.insert(0, (compiled_res[am.assembler_re], am, e))
                 pass
+            self.matchers[mnemonic] = (ie, matchers)
             pass
         pass
     def decode(self, encoding):
@@ -1467,15 +1474,24 @@ class c_instruction_set(object):
         print "Could not find encoding for %02x"%encoding
         return (None, None)
     def find_ie_of_mnemonic(self, mnemonic, addressing):
+        """
+        Find the addressing modes of a mnemonic that match the addressing text
+
+        Returns None or (ie, [(am, opcode, operand text)...])
+        """
         mnemonic = mnemonic.lower()
+        if mnemonic not in self.matchers: return None
         addressing = addressing.strip()
-        if mnemonic not in self.mnemonics: return None
-        ie = self.mnemonics[mnemonic]
+        (ie, matchers) = self.matchers[mnemonic]
         ams = []
-        for (e,am) in ie.encodings:
-            m = re.match(am.assembler_re, addressing)
+        matches = {}
+        for (regex, am, opcode) in matchers:
+            if regex not in matches: matches[regex] = regex.match(addressing)
+            m = matches[regex]
             if m is not None:
-                ams.insert(0,am)
+                operand = None
+                if am.bytes>1: operand = m.group(1)
+                ams.append((am, opcode, operand))
                 pass
             pass
         if len(ams)==0:
@@ -1486,19 +1502,21 @@ class c_instruction_set(object):
             if enc[1]==am: return enc[0]
             pass
         return None
-    def assemble(self, addressing, ie, scope, asm_pass):
+    def assemble(self, addressing, ie, scope, asm_pass, length=None):
         """Return tuple of Nones or opcodes
+
+        If length is given then only an assembly of that length is
+        permitted; this is used to resolve forward references once
+        the layout of the code has been fixed
         """
         (ie, ams) = ie
         assembly_options = []
-        for am in ams:
-            opcode = self.encoding_of(ie,am)
-            addressing = addressing.strip()
-            m = re.match(am.assembler_re, addressing)
-            if m is None: raise Exception("Bug - matching twice with same data got two different answers")
-            operand = None
+        evaluated = {}
+        for (am, opcode, operand) in ams:
             if am.bytes>1:
-                operand = scope.evaluate(m.group(1), am.operand_relative)
+                key = (operand, am.operand_relative)
+                if key not in evaluated: evaluated[key] = scope.evaluate(operand, am.operand_relative)
+                operand = evaluated[key]
                 pass
             if am.bytes==1:
                 assembly_options = (((opcode,),))
@@ -1525,6 +1543,7 @@ class c_instruction_set(object):
         assembly = None
         for ao in assembly_options:
             #print assembly_options
+            if (length is not None) and (len(ao)!=length): continue
             if (asm_pass>=1) or (None not in ao):
                 if None in ao: raise Exception("Failed to resolve addressing %s %s"%(ie.instruction.mnemonic, addressing))
                 if assembly is None:
@@ -1543,6 +1562,8 @@ class c_instruction_set(object):
                     pass
                 pass
             pass
+        if assembly is None:
+            raise Exception("Failed to assemble %s %s in %d bytes"%(ie.instruction.mnemonic, addressing, length))
         return assembly
     pass
 
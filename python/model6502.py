@@ -1,76 +1,341 @@
 #!/usr/bin/env python
 #a Imports
 from instr6502 import c65i_reset, c65am_reset, c_6502_instruction_set
+import array
+import json
 import unittest
 
+#a Register file
+# The CPU registers are held in a single array of bytes. The internal
+# data bus sources and the address sources used by the micro-ops (see
+# below) are indices into this array, so that a bus or address source
+# is read directly from the register file; the constant sources (zero,
+# ones, one) are entries that are never written. R_ALU and R_ALU_B hold
+# the result of the last ALU operation and its shifted B input, and
+# R_DATA the data input of the current cycle.
+(R_NONE, R_ZERO, R_ONES, R_ACC, R_X, R_Y, R_SP, R_FLAGS, R_DL,
+ R_PCL, R_PCH, R_ALU, R_DATA, R_ADL, R_ADH, R_IR, R_ONE, R_ALU_B) = range(18)
+R_COUNT = 18
+# Flag bits of R_FLAGS; bit 5 is never set in the register file
+PSR_C, PSR_Z, PSR_I, PSR_D, PSR_B, PSR_V, PSR_N = 0x01, 0x02, 0x04, 0x08, 0x10, 0x40, 0x80
+psr_bits = {"c":PSR_C, "z":PSR_Z, "i":PSR_I, "d":PSR_D, "b":PSR_B, "v":PSR_V, "n":PSR_N}
+
+#f new_register_file
+def new_register_file():
+    """
+    Create a register file with all registers zero and the constant sources set
+    """
+    registers = array.array('B', [0]*R_COUNT)
+    registers[R_NONE] = 0xff
+    registers[R_ONES] = 0xff
+    registers[R_ONE]  = 1
+    return registers
+
 #a Register classes
 #c c_6502_register
 class c_6502_register(object):
+    """
+    View of one register in a register file
+    """
+    __slots__ = ("registers",)
     name = "BITS??"
     formats = {8:"%s:%02x"}
     width = 8
-    def __init__(self):
-        self.value = 0
+    index = R_NONE
+    def __init__(self, registers=None):
+        if registers is None: registers = new_register_file()
+        self.registers = registers
         pass
     def set(self, value):
-        self.value = value
+        self.registers[self.index] = value
         pass
     def get(self):
-        return self.value
+        return self.registers[self.index]
+    value = property(get, set)
     def idle(self, din):
         return din
     def __str__(self):
-        return self.formats[self.width] % (self.name, self.value)
+        return self.formats[self.width] % (self.name, self.registers[self.index])
     pass
 
 #c c65r_index_x
 class c65r_index_x(c_6502_register):
+    __slots__ = ()
     name = "X"
+    index = R_X
     pass
 
 #c c65r_index_y
 class c65r_index_y(c_6502_register):
+    __slots__ = ()
     name = "Y"
+    index = R_Y
     pass
 
 #c c65r_accumulator
 class c65r_accumulator(c_6502_register):
+    __slots__ = ()
     name = "A"
+    index = R_ACC
     pass
 
 #c c65r_pcl
 class c65r_pcl(c_6502_register):
+    __slots__ = ()
     name = "PCL"
+    index = R_PCL
     pass
 
 #c c65r_pch
 class c65r_pch(c_6502_register):
+    __slots__ = ()
     name = "PCH"
+    index = R_PCH
     pass
 
 #c c65r_sp
 class c65r_sp(c_6502_register):
+    __slots__ = ()
     name = "SP"
+    index = R_SP
     pass
 
 #c c65r_ir
 class c65r_ir(c_6502_register):
+    __slots__ = ()
     name = "IR"
+    index = R_IR
     pass
 
 #c c65r_dl
 class c65r_dl(c_6502_register):
+    __slots__ = ()
     name = "DL"
+    index = R_DL
     pass
 
 #c c65r_adl
 class c65r_adl(c_6502_register):
+    __slots__ = ()
     name = "ADL"
+    index = R_ADL
     pass
 
 #c c65r_adh
 class c65r_adh(c_6502_register):
+    __slots__ = ()
     name = "ADH"
+    index = R_ADH
+    pass
+
+#c c65r_psr
+class c65r_psr(object):
+    """
+    View of the flags in a register file as a mapping from flag name to 0/1
+    """
+    __slots__ = ("registers",)
+    def __init__(self, registers):
+        self.registers = registers
+        pass
+    def __getitem__(self, flag):
+        return (self.registers[R_FLAGS] & psr_bits[flag]) and 1
+    def __setitem__(self, flag, value):
+        flags = self.registers[R_FLAGS] & (0xff ^ psr_bits[flag])
+        if value: flags |= psr_bits[flag]
+        self.registers[R_FLAGS] = flags
+        pass
+    def keys(self):
+        return psr_bits.keys()
+    def as_dict(self):
+        return dict([(f, self[f]) for f in psr_bits])
+    def __str__(self):
+        return str(self.as_dict())
+    pass
+
+#a Micro-op encodings
+# The cycle classes in instr6502 describe each cycle with strings
+# (e.g. idb=("index","dl","alu")); c_6502_microcode flattens every
+# (instruction, addressing mode, cycle) into a tuple of the small
+# integers below, so that the per-cycle model dispatches on integers
+# and never consults the cycle classes.
+#
+# Internal data bus sources: index and src are resolved at compile
+# time to the actual register using the addressing mode/instruction;
+# each is the index of the source in the register file
+(IDB_NONE, IDB_ZERO, IDB_ONES, IDB_ACC, IDB_X, IDB_Y, IDB_SP,
+ IDB_FLAGS, IDB_DL, IDB_PCL, IDB_PCH, IDB_ALU, IDB_DATA) = (R_NONE, R_ZERO, R_ONES, R_ACC, R_X, R_Y, R_SP,
+                                                           R_FLAGS, R_DL, R_PCL, R_PCH, R_ALU, R_DATA)
+# Shift/increment operations applied to the ALU B input
+(SHIFT_NONE, SHIFT_INC, SHIFT_DEC, SHIFT_INCDEC,
+ SHIFT_LSR, SHIFT_ROR, SHIFT_ASL, SHIFT_ROL) = range(8)
+# ALU operations
+(ALU_NONE, ALU_SRC, ALU_ADC, ALU_ADD, ALU_SBC, ALU_CMP,
+ ALU_AND, ALU_OR, ALU_EOR, ALU_BIT) = range(10)
+# ALU carry in
+CARRY_PSR, CARRY_0, CARRY_1 = range(3)
+# Memory operations and address sources (register file indices)
+MEM_NONE, MEM_READ, MEM_WRITE = range(3)
+(ADDR_PCL, ADDR_PCH, ADDR_ADL, ADDR_ADH, ADDR_DL, ADDR_SP,
+ ADDR_ZERO, ADDR_ONE) = (R_PCL, R_PCH, R_ADL, R_ADH, R_DL, R_SP, R_ZERO, R_ONE)
+# ADL update after a memory operation
+ADL_ADDRESS, ADL_DL, ADL_ALU = range(3)
+# PC, SP and DL operations
+PC_NONE, PC_RESET, PC_DL_DATA, PC_PCL_DATA, PC_PCH_DATA, PC_INC = range(6)
+SP_NONE, SP_SHIFT = range(2)
+DL_NONE, DL_IDB = range(2)
+# Flag and destination writes (destinations are register file indices)
+FLAGS_NONE, FLAGS_ALU, FLAGS_SETCLR = range(3)
+DEST_NONE, DEST_ACC, DEST_X, DEST_Y, DEST_SP, DEST_FLAGS = (R_NONE, R_ACC, R_X, R_Y, R_SP, R_FLAGS)
+# Cycle sequencing
+SEQ_NEXT, SEQ_LAST, SEQ_CONDITION, SEQ_SKIP_CC, SEQ_SKIP_BCC = range(5)
+
+#a Micro-op compiler
+#c c_6502_microcode
+class c_6502_microcode(object):
+    """
+    Compiled micro-op tables for an instruction set
+
+    Each (instruction, addressing mode) is compiled to a tuple of
+    micro-ops, one per cycle; each micro-op is a tuple:
+
+    (idb_a, idb_b, idb_c, shift_op, alu_op, carry_in,
+     mem_op, mem_low, mem_high, adl_op, pc_op, sp_op, dl_op,
+     flags_op, flag, dest, seq_op, seq_arg, seq_flag, seq_value, cycle)
+
+    flag and seq_flag are PSR bit masks (PSR_C etc).
+
+    seq_op indicates what happens at the end of the cycle: SEQ_LAST
+    completes the instruction; SEQ_CONDITION moves to cycle seq_arg
+    if the seq_flag bit of the PSR is not seq_value; SEQ_SKIP_CC and
+    SEQ_SKIP_BCC skip the next cycle if the ALU carry (and, for BCC,
+    the sign of the offset) permit. The final element is the original cycle class, for
+    verbose output only.
+    """
+    compiled = {}
+    idb_a_srcs = {"zero":IDB_ZERO, "pcl":IDB_PCL, None:IDB_NONE}
+    idb_b_srcs = {"dl":IDB_DL, "pch":IDB_PCH, "sp":IDB_SP, None:IDB_NONE}
+    idb_c_srcs = {"alu":IDB_ALU, "data":IDB_DATA, "pcl":IDB_PCL, "pch":IDB_PCH, None:IDB_NONE}
+    reg_srcs   = {"acc":IDB_ACC, "s":IDB_SP, "x":IDB_X, "y":IDB_Y, "flags":IDB_FLAGS, "zero":IDB_ZERO, "ones":IDB_ONES}
+    shift_ops  = {None:SHIFT_NONE, "inc":SHIFT_INC, "dec":SHIFT_DEC, "incdec":SHIFT_INCDEC,
+                  "lsr":SHIFT_LSR, "ror":SHIFT_ROR, "asl":SHIFT_ASL, "rol":SHIFT_ROL}
+    alu_ops    = {None:ALU_NONE, "src":ALU_SRC, "adc":ALU_ADC, "add":ALU_ADD, "sbc":ALU_SBC,
+                  "cmp":ALU_CMP, "and":ALU_AND, "or":ALU_OR, "eor":ALU_EOR, "bit":ALU_BIT}
+    mem_ops    = {"read":MEM_READ, "write":MEM_WRITE}
+    addr_srcs  = {"pcl":ADDR_PCL, "pch":ADDR_PCH, "adl":ADDR_ADL, "adh":ADDR_ADH, "dl":ADDR_DL,
+                  "sp":ADDR_SP, "zero":ADDR_ZERO, "one":ADDR_ONE}
+    adl_ops    = {"dl":ADL_DL, "alu":ADL_ALU}
+    pc_ops     = {None:PC_NONE, "reset":PC_RESET, "pc_dl_data":PC_DL_DATA, "pcl_data":PC_PCL_DATA,
+                  "pch_data":PC_PCH_DATA, "inc":PC_INC}
+    sp_ops     = {None:SP_NONE, "shift":SP_SHIFT}
+    dl_ops     = {None:DL_NONE, "idb":DL_IDB}
+    dests      = {None:DEST_NONE, "cmp":DEST_NONE, "setclrflag":DEST_NONE, "acc":DEST_ACC,
+                  "x":DEST_X, "y":DEST_Y, "sp":DEST_SP, "flags":DEST_FLAGS}
+    #f of_instruction_set
+    @classmethod
+    def of_instruction_set(cls, instruction_set):
+        """
+        Return the (cached) microcode for an instruction set class
+        """
+        key = instruction_set.__class__
+        if key not in cls.compiled:
+            cls.compiled[key] = cls(instruction_set)
+            pass
+        return cls.compiled[key]
+    #f __init__
+    def __init__(self, instruction_set):
+        self.decodes = [None]*256
+        for opcode in range(256):
+            if opcode in instruction_set.decodings:
+                (instr, am) = instruction_set.decodings[opcode]
+                self.decodes[opcode] = (instr, am, self.compile_instruction(instr, am))
+                pass
+            pass
+        self.reset = (c65i_reset, c65am_reset, self.compile_instruction(c65i_reset, c65am_reset))
+        pass
+    #f lookup
+    def lookup(self, table, value, what, cycle):
+        if value not in table:
+            raise Exception("Bad %s '%s' in cycle %s"%(what, str(value), cycle.__name__))
+        return table[value]
+    #f reg_src
+    def reg_src(self, instr, am, src, cycle):
+        if src=="index": return self.lookup(self.reg_srcs, am.index, "index", cycle)
+        if src=="src":   return self.lookup(self.reg_srcs, instr.src, "source", cycle)
+        return None
+    #f compile_instruction
+    def compile_instruction(self, instr, am):
+        return tuple([self.compile_cycle(instr, am, n) for n in range(len(am.cycles))])
+    #f compile_cycle
+    def compile_cycle(self, instr, am, n):
+        cycle = am.cycles[n]
+        (idb_a, idb_b, idb_c) = (IDB_NONE, IDB_NONE, IDB_NONE)
+        if cycle.idb is not None:
+            idb_a = self.reg_src(instr, am, cycle.idb[0], cycle)
+            if idb_a is None: idb_a = self.lookup(self.idb_a_srcs, cycle.idb[0], "idb[0] source", cycle)
+            idb_b = self.reg_src(instr, am, cycle.idb[1], cycle)
+            if idb_b is None: idb_b = self.lookup(self.idb_b_srcs, cycle.idb[1], "idb[1] source", cycle)
+            if (cycle.idb[1]=="src") and (idb_b not in (IDB_ACC, IDB_X, IDB_Y)):
+                raise Exception("Bad source %s"%instr.src)
+            idb_c = self.lookup(self.idb_c_srcs, cycle.idb[2], "idb[2] source", cycle)
+            pass
+        (shift_op, alu_op, carry_in) = (None, None, CARRY_PSR)
+        if cycle.alu is not None:
+            (alu_op, shift_op) = cycle.alu
+            carry_in = CARRY_0
+            pass
+        elif instr.alu is not None:
+            (shift_op, alu_op, carry) = instr.alu
+            if carry is not None: carry_in = [CARRY_0, CARRY_1][carry]
+            pass
+        if (shift_op is not None) or (alu_op is not None):
+            if cycle.idb is None:
+                raise Exception("ALU/shift op is not None but IDB is None in cycle %s"%cycle.__name__)
+            pass
+        shift_op = self.lookup(self.shift_ops, shift_op, "shift op", cycle)
+        alu_op   = self.lookup(self.alu_ops,   alu_op,   "alu op", cycle)
+        (mem_op, mem_low, mem_high, adl_op) = (MEM_NONE, None, None, None)
+        mem = cycle.get_mem()
+        if mem is not None:
+            mem_op   = self.lookup(self.mem_ops,   mem[0], "memory operation", cycle)
+            mem_low  = self.lookup(self.addr_srcs, mem[1], "address low source", cycle)
+            mem_high = self.lookup(self.addr_srcs, mem[2], "address high source", cycle)
+            adl_op   = ADL_ADDRESS
+            if cycle.adl in self.adl_ops: adl_op = self.adl_ops[cycle.adl]
+            pass
+        pc_op = self.lookup(self.pc_ops, cycle.pc, "PC op", cycle)
+        sp_op = self.lookup(self.sp_ops, cycle.sp, "SP op", cycle)
+        dl_op = self.lookup(self.dl_ops, cycle.dl, "DL op", cycle)
+        (flags_op, flag, dest) = (FLAGS_NONE, None, DEST_NONE)
+        if cycle.write_dest:
+            dest = instr.dest
+            if am.dest is not None: dest = am.dest
+            if dest=="setclrflag":
+                flags_op = FLAGS_SETCLR
+                flag = self.lookup(psr_bits, instr.flag, "flag", cycle)
+                pass
+            elif instr.flag is not False:
+                flags_op = FLAGS_ALU
+                pass
+            dest = self.lookup(self.dests, dest, "dest", cycle)
+            pass
+        (seq_op, seq_arg, seq_flag, seq_value) = (SEQ_NEXT, None, None, None)
+        if cycle.last:
+            seq_op = SEQ_LAST
+            pass
+        elif (n==0) and (instr.condition is not None):
+            (seq_op, seq_arg) = (SEQ_CONDITION, am.condition_fail)
+            (seq_flag, seq_value) = instr.condition
+            seq_flag = self.lookup(psr_bits, seq_flag, "condition flag", cycle)
+            pass
+        if (am.skip_if is not None) and (n==am.skip_if[1]-1):
+            if seq_op!=SEQ_NEXT:
+                raise Exception("Cannot compile skip in cycle %d of %s"%(n, am.__name__))
+            seq_op = {"cc":SEQ_SKIP_CC, "bcc":SEQ_SKIP_BCC}[am.skip_if[0]]
+            seq_arg = n+2
+            pass
+        return (idb_a, idb_b, idb_c, shift_op, alu_op, carry_in,
+                mem_op, mem_low, mem_high, adl_op, pc_op, sp_op, dl_op,
+                flags_op, flag, dest, seq_op, seq_arg, seq_flag, seq_value, cycle)
     pass
 
 #a CPU
@@ -78,109 +343,76 @@ class c65r_adh(c_6502_register):
 class c_6502(object):
     #f __init__
     def __init__(self):
-        self.pcl = c65r_pcl()
-        self.pch = c65r_pch()
-        self.ir  = c65r_ir()
-        self.sp  = c65r_sp()
-        self.acc = c65r_accumulator()
-        self.x   = c65r_index_x()
-        self.y   = c65r_index_y()
-        self.dl  = c65r_dl()
-        self.adl = c65r_adl()
-        self.adh = c65r_adh()
-        self.psr = {"c":0, "n":0, "z":0, "v":0, "i":0, "d":0, "b":0}
+        self.registers = new_register_file()
+        self.pcl = c65r_pcl(self.registers)
+        self.pch = c65r_pch(self.registers)
+        self.ir  = c65r_ir(self.registers)
+        self.sp  = c65r_sp(self.registers)
+        self.acc = c65r_accumulator(self.registers)
+        self.x   = c65r_index_x(self.registers)
+        self.y   = c65r_index_y(self.registers)
+        self.dl  = c65r_dl(self.registers)
+        self.adl = c65r_adl(self.registers)
+        self.adh = c65r_adh(self.registers)
+        self.psr = c65r_psr(self.registers)
+        self.alu_flags = 0
+        self.bus_address = 0
+        self.bus_data = 0xff
+        self.bus_sync = False
+        self.profile = None
         self.reset_ack = 0
-        self.instr = (c65i_reset, c65am_reset)
-        self.instr_cycle = 0
         self.instruction_set = c_6502_instruction_set()
+        self.microcode = c_6502_microcode.of_instruction_set(self.instruction_set)
+        self.reset()
         pass
     #f reset
     def reset(self):
-        self.instr = (c65i_reset, c65am_reset)
+        (instr, am, uops) = self.microcode.reset
+        self.instr = (instr, am)
+        self.uops = uops
         self.instr_cycle = 0
         pass
-    #f get_internal_data_bus
-    def get_internal_data_bus(self, instr_am_cycle, alu=0, data_in=0):
-        (instr, am, cycle) = instr_am_cycle
-        if cycle.idb is None: return (None,None,None) #(0xff,0xff)
-        a = 0xff
-        b = 0xff
-        c = 0xff
-        # cycle.idb[0] should be None, "zero", "index", "src"
-        # "index" is only compatible with idb[1] being "dl"
-        # Hence a 'src' bus could be determined with (drive_A?A) & (drive_X?X) & (drive_Y?Y) & (drive_SP?SP)
-        if cycle.idb[0] in ["zero"]:  a = 0
-        elif cycle.idb[0] in ["index"]:
-            if am.index=="x": a = self.x.get()
-            if am.index=="y": a = self.y.get()
-            pass
-        elif cycle.idb[0] in ["src"]:
-            if instr.src=="acc": a = self.acc.get()
-            elif instr.src=="s": a = self.sp.get()
-            elif instr.src=="x": a = self.x.get()
-            elif instr.src=="y": a = self.y.get()
-            elif instr.src=="flags": a = ( (self.psr["n"]<<7)  |
-                                           (self.psr["v"]<<6)  |
-                                           #(self.psr["-"]<<5) |
-                                           (self.psr["b"]<<4) |
-                                           (self.psr["d"]<<3) |
-                                           (self.psr["i"]<<2) |
-                                           (self.psr["z"]<<1)  |
-                                           (self.psr["c"]<<0) )
-            elif instr.src=="zero": a=0    # Used for CLx
-            elif instr.src=="ones": a=0xff # Used for SEx
-            else: raise Exception("Bad source '%s'"%instr.src)
-            pass
-        elif cycle.idb[0] in ["pcl"]:
-            a = self.pcl.get()
-            pass
-        elif cycle.idb[0] is None:
-            pass
-        else: raise Exception("Bad idb[0] source %s"%cycle.idb[0])
-        # cycle.idb[1] should be None, "dl", ("dl+1"?)
-        if cycle.idb[1] in ["dl"]:
-            b = self.dl.get()
-        elif cycle.idb[1] in ["pch"]:
-            b = self.pch.get()
-        elif cycle.idb[1] in ["sp"]:
-            b = self.sp.get()
-        elif cycle.idb[1] in ["src"]:
-            if instr.src=="acc": b = self.acc.get() # Used in ASL A etc
-            elif instr.src=="x": b = self.x.get()
-            elif instr.src=="y": b = self.y.get()
-            else: raise Exception("Bad source %s"%instr.src)
-            pass
-        elif cycle.idb[1] is None:
-            pass
-        else: raise Exception("Bad idb[1] source %s"%cycle.idb[1])
-        # cycle.idb[2] should be None, "data", "alu"
-        if cycle.idb[2] in ["alu"]:    c = alu
-        elif cycle.idb[2] in ["data"]: c = data_in
-        elif cycle.idb[2] in ["pcl"]:  c = self.pcl.get()
-        elif cycle.idb[2] in ["pch"]:  c = self.pch.get()
-        elif cycle.idb[2] is None: pass
-        else: raise Exception("Bad idb[2] %s"%str(cycle.idb))
-        return (a,b,c)
-    #f check_condition
-    def check_condition(self, instr_am_cycle):
-        (instr, am, cycle) = instr_am_cycle
-        condition = instr.condition
-        if condition is None: return None
-        return self.psr[condition[0]] == condition[1]
-    #f check_skip_if
-    def check_skip_if(self, instr_am_cycle, idb, alu):
-        (instr, am, cycle) = instr_am_cycle
-        skip_if = am.skip_if
-        if skip_if is None: return None
-        elif (skip_if[0]=="cc") :
-            if (alu[3]==0): return skip_if[1]
-            return None
-        elif (skip_if[0]=="bcc"):
-            if self.instr_cycle != skip_if[1]-1: return None
-            if ((idb[1]&128)!=0) and (alu[3]==1): return skip_if[1]
-            if ((idb[1]&128)==0) and (alu[3]==0): return skip_if[1]
-            return None
-        raise Exception("Unexpected skip_if")
+    #f decode
+    def decode(self, opcode):
+        """
+        Set the instruction in hand (and its micro-ops) to that of the opcode
+        """
+        decode = self.microcode.decodes[opcode]
+        if decode is None:
+            print "Could not find encoding for %02x"%opcode
+            self.instr = (None, None)
+            self.uops = None
+            return
+        self.instr = (decode[0], decode[1])
+        self.uops = decode[2]
+        pass
+    #f get_instr_am_cycle
+    def get_instr_am_cycle(self):
+        if self.instr is None:
+            raise Exception("No instruction in hand to find cycle from")
+        (instr, am) = self.instr
+        if am is None:
+            raise Exception("Instruction %s has no addressing mode"%(str(self.instr)))
+        return (instr, am, am.cycle(self.instr_cycle))
+    #f get_uop
+    def get_uop(self):
+        if self.uops is None:
+            self.get_instr_am_cycle()
+            pass
+        return self.uops[self.instr_cycle]
+    #f get_flags
+    def get_flags(self):
+        return self.registers[R_FLAGS]
+    #f set_flags
+    def set_flags(self, flags):
+        self.registers[R_FLAGS] = flags & 0xdf
+        pass
+    #f get_bus_value
+    def get_bus_value(self, src):
+        """
+        Get value of an internal data bus source
+        """
+        return self.registers[src]
     #f alu_logical
     def alu_logical(self, value, carry):
         value = value & 0xff
@@ -223,294 +455,239 @@ class c_6502(object):
         if (value&0x80)!=0: negative=1
         return (value, zero, negative, carry, overflow)
     #f alu
-    def alu(self, instr_am_cycle, idb, dl_bit_7):
-        (instr, am, cycle) = instr_am_cycle
-        shift_inc_op = None
-        alu_op = None
-        carry_in = self.psr["c"]
-        if cycle.alu is not None:
-            (alu_op, shift_inc_op) = cycle.alu
-            carry_in = 0
-            pass
-        elif instr.alu is not None:
-            (shift_inc_op, alu_op, carry_in) = instr.alu
-            if carry_in is None: carry_in=self.psr["c"]
-            pass
-        if ((shift_inc_op is not None) or
-            (alu_op is not None)):
-            if idb is None: raise Exception("ALU/shift op is not None but IDB is None")
-            if idb[0] is None: raise Exception("ALU/shift op is not None but IDB[0] is None")
-            if idb[1] is None: raise Exception("ALU/shift op is not None but IDB[1] is None")
-            pass
-        if shift_inc_op == "incdec":
-            shift_inc_op="inc"
-            if dl_bit_7: shift_inc_op="dec"
-            pass
-        alu_a = idb[0]
-        alu_b = idb[1]
-        if alu_a is None: alu_a = 0xff
-        if alu_b is None: alu_b = 0xff
+    def alu(self, shift_op, alu_op, carry_in, alu_a, alu_b):
+        """
+        Perform an ALU operation given the micro-op shift_op, alu_op and carry_in
+        and the A and B inputs from the internal data bus
+
+        The result is left in the register file (R_ALU, and the shifted B
+        input in R_ALU_B) and its N, V, Z and C flags in alu_flags
+        """
+        registers = self.registers
+        flags = registers[R_FLAGS]
+        if carry_in==CARRY_PSR: carry_in = flags & PSR_C
+        elif carry_in==CARRY_0: carry_in = 0
+        else:                   carry_in = 1
         shift_carry = carry_in
-        if shift_inc_op is None:
-            pass
-        elif shift_inc_op in ["inc"]:
-            alu_b = (idb[1]+1)&0xff
-            pass
-        elif shift_inc_op in ["dec"]:
-            alu_b = (idb[1]-1)&0xff
-            pass
-        elif shift_inc_op in ["lsr"]:
-            shift_carry = idb[1]&1
-            alu_b = idb[1]>>1
-            pass
-        elif shift_inc_op in ["ror"]:
-            shift_carry = idb[1]&1
-            alu_b = (idb[1]>>1) | (carry_in<<7)
-            pass
-        elif shift_inc_op in ["asl"]:
-            shift_carry = (idb[1]>>7)&1
-            alu_b = idb[1]<<1
-            pass
-        elif shift_inc_op in ["rol"]:
-            shift_carry = (idb[1]>>7)&1
-            alu_b = (idb[1]<<1) | (carry_in<<0)
-            pass
-        else:
-            raise Exception("Unknown shift_inc_op %s"%(shift_inc_op))
-        if alu_op is None:
-            alu_result = self.alu_logical(alu_b, shift_carry)
-            pass
-        elif alu_op in ["src"]:
-            alu_result = self.alu_logical(alu_a, shift_carry)
-            pass
-        elif alu_op in ["adc"]:
-            alu_result = self.alu_add(alu_a, alu_b, carry_in)
-            pass
-        elif alu_op in ["add"]:
-            alu_result = self.alu_add(alu_a, alu_b, 0)
-            pass
-        elif alu_op in ["sbc"]:
-            alu_result = self.alu_add(alu_a, 0xff ^ alu_b, carry_in)
-            pass
-        elif alu_op in ["cmp"]:
-            alu_result = self.alu_add(alu_a, 0xff ^ alu_b, carry_in)
-            alu_result = (alu_result[0], alu_result[1], alu_result[2], alu_result[3], self.psr["v"])
-            pass
-        elif alu_op in ["and"]:
-            alu_result = self.alu_logical(alu_a&alu_b, shift_carry)
-            pass
-        elif alu_op in ["or"]:
-            alu_result = self.alu_logical(alu_a|alu_b, shift_carry)
-            pass
-        elif alu_op in ["eor"]:
-            alu_result = self.alu_logical(alu_a^alu_b, shift_carry)
-            pass
-        elif alu_op in ["bit"]:
-            alu_result = (alu_a, 0 or ((alu_b&alu_a)==0), 0 or ((alu_b&128)!=0), shift_carry, 0 or ((alu_b&64)!=0) )
+        if shift_op==SHIFT_INCDEC:
+            shift_op = SHIFT_INC
+            if registers[R_DL]&0x80: shift_op = SHIFT_DEC
+            pass
+        if shift_op==SHIFT_NONE:
+            pass
+        elif shift_op==SHIFT_INC:
+            alu_b = (alu_b+1)&0xff
+            pass
+        elif shift_op==SHIFT_DEC:
+            alu_b = (alu_b-1)&0xff
+            pass
+        elif shift_op==SHIFT_LSR:
+            shift_carry = alu_b&1
+            alu_b = alu_b>>1
+            pass
+        elif shift_op==SHIFT_ROR:
+            shift_carry = alu_b&1
+            alu_b = (alu_b>>1) | (carry_in<<7)
+            pass
+        elif shift_op==SHIFT_ASL:
+            shift_carry = (alu_b>>7)&1
+            alu_b = (alu_b<<1)&0xff
+            pass
+        elif shift_op==SHIFT_ROL:
+            shift_carry = (alu_b>>7)&1
+            alu_b = ((alu_b<<1) | carry_in)&0xff
+            pass
+        overflow = flags & PSR_V
+        if alu_op==ALU_NONE:
+            value = alu_b
+            pass
+        elif alu_op==ALU_SRC:
+            value = alu_a
+            pass
+        elif alu_op<=ALU_CMP: # ALU_ADC, ALU_ADD, ALU_SBC, ALU_CMP
+            b = alu_b
+            if alu_op==ALU_ADD:   carry_in = 0
+            elif alu_op>=ALU_SBC: b = 0xff ^ alu_b
+            value = alu_a + b + carry_in
+            shift_carry = value>>8
+            value = value & 0xff
+            if alu_op!=ALU_CMP:
+                overflow = 0
+                if (alu_a ^ value) & (b ^ value) & 0x80: overflow = PSR_V
+                pass
             pass
-        else:
-            raise Exception("Unknown alu_op %s"%(alu_op))
-        alu_result = tuple(list(alu_result)+[alu_b])
-        #print shift_inc_op, alu_op, idb, "dl7", dl_bit_7, "ci", carry_in, "sc", shift_carry, self.psr, alu_result
-        return alu_result
-    #f get_instr_am_cycle
-    def get_instr_am_cycle(self):
-        if self.instr is None:
-            raise Exception("No instruction in hand to find cycle from")
-        (instr, am) = self.instr
-        if am is None:
-            raise Exception("Instruction %s has no addressing mode"%(str(self.instr)))
-        return (instr, am, am.cycle(self.instr_cycle))
-    #f get_memory_operation
-    def get_memory_operation(self, instr_am_cycle, idb_out):
-        (instr, am, cycle) = instr_am_cycle
-        if cycle is None: return None
-        mem = cycle.get_mem()
-        if mem is None: return None
-        mem = [mem[0], mem[1], mem[2]]
-        if mem[1] in ["pcl"]:    mem[1] = self.pcl.get()
-        elif mem[1] in ["adl"]:  mem[1] = self.adl.get()
-        elif mem[1] in ["dl"]:   mem[1] = self.dl.get()
-        elif mem[1] in ["sp"]:   mem[1] = self.sp.get()
-        if mem[2] in ["pch"]:    mem[2] = self.pch.get()
-        elif mem[2] in ["adh"]:  mem[2] = self.adh.get()
-        elif mem[2] in ["dl"]:   mem[2] = self.dl.get()
-        elif mem[2] in ["zero"]: mem[2] = 0
-        elif mem[2] in ["one"]:  mem[2] = 1
-        mem = [mem[0], (mem[1]&0xff) | ((mem[2]&0xff)<<8)]
-        if mem[0] in ["write"]:
-            mem.append(idb_out)
-            pass
-        return tuple(mem)
-    #f sp_op
-    def sp_op(self, sp_op, idb, alu):
-        if sp_op in ["shift"]:
-            self.sp.set(alu[5])
-        else:
-            raise Exception("Unimplemented SP op %s"%sp_op)
+        elif alu_op==ALU_AND:
+            value = alu_a & alu_b
+            pass
+        elif alu_op==ALU_OR:
+            value = alu_a | alu_b
+            pass
+        elif alu_op==ALU_EOR:
+            value = alu_a ^ alu_b
+            pass
+        else: # ALU_BIT
+            registers[R_ALU] = alu_a
+            registers[R_ALU_B] = alu_b
+            self.alu_flags = (alu_b & (PSR_N|PSR_V)) | shift_carry
+            if (alu_a & alu_b)==0: self.alu_flags |= PSR_Z
+            return
+        registers[R_ALU] = value
+        registers[R_ALU_B] = alu_b
+        if value==0: self.alu_flags = PSR_Z | overflow | shift_carry
+        else:        self.alu_flags = (value & PSR_N) | overflow | shift_carry
         pass
-    #f pc_op
-    def pc_op(self, pc_op, idb, alu):
-        if pc_op in ["reset"]:
-            self.pcl.set(0xfc)
-            self.pch.set(0xff)
+    #f get_alu_result
+    def get_alu_result(self):
+        """
+        Get the result of the last ALU operation as (value, zero, negative, carry, overflow, shifted B input)
+        """
+        alu_flags = self.alu_flags
+        return (self.registers[R_ALU], (alu_flags>>1)&1, (alu_flags>>7)&1, alu_flags&1, (alu_flags>>6)&1, self.registers[R_ALU_B])
+    #f get_address
+    def get_address(self, mem_low, mem_high):
+        return self.registers[mem_low] | (self.registers[mem_high]<<8)
+    #f bus_start
+    def bus_start(self):
+        """
+        Start a cycle, without building a description of it (see tick_start)
+
+        Returns the memory operation of the cycle (MEM_NONE, MEM_READ or
+        MEM_WRITE); its address is left in bus_address, the data for a
+        write in bus_data, and bus_sync is True if the cycle fetches
+        an opcode
+        """
+        uop = self.get_uop()
+        mem_op = uop[6]
+        if mem_op!=MEM_NONE:
+            registers = self.registers
+            self.bus_address = registers[uop[7]] | (registers[uop[8]]<<8)
+            if mem_op==MEM_WRITE:
+                if uop[2]==IDB_ALU:
+                    self.alu(uop[3], uop[4], uop[5], registers[uop[0]], registers[uop[1]])
+                    pass
+                self.bus_data = registers[uop[2]]
+                pass
             pass
-        elif pc_op in ["pc_dl_data"]:
-            self.pcl.set(self.dl.get()) # From idb[1]?
-            self.pch.set(idb[2]) 
+        self.bus_sync = (uop[16]==SEQ_LAST)
+        return mem_op
+    #f describe_bus_cycle
+    def describe_bus_cycle(self, mem_op):
+        mem = None
+        if mem_op==MEM_READ:
+            mem = ("read", self.bus_address)
             pass
-        elif pc_op in ["pcl_data"]:
-            self.pcl.set(idb[2])
+        elif mem_op==MEM_WRITE:
+            mem = ("write", self.bus_address, self.bus_data)
             pass
-        elif pc_op in ["pch_data"]:
-            self.pch.set(idb[2])
+        return {"instr":self.instr[0].mnemonic,"cycle":self.get_uop()[-1],"mem":mem}
+    #f tick_start
+    def tick_start(self):
+        return self.describe_bus_cycle(self.bus_start())
+    #f tick_end
+    def tick_end(self, reset=0, data_in=0, irq=0, nmi=0, rdy=1):
+        (idb_a, idb_b, idb_c, shift_op, alu_op, carry_in,
+         mem_op, mem_low, mem_high, adl_op, pc_op, sp_op, dl_op,
+         flags_op, flag, dest, seq_op, seq_arg, seq_flag, seq_value, cycle) = self.get_uop()
+        registers = self.registers
+        registers[R_DATA] = data_in
+        b = registers[idb_b]
+        self.alu(shift_op, alu_op, carry_in, registers[idb_a], b)
+        c = registers[idb_c]
+        if mem_op!=MEM_NONE:
+            if adl_op==ADL_DL:    new_adl = registers[R_DL]
+            elif adl_op==ADL_ALU: new_adl = registers[R_ALU]
+            else:                 new_adl = registers[mem_low]
+            registers[R_ADH] = registers[mem_high]
+            registers[R_ADL] = new_adl
+            pass
+        if pc_op==PC_NONE:
+            pass
+        elif pc_op==PC_INC:
+            pcl = registers[R_PCL]
+            if pcl==0xff:
+                registers[R_PCL] = 0
+                registers[R_PCH] = (registers[R_PCH]+1)&0xff
+                pass
+            else:
+                registers[R_PCL] = pcl+1
+                pass
             pass
-        elif pc_op in ["inc"]:
-            pcl_max = (self.pcl.get() == 0xff)
-            pcl_carry = 0 or (1 and pcl_max)
-            self.pcl.set((self.pcl.get()+1)&0xff)
-            self.pch.set((self.pch.get()+pcl_carry)&0xff)
+        elif pc_op==PC_DL_DATA:
+            registers[R_PCL] = registers[R_DL]
+            registers[R_PCH] = c
             pass
-        else:
-            raise Exception("Unimplemented PC op %s"%pc_op)
-        pass
-    #f dl_op
-    def dl_op(self, dl_op, idb, alu):
-        if dl_op in ["idb"]:
-            self.dl.set(idb[2])
+        elif pc_op==PC_PCL_DATA:
+            registers[R_PCL] = c
             pass
-        else:
-            raise Exception("Unimplemented DL op %s"%dl_op)
-        pass
-    #f adl_op
-    def adl_op(self, adl_op, idb, alu):
-        if adl_op in ["dl"]:
-            self.adl.set(self.dl.get())
+        elif pc_op==PC_PCH_DATA:
+            registers[R_PCH] = c
             pass
-        elif adl_op in ["pcl"]:
-            self.adl.set(self.pcl.get())
+        elif pc_op==PC_RESET:
+            registers[R_PCL] = 0xfc
+            registers[R_PCH] = 0xff
             pass
-        elif adl_op in ["alu"]:
-            self.adl.set(alu[0])
+        if sp_op==SP_SHIFT: registers[R_SP] = registers[R_ALU_B]
+        if dl_op==DL_IDB:   registers[R_DL] = c
+        if flags_op==FLAGS_ALU:
+            registers[R_FLAGS] = (registers[R_FLAGS] & (PSR_B|PSR_D|PSR_I)) | self.alu_flags
             pass
-        else:
-            raise Exception("Unimplemented ADL op %s"%adl_op)
-        pass
-    #f adh_op
-    def adh_op(self, adh_op, idb, alu):
-        if adh_op in ["dl"]:
-            self.adh.set(self.dl.get())
+        elif flags_op==FLAGS_SETCLR:
+            if registers[R_ALU]&1: registers[R_FLAGS] |= flag
+            else:                  registers[R_FLAGS] &= 0xff ^ flag
             pass
-        elif adh_op in ["pch"]:
-            self.adh.set(self.pch.get())
+        if dest!=DEST_NONE:
+            # DEST_FLAGS for PLP or CLC, CLD, CLV, CLI, SEC, SED, SEI (and RTI?)
+            if dest==DEST_FLAGS: c = c & 0xdf
+            registers[dest] = c
             pass
-        else:
-            raise Exception("Unimplemented DL op %s"%dl_op)
-        pass
-    #f tick_start
-    def tick_start(self):
-        instr_am_cycle = self.get_instr_am_cycle()
-        (instr, am, cycle) = instr_am_cycle
-        idb = (None,None,None)
-        if cycle is not None:
-            idb = self.get_internal_data_bus(instr_am_cycle, alu=0, data_in=0)
-            alu = self.alu(instr_am_cycle, idb, (self.dl.get()>>7)&1)
-            idb = self.get_internal_data_bus(instr_am_cycle, alu=alu[0], data_in=0)
-            pass
-        mem = self.get_memory_operation(instr_am_cycle, idb[2])
-        return {"instr":instr.mnemonic,"cycle":cycle,"mem":mem}
-    #f tick_end
-    def tick_end(self, reset=0, data_in=0, irq=0, nmi=0, rdy=1):
-        instr_am_cycle = self.get_instr_am_cycle()
-        (instr, am, cycle) = instr_am_cycle
-        idb = self.get_internal_data_bus(instr_am_cycle, alu=0, data_in=data_in)
-        alu = self.alu(instr_am_cycle, idb, (self.dl.get()>>7)&1)
-        idb = self.get_internal_data_bus(instr_am_cycle, alu=alu[0], data_in=data_in)
-        condition = self.check_condition(instr_am_cycle)
-        skip_if = self.check_skip_if(instr_am_cycle, idb, alu)
-        mem = self.get_memory_operation(instr_am_cycle, idb[2])
-        if False:
-            if cycle.adl is not None: self.adl_op(cycle.adl, idb, alu) # alu, dl, pcl
-            if cycle.adh is not None: self.adh_op(cycle.adh, idb, alu) # dl, pch
+        if seq_op==SEQ_NEXT:
+            self.instr_cycle += 1
             pass
-        else:
-            if mem is not None:
-                new_adl = mem[1]&0xff
-                new_adh = (mem[1]>>8)&0xff
-                if cycle.adl is "dl":  new_adl = self.dl.get()
-                if cycle.adl is "alu": new_adl = alu[0]
-                self.adl.set(new_adl)
-                self.adh.set(new_adh)
-                pass
-            if False:
-                if cycle.adl is not None:
-                    self.adl_op(cycle.adl, idb, alu) # alu, dl, pcl
-                    if self.adl.get() != new_adl:
-                        print am
-                        print cycle
-                        raise Exception("Mismatch in adl %02x %02x"%(self.adl.get(),new_adl))
-                    pass
-                if cycle.adh is not None:
-                    self.adh_op(cycle.adh, idb, alu) # dl, pch
-                    if self.adh.get() != new_adh:
-                        raise Exception("Mismatch in adh %02x %02x"%(self.adh.get(),new_adh))
-                    pass
-                pass
-            pass
-        if cycle.pc is not None:  self.pc_op(cycle.pc, idb, alu) # inc, pc_dl_data (alu or dl?)
-        if cycle.sp is not None:  self.sp_op(cycle.sp, idb, alu) # shift
-        if cycle.dl is not None:  self.dl_op(cycle.dl, idb, alu) # idb
-        if cycle.write_dest:
-            dest = instr.dest
-            if am.dest is not None:
-                dest=am.dest # To allow for ASL A etc
-            if dest in ["setclrflag"]:
-                self.psr[instr.flag] = alu[0]&1
-                pass
-            elif instr.flag is not False:
-                self.psr["z"] = alu[1]
-                self.psr["n"] = alu[2]
-                self.psr["c"] = alu[3]
-                self.psr["v"] = alu[4]
-                pass
-            if dest in ["acc"]:  self.acc.set(idb[2])
-            elif dest in ["x"]:  self.x.set(idb[2])
-            elif dest in ["y"]:  self.y.set(idb[2])
-            elif dest in ["sp"]: self.sp.set(idb[2])
-            elif dest in ["cmp"]: pass
-            elif dest in ["flags"]: # for PLP or CLC, CLD, CLV, CLI, SEC, SED, SEI (and RTI?)
-                self.psr["n"] = (idb[2]>>7)&1
-                self.psr["v"] = (idb[2]>>6)&1
-                self.psr["b"] = (idb[2]>>4)&1
-                self.psr["d"] = (idb[2]>>3)&1
-                self.psr["i"] = (idb[2]>>2)&1
-                self.psr["z"] = (idb[2]>>1)&1
-                self.psr["c"] = (idb[2]>>0)&1
-                pass
-            elif dest in ["setclrflag"]:
-                pass
-            elif dest is None: # Used for RW ops
-                pass
-            else: raise Exception("Bad dest %s at writing"%dest)
+        elif seq_op==SEQ_LAST:
+            self.instr_cycle = 0
+            registers[R_IR] = data_in
+            self.decode(data_in)
             pass
-        if not cycle.last:
-            if (condition is not None) and (not condition) and (self.instr_cycle==0):
-                self.instr_cycle = am.condition_fail
+        elif seq_op==SEQ_CONDITION:
+            if ((registers[R_FLAGS] & seq_flag)!=0)!=seq_value:
+                self.instr_cycle = seq_arg
                 pass
             else:
                 self.instr_cycle += 1
-                if (skip_if is not None) and (skip_if==self.instr_cycle):
-                    self.instr_cycle += 1
-                    pass
                 pass
             pass
-        else:
-            self.instr_cycle = 0
-            self.ir.set(data_in)
-            #print ">> %04x : %02x"%((self.pcl.get()|(self.pch.get()<<8))-1, self.ir.get())
-            self.instr = self.instruction_set.decode(data_in)
+        elif seq_op==SEQ_SKIP_CC:
+            self.instr_cycle += 1
+            if (self.alu_flags & PSR_C)==0: self.instr_cycle = seq_arg
+            pass
+        else: # SEQ_SKIP_BCC
+            self.instr_cycle += 1
+            if ((b&128)!=0) == ((self.alu_flags & PSR_C)!=0): self.instr_cycle = seq_arg
             pass
-        return idb, alu
+        pass
+    #f enable_profiling
+    def enable_profiling(self, profile=None):
+        """
+        Start profiling execution per opcode, by replacing tick_end with
+        an instrumented version; when profiling is disabled tick_end is
+        the uninstrumented method, at no cost
+
+        Returns the c_6502_profile that accumulates the profile
+        """
+        self.disable_profiling()
+        if profile is None: profile = c_6502_profile()
+        self.profile = profile
+        self.tick_end = profile.instrument(self)
+        return profile
+    #f disable_profiling
+    def disable_profiling(self):
+        """
+        Stop profiling, returning the c_6502_profile (or None if not profiling)
+        """
+        if "tick_end" in self.__dict__: del self.tick_end
+        profile = self.profile
+        self.profile = None
+        return profile
     #f __str__
     def __str__(self):
         r = ""
@@ -527,6 +704,92 @@ class c_6502(object):
         r += str(self.psr)+"\n"
         return r
 
+#a Profiling
+#c c_6502_profile
+class c_6502_profile(object):
+    """
+    Per-opcode execution profile of a c_6502
+
+    For each opcode (and reset) this counts the instructions
+    completed, the cycles taken, the branches taken (for conditional
+    instructions) and the page crossings (skip_if cycles that were not
+    skipped). Only the cycle-accurate model is profiled; cycles run by
+    the functional model in a fast_forward are not counted.
+    """
+    #f __init__
+    def __init__(self):
+        self.counts = {}
+        pass
+    #f instrument
+    def instrument(self, cpu):
+        """
+        Return an instrumented version of the tick_end method of cpu
+        """
+        tick_end = cpu.tick_end
+        registers = cpu.registers
+        counts = self.counts
+        def profiled_tick_end(reset=0, data_in=0, irq=0, nmi=0, rdy=1):
+            (instr, am) = cpu.instr
+            key = registers[R_IR]
+            if am is c65am_reset: key = "reset"
+            seq_op = cpu.get_uop()[16]
+            instr_cycle = cpu.instr_cycle
+            tick_end(reset=reset, data_in=data_in, irq=irq, nmi=nmi, rdy=rdy)
+            if key not in counts: counts[key] = [0, 0, 0, 0, instr.mnemonic or "reset", am.__name__]
+            count = counts[key]
+            count[1] += 1
+            if seq_op==SEQ_LAST:
+                count[0] += 1
+                pass
+            elif seq_op==SEQ_CONDITION:
+                if cpu.instr_cycle==instr_cycle+1: count[2] += 1
+                pass
+            elif seq_op!=SEQ_NEXT: # SEQ_SKIP_CC, SEQ_SKIP_BCC
+                if cpu.instr_cycle==instr_cycle+1: count[3] += 1
+                pass
+            pass
+        return profiled_tick_end
+    #f get_results
+    def get_results(self):
+        """
+        Get a list of dictionaries of results, one per opcode, most cycles first
+        """
+        results = []
+        for (key, (count, cycles, branches_taken, page_crossings, mnemonic, am)) in self.counts.iteritems():
+            opcode = key
+            if key!="reset": opcode = "%02x"%key
+            results.append({"opcode":opcode, "mnemonic":mnemonic, "addressing_mode":am,
+                            "count":count, "cycles":cycles,
+                            "branches_taken":branches_taken, "page_crossings":page_crossings})
+            pass
+        results.sort(key=lambda r:(-r["cycles"], r["opcode"]))
+        return results
+    #f report
+    def report(self):
+        """
+        Return a report of the profile as a string, most cycles first
+        """
+        results = self.get_results()
+        total_cycles = sum([r["cycles"] for r in results])
+        r = "%-6s %-4s %-20s %10s %10s %6s %6s %10s %10s\n"%("Opcode", "Mnem", "Addressing mode", "Count", "Cycles", "%", "CPI", "Taken", "Crossings")
+        for result in results:
+            percent = 0.0
+            if total_cycles>0: percent = 100.0*result["cycles"]/total_cycles
+            cpi = 0.0
+            if result["count"]>0: cpi = float(result["cycles"])/result["count"]
+            r += "%-6s %-4s %-20s %10d %10d %6.2f %6.2f %10d %10d\n"%(result["opcode"], result["mnemonic"], result["addressing_mode"],
+                                                                     result["count"], result["cycles"], percent, cpi,
+                                                                     result["branches_taken"], result["page_crossings"])
+            pass
+        r += "Total cycles %d\n"%total_cycles
+        return r
+    #f write_json
+    def write_json(self, filename):
+        f = open(filename, "w")
+        json.dump(self.get_results(), f, indent=1, sort_keys=True)
+        f.close()
+        pass
+    pass
 
 #a Tests
 #c Test6502_Internal
@@ -574,6 +837,44 @@ class Test6502_Internal(unittest.TestCase):
                 pass
             pass
         pass
+    def test_alu_adc(self):
+        cpu = c_6502()
+        for a in self.alu_test_data:
+            for b in self.alu_test_data:
+                for carry_in in (CARRY_0, CARRY_1):
+                    cpu.alu(SHIFT_NONE, ALU_ADC, carry_in, a, b)
+                    self.assertEqual(cpu.get_alu_result()[:5], cpu.alu_add(a,b,carry_in-CARRY_0),"Mismatch of alu and alu_add for %02x %02x"%(a,b))
+                    pass
+                pass
+            pass
+        pass
+    def test_register_file(self):
+        cpu = c_6502()
+        cpu.acc.set(0x12)
+        cpu.psr["v"] = 1
+        cpu.psr["c"] = 1
+        self.assertEqual(cpu.get_bus_value(IDB_ACC),0x12)
+        self.assertEqual(cpu.get_flags(),PSR_V|PSR_C)
+        cpu.set_flags(0xff)
+        self.assertEqual(cpu.psr["n"],1)
+        self.assertEqual(cpu.get_flags(),0xdf)
+        self.assertEqual(str(cpu.acc),"A:12")
+        pass
+    def test_microcode(self):
+        cpu = c_6502()
+        for opcode in range(256):
+            decode = cpu.microcode.decodes[opcode]
+            if opcode not in cpu.instruction_set.decodings:
+                self.assertEqual(decode,None,"Opcode %02x should not have microcode"%opcode)
+                continue
+            (instr, am, uops) = decode
+            self.assertEqual(len(uops),len(am.cycles),"Opcode %02x should have one micro-op per cycle"%opcode)
+            self.assertEqual(uops[-1][16],SEQ_LAST,"Opcode %02x should complete in its last cycle"%opcode)
+            for uop in uops[:-1]:
+                self.assertNotEqual(uop[16],SEQ_LAST,"Opcode %02x should complete only in its last cycle"%opcode)
+                pass
+            pass
+        pass
 #a Toplevel
 if __name__=="__main__":
     unittest.main()
@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+import dump
 def convert_rom(rom_filename):
     in_file  = open("roms/"+rom_filename)
     out_file =  open("roms/"+rom_filename+".mif", "w")
@@ -16,6 +17,11 @@ def convert_rom(rom_filename):
         pass
     in_file.close()
     out_file.close()
+    in_file  = open("roms/"+rom_filename, "rb")
+    out_file = open("roms/"+rom_filename+".sram", "wb")
+    dump.write_sram_image(out_file, 8, 0, in_file.read())
+    in_file.close()
+    out_file.close()
     pass
 for rom_filename in ("basic2.rom", "dfs.rom", "os12.rom"):
     convert_rom(rom_filename)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+"""
+Batch processing of many RISC-V instruction trace logs
+
+Runs rv_trace, rv_flow or rv_rfw over every log found in the given
+directories (searched recursively for *.log) and globs, in a process
+pool, writing the output for each log to its own file in the output
+directory and a merged summary of all the logs (printed, and written
+as summary.csv).
+
+Results are cached in the output directory by the size and mtime of
+each log and the options used, so a rerun skips logs that have not
+changed since their output was written.
+
+After a regression: rv_batch.py --tool trace --output_dir traces/ regression/
+"""
+#a Imports
+import os
+import sys
+import csv
+import glob
+import json
+import hashlib
+import multiprocessing
+from rv_trace import write_trace
+from rv_flow import write_flow
+from rv_rfw import write_rfw
+
+#a Tools
+tools = {"trace": lambda f, logfile, args: write_trace(f, logfile, module=args["module"], timestamps=args["timestamps"]),
+         "flow":  lambda f, logfile, args: write_flow(f, logfile, module=args["module"], branches=args["branches"]),
+         "rfw":   lambda f, logfile, args: write_rfw(f, logfile, module=args["module"]),
+         }
+summary_fields = ("instructions", "register_writes", "first_time", "last_time")
+cache_filename = "rv_batch_cache.json"
+
+#f find_logs
+def find_logs(paths):
+    """
+    Return the sorted logs given by paths of directories, globs or files
+    """
+    logs = set()
+    for p in paths:
+        if os.path.isdir(p):
+            for (dirpath, dirnames, filenames) in os.walk(p):
+                for f in filenames:
+                    if f.endswith(".log"): logs.add(os.path.join(dirpath, f))
+                    pass
+                pass
+            continue
+        for f in glob.glob(p):
+            if os.path.isfile(f): logs.add(f)
+            pass
+        pass
+    return sorted(logs)
+
+#f log_names
+def log_names(logs):
+    """
+    Return a dictionary of a unique output name for each log, from its path
+    relative to the common directory of all the logs with separators
+    replaced by '_'; where that makes names of different logs the same
+    (as for a/b_c.log and a_b/c.log), a short hash of the relative path
+    is appended to them
+    """
+    common = os.path.commonprefix([os.path.dirname(os.path.abspath(l))+os.sep for l in logs])
+    common = common[:common.rfind(os.sep)+1]
+    paths = {}
+    names = {}
+    for l in logs:
+        path = os.path.abspath(l)[len(common):]
+        name = path
+        if name.endswith(".log"): name = name[:-4]
+        paths[l] = path
+        names[l] = name.replace(os.sep, "_")
+        pass
+    counts = {}
+    for name in names.values(): counts[name] = counts.get(name,0)+1
+    for l in logs:
+        if counts[names[l]]>1: names[l] += "_"+hashlib.sha1(paths[l]).hexdigest()[:8]
+        pass
+    # Only two paths of the same log can still have the same name
+    logs_by_name = {}
+    for l in logs:
+        if names[l] in logs_by_name: raise Exception("Logs %s and %s have the same output name %s"%(logs_by_name[names[l]], l, names[l]))
+        logs_by_name[names[l]] = l
+        pass
+    return names
+
+#f process_log
+def process_log(task):
+    """
+    Run a tool over a log, writing its output file; returns (log, summary)
+    """
+    (tool, logfile, output, args) = task
+    f = open(output, "w")
+    try:
+        summary = tools[tool](f, logfile, args)
+        pass
+    finally:
+        f.close()
+        pass
+    return (logfile, summary)
+
+#a Batch
+#c c_batch
+class c_batch(object):
+    """
+    A batch run of a tool over logs, with its cache of earlier results
+    """
+    #f __init__
+    def __init__(self, tool, output_dir, args):
+        self.tool = tool
+        self.output_dir = output_dir
+        self.args = args
+        self.cache_file = os.path.join(output_dir, cache_filename)
+        self.cache = {}
+        if os.path.exists(self.cache_file):
+            f = open(self.cache_file)
+            self.cache = json.load(f)
+            f.close()
+            pass
+        pass
+    #f cache_key
+    def cache_key(self, logfile):
+        return json.dumps([self.tool, os.path.abspath(logfile), self.args], sort_keys=True)
+    #f cached_summary
+    def cached_summary(self, logfile, output):
+        """
+        Return the cached summary of a log if it and its output are unchanged, else None
+        """
+        entry = self.cache.get(self.cache_key(logfile))
+        if entry is None: return None
+        if not os.path.exists(output): return None
+        stat = os.stat(logfile)
+        if (entry["size"]!=stat.st_size) or (entry["mtime"]!=stat.st_mtime): return None
+        return entry["summary"]
+    #f run
+    def run(self, logs, jobs=None):
+        """
+        Process the logs, returning a list of (name, log, summary, cached) in log order
+        """
+        if not os.path.isdir(self.output_dir): os.makedirs(self.output_dir)
+        names = log_names(logs)
+        results = {}
+        tasks = []
+        stats = {}
+        for l in logs:
+            output = os.path.join(self.output_dir, "%s.%s"%(names[l], self.tool))
+            summary = self.cached_summary(l, output)
+            if summary is not None:
+                results[l] = (summary, True)
+                continue
+            stats[l] = os.stat(l)
+            tasks.append((self.tool, l, output, self.args))
+            pass
+        if len(tasks)>0:
+            pool = multiprocessing.Pool(jobs)
+            try:
+                for (l, summary) in pool.imap_unordered(process_log, tasks):
+                    results[l] = (summary, False)
+                    self.cache[self.cache_key(l)] = {"size":stats[l].st_size, "mtime":stats[l].st_mtime, "summary":summary}
+                    pass
+                pass
+            finally:
+                pool.close()
+                pool.join()
+                pass
+            f = open(self.cache_file, "w")
+            json.dump(self.cache, f, indent=1, sort_keys=True)
+            f.close()
+            pass
+        return [(names[l], l, results[l][0], results[l][1]) for l in logs]
+    pass
+
+#a Summary
+#f write_summary
+def write_summary(f, results):
+    """
+    Write the merged summary of the results of a batch
+    """
+    width = max([len(r[0]) for r in results]+[len("total")])
+    print >>f, "%-*s %12s %15s %12s %12s"%(width, "log", "instructions", "register_writes", "first_time", "last_time")
+    totals = {"instructions":0, "register_writes":0}
+    for (name, logfile, summary, cached) in results:
+        cells = ["-" if summary[k] is None else str(summary[k]) for k in summary_fields]
+        note = ""
+        if cached: note = " (cached)"
+        print >>f, "%-*s %12s %15s %12s %12s%s"%(width, name, cells[0], cells[1], cells[2], cells[3], note)
+        for k in totals: totals[k] += summary[k]
+        pass
+    print >>f, "%-*s %12d %15d"%(width, "total", totals["instructions"], totals["register_writes"])
+    pass
+
+#f write_summary_csv
+def write_summary_csv(filename, results):
+    f = open(filename, "wb")
+    writer = csv.writer(f)
+    writer.writerow(("log", "logfile")+summary_fields)
+    for (name, logfile, summary, cached) in results:
+        writer.writerow([name, logfile]+[summary[k] for k in summary_fields])
+        pass
+    f.close()
+    pass
+
+#a Toplevel
+#f main
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Process many RV simulation logs in parallel')
+    parser.add_argument('logs', type=str, nargs='+',
+                        help='log files, globs or directories to search for *.log')
+    parser.add_argument('--tool', type=str, choices=sorted(tools.keys()), default='trace',
+                        help='processing to apply to each log')
+    parser.add_argument('--output_dir', type=str, default='rv_batch',
+                        help='directory for per-log outputs, the summary and the cache')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='number of processes (default one per CPU)')
+    parser.add_argument('--module', type=str, default="dut.trace",
+                        help='trace module in the logs')
+    parser.add_argument('--timestamps', action='store_true', default=False,
+                        help='display timestamps in traces')
+    parser.add_argument('--branches', action='store_true', default=False,
+                        help='give branch and trap flow rather than register writes for flow')
+    args = parser.parse_args()
+    logs = find_logs(args.logs)
+    if len(logs)==0:
+        print >>sys.stderr, "No logs found"
+        sys.exit(1)
+        pass
+    options = {"module":args.module, "timestamps":args.timestamps, "branches":args.branches}
+    batch = c_batch(args.tool, args.output_dir, options)
+    results = batch.run(logs, args.jobs)
+    write_summary(sys.stdout, results)
+    write_summary_csv(os.path.join(args.output_dir, "summary.csv"), results)
+    pass
+
+if __name__=="__main__":
+    main()
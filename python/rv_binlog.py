@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+"""
+Binary simulation logs with a NumPy memory-mapped reader
+
+A binary log holds the events of a CDL logger log (such as itrace.log)
+as fixed-width records, so a reader can map the file as a NumPy
+structured array and select events by module, reason and argument
+values with vectorised masks rather than parsing each row.
+
+The file is a 64-byte header of the magic 'RVLOG\\0\\0\\0', then
+version, record size, maximum number of arguments, number of records,
+schema offset and schema length as little-endian 32-bit values (the
+last three 64-bit); the records follow the header, and the schema
+follows the records. Each record is a 64-bit timestamp, 16-bit module
+index, event number and number of arguments, 16 bits of padding, and
+the arguments as 64-bit values. The schema is JSON: the list of module
+names, indexed by record module, and for each declared event its
+module, number, reason and argument names.
+
+The schema follows the records so that a log can be written in a
+single streaming pass; the header is filled in when the writer is
+closed.
+
+Converting a log: rv_binlog.py itrace.log itrace.bin
+"""
+#a Imports
+import json
+import struct
+import numpy
+from rv_itrace import default_reasons, log_lines, binary_log_magic, is_binary_log
+
+#a Binary log format
+log_magic = binary_log_magic
+log_version = 1
+log_header = struct.Struct("<8sIIIQQQ")
+log_header_size = 64
+default_max_args = 8
+
+#f record_dtype
+def record_dtype(max_args):
+    return numpy.dtype([("timestamp", "<u8"), ("module", "<u2"), ("event", "<u2"),
+                        ("num_args", "<u2"), ("pad", "<u2"), ("args", "<u8", (max_args,))])
+
+#a Writer
+#c c_binary_log_writer
+class c_binary_log_writer(object):
+    """
+    Writer of a binary log; close() writes the schema and fills in the header
+    """
+    #f __init__
+    def __init__(self, f, max_args=default_max_args):
+        self.f = f
+        self.max_args = max_args
+        self.record = struct.Struct("<QHHHH%dQ"%max_args)
+        self.modules = []
+        self.module_index = {}
+        self.events = {}
+        self.num_records = 0
+        self.f.write("\0"*log_header_size)
+        pass
+    #f module
+    def module(self, name):
+        """
+        Return the index of a module, adding it if it is new
+        """
+        if name not in self.module_index:
+            self.module_index[name] = len(self.modules)
+            self.modules.append(name)
+            pass
+        return self.module_index[name]
+    #f declare
+    def declare(self, module, event, reason, arg_names):
+        self.events[(self.module(module), event)] = (reason, list(arg_names))
+        pass
+    #f add
+    def add(self, timestamp, module, event, args):
+        if len(args)>self.max_args: raise Exception("Event with %d arguments exceeds the %d of the binary log"%(len(args), self.max_args))
+        num_args = len(args)
+        args = [a & 0xffffffffffffffff for a in args] + [0]*(self.max_args-num_args)
+        self.f.write(self.record.pack(timestamp, self.module(module), event, num_args, 0, *args))
+        self.num_records += 1
+        pass
+    #f schema
+    def schema(self):
+        events = []
+        for ((module, event), (reason, arg_names)) in sorted(self.events.items()):
+            events.append({"module":module, "event":event, "reason":reason, "args":arg_names})
+            pass
+        return {"modules":self.modules, "events":events}
+    #f close
+    def close(self):
+        schema = json.dumps(self.schema(), sort_keys=True)
+        schema_offset = log_header_size + self.num_records*self.record.size
+        self.f.write(schema)
+        self.f.seek(0)
+        self.f.write(log_header.pack(log_magic, log_version, self.record.size, self.max_args,
+                                     self.num_records, schema_offset, len(schema)))
+        self.f.close()
+        pass
+    pass
+
+#f convert_log
+def convert_log(log_filename, binary_filename, max_args=default_max_args):
+    """
+    Convert a CDL logger CSV log to a binary log in one pass, returning the number of records
+    """
+    writer = c_binary_log_writer(open(binary_filename, "wb"), max_args)
+    f = open(log_filename, "rb")
+    for l in log_lines(f):
+        row = [r.strip('" ') for r in l.rstrip().split(",")]
+        if len(row)<5: continue
+        if row[0].startswith("#"):
+            if "=" in row[3]:
+                (event, reason) = row[3].split("=",1)
+                writer.declare(row[2], int(event), reason.strip('" '), row[5:5+int(row[4])])
+                pass
+            continue
+        args = [int(a,16) for a in row[5:5+int(row[4])]]
+        writer.add(int(row[0]), row[2], int(row[3]), args)
+        pass
+    f.close()
+    writer.close()
+    return writer.num_records
+
+#a Reader
+#c c_binary_log
+class c_binary_log(object):
+    """
+    A binary log mapped as a NumPy structured array of records, with its schema
+    """
+    #f __init__
+    def __init__(self, filename):
+        self.filename = filename
+        f = open(filename, "rb")
+        header = f.read(log_header_size)
+        (magic, version, record_size, max_args, num_records, schema_offset, schema_length) = log_header.unpack_from(header)
+        if magic!=log_magic: raise Exception("Not a binary log")
+        if version!=log_version: raise Exception("Unsupported binary log version %d"%version)
+        f.seek(schema_offset)
+        schema = json.loads(f.read(schema_length))
+        f.close()
+        self.dtype = record_dtype(max_args)
+        if self.dtype.itemsize!=record_size: raise Exception("Binary log record size %d does not match its arguments"%record_size)
+        self.modules = [str(m) for m in schema["modules"]]
+        self.events = {}
+        for e in schema["events"]:
+            self.events[(e["module"], e["event"])] = (str(e["reason"]), [str(a) for a in e["args"]])
+            pass
+        self.records = numpy.zeros(0, dtype=self.dtype)
+        if num_records>0:
+            self.records = numpy.memmap(filename, dtype=self.dtype, mode="r", offset=log_header_size, shape=(num_records,))
+            pass
+        pass
+    #f __len__
+    def __len__(self):
+        return len(self.records)
+    #f offset_for_time
+    def offset_for_time(self, timestamp):
+        """
+        Return the file offset of the first record at or after a timestamp; records are in timestamp order
+        """
+        return log_header_size + self.dtype.itemsize*int(numpy.searchsorted(self.records["timestamp"], timestamp))
+    #f record_at_offset
+    def record_at_offset(self, offset):
+        return (offset-log_header_size)//self.dtype.itemsize
+    #f module_index
+    def module_index(self, module):
+        if module not in self.modules: return None
+        return self.modules.index(module)
+    #f event_number
+    def event_number(self, module, reason):
+        """
+        Return the event number of a reason of a module, or None if it is not declared
+        """
+        m = self.module_index(module)
+        for ((em, event), (r, args)) in self.events.iteritems():
+            if (em==m) and (r==reason): return event
+            pass
+        if reason in default_reasons.values():
+            return [e for (e, r) in default_reasons.iteritems() if r==reason][0]
+        return None
+    #f reason
+    def reason(self, module_index, event):
+        """
+        Return the reason of an event of a module, or the event number if it is not declared
+        """
+        if (module_index, event) in self.events: return self.events[(module_index, event)][0]
+        return default_reasons.get(event, event)
+    #f mask
+    def mask(self, module=None, reason=None):
+        """
+        Return a boolean array selecting the records of a module and event reason (either may be None for all)
+        """
+        mask = numpy.ones(len(self.records), dtype=bool)
+        if module is not None:
+            m = self.module_index(module)
+            if m is None: return numpy.zeros(len(self.records), dtype=bool)
+            mask &= (self.records["module"]==m)
+            pass
+        if reason is not None:
+            event = self.event_number(module, reason)
+            if event is None: return numpy.zeros(len(self.records), dtype=bool)
+            mask &= (self.records["event"]==event)
+            pass
+        return mask
+    #f select
+    def select(self, module=None, reason=None):
+        return self.records[self.mask(module, reason)]
+    #f event_array
+    def event_array(self, module, reason):
+        """
+        Return a structured array of the events of a module and reason, with
+        a field of timestamp and a field for each argument named by the schema
+        """
+        records = self.select(module, reason)
+        m = self.module_index(module)
+        arg_names = self.events.get((m, self.event_number(module, reason)), (reason, []))[1]
+        if len(arg_names)==0: arg_names = ["arg%d"%i for i in range(self.dtype["args"].shape[0])]
+        dtype = numpy.dtype([("timestamp", "<u8")] + [(a, "<u8") for a in arg_names])
+        events = numpy.zeros(len(records), dtype=dtype)
+        events["timestamp"] = records["timestamp"]
+        for (i, a) in enumerate(arg_names):
+            events[a] = records["args"][:,i]
+            pass
+        return events
+    pass
+
+#a Toplevel
+#f main
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert a CDL logger log to a binary log, or summarise a binary log')
+    parser.add_argument('log', type=str, help='CSV log to convert, or binary log to summarise')
+    parser.add_argument('binary', type=str, nargs='?', default=None, help='binary log to write')
+    parser.add_argument('--max_args', type=int, default=default_max_args,
+                        help='maximum number of arguments of an event')
+    args = parser.parse_args()
+    if args.binary is not None:
+        n = convert_log(args.log, args.binary, args.max_args)
+        print "%s: %d records"%(args.binary, n)
+        return
+    log = c_binary_log(args.log)
+    print "%s: %d records"%(args.log, len(log))
+    keys = log.records["module"].astype(numpy.uint32)*65536 + log.records["event"]
+    (values, counts) = numpy.unique(keys, return_counts=True)
+    for (k, n) in zip(values, counts):
+        (m, e) = (int(k)>>16, int(k)&0xffff)
+        print "  %-24s %-12s %10d"%(log.modules[m], log.reason(m, e), n)
+        pass
+    pass
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+"""
+Per-test CPI and stall report for RISC-V pipeline variants
+
+Each variant is a directory of golden traces, such as riscv_trace/ as
+captured by one of riscv_i32_minimal, riscv_i32c_pipeline3,
+riscv_i32mc_pipeline3 or riscv_i32mc_system with RISCV_TRACE_DIR set.
+The time between successive retired instructions of a trace is taken
+as a number of clock periods, the period being the smallest time
+between two instructions unless given; cycles beyond the first are
+stalls, attributed to the class of the preceding instruction. An
+instruction after which execution does not continue as its class
+implies (such as ecall, mret or one that took an exception) is
+classed as a trap.
+
+The report is a table of CPI per test for each variant, then stall
+cycles per class and branch penalties for each variant over all the
+tests; it may also be written as CSV with one row per test and variant.
+
+Comparing variants: rv_cpi.py i32=i32_traces/ pipeline3=p3_traces/ --csv cpi.csv
+"""
+#a Imports
+import os
+import sys
+import csv
+import glob
+import numpy
+from rv_trace_diff import c_trace_arrays
+from rv_decode import rv_decoder
+from rv_decode import rv_instr_jal, rv_instr_jalr, rv_instr_bcc, rv_instr_muldiv
+from rv_decode import rv_instr_system, rv_instr_csr, rv_instr_fence, rv_instr_store, rv_instr_load
+
+#a Instruction classes
+instruction_classes = ("alu", "branch", "jal", "jalr", "load", "store", "muldiv", "system", "trap")
+instruction_class_of = {rv_instr_bcc:"branch", rv_instr_jal:"jal", rv_instr_jalr:"jalr",
+                        rv_instr_load:"load", rv_instr_store:"store", rv_instr_muldiv:"muldiv",
+                        rv_instr_system:"system", rv_instr_csr:"system", rv_instr_fence:"system"}
+control_flow_classes = ("branch", "jal", "jalr")
+
+#f instruction_class
+def instruction_class(decoder, instruction):
+    """
+    Return the class of an instruction word; alu for any not otherwise classed
+    """
+    return instruction_class_of.get(decoder.decode(0, instruction).__class__, "alu")
+
+#a Classes
+#c c_trace_timing
+class c_trace_timing(object):
+    """
+    Cycles and stalls of one trace
+
+    stalls and counts are dictionaries keyed by instruction class of the
+    stall cycles following, and the number of, instructions of the class
+    (excluding the last instruction of the trace).
+    """
+    #f __init__
+    def __init__(self, trace, clock_period=None, decoder=None):
+        if decoder is None: decoder = rv_decoder()
+        (time, pc, instruction) = (trace.time, trace.pc, trace.instruction)
+        # Some captured traces start with an entry for pc 0 of instruction 0 at reset
+        if (len(pc)>0) and (instruction[0]==0):
+            (time, pc, instruction) = (time[1:], pc[1:], instruction[1:])
+            pass
+        self.instructions = len(pc)
+        deltas = numpy.diff(time)
+        if clock_period is None:
+            positive = deltas[deltas>0]
+            clock_period = 1
+            if len(positive)>0: clock_period = int(positive.min())
+            pass
+        self.clock_period = clock_period
+        cycles = deltas / float(clock_period)
+        stalls = numpy.maximum(cycles-1, 0)
+        self.cycles = float(cycles.sum())
+
+        (words, word_index) = numpy.unique(instruction[:-1], return_inverse=True)
+        classes = [instruction_classes.index(instruction_class(decoder, int(w))) for w in words]
+        class_index = numpy.array(classes, dtype=numpy.int64)[word_index]
+        size = numpy.where((instruction[:-1]&3)==3, 4, 2)
+        sequential = (pc[1:]==(pc[:-1]+size))
+        control_flow = numpy.in1d(class_index, [instruction_classes.index(c) for c in control_flow_classes])
+        class_index[~sequential & ~control_flow] = instruction_classes.index("trap")
+        branches = (class_index==instruction_classes.index("branch"))
+        taken = branches & ~sequential
+
+        n = len(instruction_classes)
+        self.stalls = dict(zip(instruction_classes, numpy.bincount(class_index, weights=stalls, minlength=n)))
+        self.counts = dict(zip(instruction_classes, numpy.bincount(class_index, minlength=n)))
+        self.taken_branches         = int(taken.sum())
+        self.taken_branch_stalls    = float(stalls[taken].sum())
+        self.untaken_branches       = int((branches & sequential).sum())
+        self.untaken_branch_stalls  = float(stalls[branches & sequential].sum())
+        pass
+    #f cpi
+    def cpi(self):
+        if self.instructions<2: return None
+        return self.cycles / (self.instructions-1)
+    #f taken_branch_penalty
+    def taken_branch_penalty(self):
+        if self.taken_branches==0: return None
+        return self.taken_branch_stalls / self.taken_branches
+    #f untaken_branch_penalty
+    def untaken_branch_penalty(self):
+        if self.untaken_branches==0: return None
+        return self.untaken_branch_stalls / self.untaken_branches
+    pass
+
+#c c_variant_timing
+class c_variant_timing(object):
+    """
+    Timing of the traces of one pipeline variant, keyed by test name,
+    and their totals
+    """
+    #f __init__
+    def __init__(self, name, directory, tests=None, clock_period=None):
+        self.name = name
+        self.directory = directory
+        self.tests = {}
+        decoder = rv_decoder()
+        for filename in sorted(glob.glob(os.path.join(directory, "*.trace"))):
+            test = os.path.basename(filename)[:-len(".trace")]
+            if (tests is not None) and (test not in tests): continue
+            self.tests[test] = c_trace_timing(c_trace_arrays(filename), clock_period, decoder)
+            pass
+        pass
+    #f total
+    def total(self, name):
+        return sum([getattr(t,name) for t in self.tests.values()])
+    #f total_stalls
+    def total_stalls(self, instruction_class):
+        return sum([t.stalls[instruction_class] for t in self.tests.values()])
+    #f cpi
+    def cpi(self):
+        instructions = sum([t.instructions-1 for t in self.tests.values() if t.instructions>1])
+        if instructions==0: return None
+        return self.total("cycles") / instructions
+    #f taken_branch_penalty
+    def taken_branch_penalty(self):
+        if self.total("taken_branches")==0: return None
+        return self.total("taken_branch_stalls") / self.total("taken_branches")
+    #f untaken_branch_penalty
+    def untaken_branch_penalty(self):
+        if self.total("untaken_branches")==0: return None
+        return self.total("untaken_branch_stalls") / self.total("untaken_branches")
+    pass
+
+#a Reports
+#f format_value
+def format_value(v, fmt="%.3f"):
+    if v is None: return "-"
+    return fmt%v
+
+#f report
+def report(f, variants):
+    """
+    Write the comparison table of the variants
+    """
+    tests = sorted(set([t for v in variants for t in v.tests]))
+    width = max([len(t) for t in tests+["total"]])
+    print >>f, "CPI"
+    print >>f, "%-*s %s"%(width, "test", " ".join(["%12s"%v.name for v in variants]))
+    for t in tests:
+        cpis = [format_value(v.tests[t].cpi()) if t in v.tests else "-" for v in variants]
+        print >>f, "%-*s %s"%(width, t, " ".join(["%12s"%c for c in cpis]))
+        pass
+    print >>f, "%-*s %s"%(width, "total", " ".join(["%12s"%format_value(v.cpi()) for v in variants]))
+    print >>f
+    print >>f, "Stall cycles by preceding instruction class (instructions)"
+    print >>f, "%-*s %s"%(width, "class", " ".join(["%20s"%v.name for v in variants]))
+    for c in instruction_classes:
+        cells = ["%.0f (%d)"%(v.total_stalls(c), sum([t.counts[c] for t in v.tests.values()])) for v in variants]
+        print >>f, "%-*s %s"%(width, c, " ".join(["%20s"%cell for cell in cells]))
+        pass
+    print >>f
+    print >>f, "Branch penalty (stall cycles per branch)"
+    print >>f, "%-*s %s"%(width, "taken", " ".join(["%12s"%format_value(v.taken_branch_penalty()) for v in variants]))
+    print >>f, "%-*s %s"%(width, "not taken", " ".join(["%12s"%format_value(v.untaken_branch_penalty()) for v in variants]))
+    pass
+
+#f write_csv
+def write_csv(filename, variants):
+    """
+    Write one row per test and variant
+    """
+    f = open(filename, "wb")
+    writer = csv.writer(f)
+    writer.writerow(["test", "variant", "instructions", "clock_period", "cycles", "cpi",
+                     "taken_branches", "taken_branch_penalty", "untaken_branches", "untaken_branch_penalty"] +
+                    ["stalls_%s"%c for c in instruction_classes])
+    for v in variants:
+        for t in sorted(v.tests):
+            timing = v.tests[t]
+            writer.writerow([t, v.name, timing.instructions, timing.clock_period, "%.1f"%timing.cycles,
+                             format_value(timing.cpi(), "%.4f"),
+                             timing.taken_branches, format_value(timing.taken_branch_penalty(), "%.4f"),
+                             timing.untaken_branches, format_value(timing.untaken_branch_penalty(), "%.4f")] +
+                            ["%.1f"%timing.stalls[c] for c in instruction_classes])
+            pass
+        pass
+    f.close()
+    pass
+
+#a Toplevel
+#f main
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Report CPI and stalls of RISC-V golden traces across pipeline variants')
+    parser.add_argument('variants', type=str, nargs='+',
+                        help='trace directory of each variant, as name=directory or directory')
+    parser.add_argument('--csv', type=str, default=None,
+                        help='CSV file to write per-test results to')
+    parser.add_argument('--tests', type=str, nargs='+', default=None,
+                        help='names of tests to report (default all)')
+    parser.add_argument('--clock_period', type=int, default=None,
+                        help='trace time units per clock cycle (default smallest time between instructions)')
+    args = parser.parse_args()
+    variants = []
+    for v in args.variants:
+        (name, directory) = (os.path.basename(os.path.normpath(v)), v)
+        if "=" in v: (name, directory) = v.split("=",1)
+        variants.append(c_variant_timing(name, directory, args.tests, args.clock_period))
+        pass
+    report(sys.stdout, variants)
+    if args.csv is not None: write_csv(args.csv, variants)
+    pass
+
+if __name__=="__main__":
+    main()
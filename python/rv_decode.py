@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+"""
+RISC-V instruction decode and disassembly for the trace tools
+
+Instructions are decoded through a dispatch table indexed by the 7-bit
+major opcode, with RV32C instructions expanded to their 32-bit
+equivalents. rv_decoder memoises decoded and disassembled instructions
+by instruction word in an LRU cache, so that the repeated words of a
+program's loops are only decoded once.
+"""
+#a Rv instructions
+riscv_ops = [
+    "branch",
+    "jal",
+    "jalr",
+    "system",
+    "csr",
+    "misc_mem",
+    "load",
+    "store",
+    "alu",
+    "muldiv",
+    "auipc",
+    "lui",
+    "illegal",
+]
+def bits (s,e,v):
+    l = (e+1-s)
+    m = (1<<l)-1
+    return (v>>s) & m
+
+#c rv_instr
+class rv_instr:
+    decode_table = [[] for i in range(128)]
+    rd = None
+    rs1 = None
+    rs2 = None
+    immediate = None
+    size = 4
+    pc_relative = False
+    @classmethod
+    def add_instr_class(rv,cls):
+        def mk_inst(pc,x): return cls(pc).from_binary(x)
+        instr_classes = rv.decode_table[cls.bin_value & 0x7f]
+        instr_classes.append((cls.bin_mask,cls.bin_value,mk_inst))
+        instr_classes.sort(key=lambda e:-bin(e[0]).count("1"))
+    @classmethod
+    def from_binary(cls, pc, x):
+        if (x&3)!=3:
+            x32 = rvc_expand(x & 0xffff)
+            if x32 is None:
+                inst = cls(pc).set_from_binary(pc,x & 0xffff)
+                pass
+            else:
+                inst = cls.from_binary(pc, x32)
+                pass
+            inst.size = 2
+            return inst
+        for (mask,value,mk_inst) in cls.decode_table[x & 0x7f]:
+            if (x & mask)==value: return mk_inst(pc, x)
+            pass
+        return cls(pc).set_from_binary(pc,x)
+    def __init__(self, pc):
+        self.pc = pc
+        pass
+    def set_rs1(self,rs1): self.rs1=rs1
+    def set_rs2(self,rs2): self.rs2=rs2
+    def set_rd(self,rd): self.rd=rd
+    def str_rd(self):
+        if self.rd==0: return "--"
+        return "r%d" % self.rd
+    def str_rs(self, rs):
+        if rs==0: return "0"
+        return "r%d" % rs
+    def str_rs1(self): return self.str_rs(self.rs1)
+    def str_rs2(self): return self.str_rs(self.rs2)
+    def set_imm(self,imm): self.immediate = imm
+    def set_imm_sext(self,imm,b):
+        if (imm>>b)&1: imm |= (0xffffffff<<b) & 0xffffffff
+        if (imm>>31) & 1: imm= (-1<<31) | imm
+        self.set_imm(imm)
+        pass
+    def set_from_binary(self,pc,x):
+        self.instr_data = x
+        return self
+    def disassemble(self):
+        return "?%08x?"%self.instr_data
+
+#c rv_instr_lui
+class rv_instr_lui(rv_instr):
+    bin_mask  = 0x7f
+    bin_value = 0x37
+    def from_binary(self, x):
+        self.set_rd(bits(7,11,x))
+        self.set_imm(bits(12,31,x)<<12)
+        return self
+    def disassemble(self):
+        return "lui r%d, 0x%08x"%(self.rd, self.immediate)
+
+#c rv_instr_auipc
+class rv_instr_auipc(rv_instr):
+    bin_mask  = 0x7f
+    bin_value = 0x17
+    def from_binary(self, x):
+        self.set_rd(bits(7,11,x))
+        self.set_imm(bits(12,31,x)<<12)
+        return self
+    def disassemble(self):
+        return "auipc r%d, 0x%08x"%(self.rd, self.immediate)
+
+#c rv_instr_jal
+class rv_instr_jal(rv_instr):
+    bin_mask  = 0x7f
+    bin_value = 0x6f
+    pc_relative = True
+    def from_binary(self, x):
+        self.set_rd(bits(7,11,x))
+        self.set_imm_sext( (bits(12,19,x)<<12) |
+                           (bits(20,20,x)<<11) |
+                           (bits(21,30,x)<<1) |
+                           (bits(31,31,x)<<20), 20 )
+        return self
+    def disassemble(self):
+        link = ""
+        if self.rd!=0: link = "al %s,"%self.str_rd()
+        return "j %s0x%08x"%(link, self.pc + self.immediate)
+
+#c rv_instr_jalr
+class rv_instr_jalr(rv_instr):
+    bin_mask  = 0x707f
+    bin_value = 0x67
+    def from_binary(self, x):
+        self.set_rd(bits(7,11,x))
+        self.set_rs1(bits(15,19,x))
+        self.set_imm_sext( (bits(20,31,x)<<0), 11 )
+        return self
+    def disassemble(self):
+        return "jalr %s, %d(%s)"%(self.str_rd(), self.immediate, self.str_rs1())
+
+#c rv_instr_bcc
+class rv_instr_bcc(rv_instr):
+    bin_mask  = 0x7f
+    bin_value = 0x63
+    pc_relative = True
+    cc_str = ["eq", "ne", "??", "??", "lt", "ge", "ltu", "geu"]
+    def from_binary(self, x):
+        self.set_rs1(bits(15,19,x))
+        self.set_rs2(bits(20,24,x))
+        self.set_imm_sext( (bits(8,11,x)<<1) |
+                           (bits(25,30,x)<<5) |
+                           (bits(7,7,x)<<11) |
+                           (bits(31,31,x)<<12), 12 )
+        self.cc = bits(12,14,x)
+        return self
+    def disassemble(self):
+        return "b%s %s, %s, 0x%08x"%(self.cc_str[self.cc], self.str_rs1(), self.str_rs2(), self.pc+self.immediate)
+
+#c rv_instr_alui
+class rv_instr_alui(rv_instr):
+    bin_mask  = 0x7f
+    bin_value = 0x13
+    subop_str = ["add", "sll", "slt", "sltiu", "xor", "srl", "or", "and", "sra"]
+    def from_binary(self, x):
+        self.set_rd(bits(7,11,x))
+        self.set_rs1(bits(15,19,x))
+        self.set_imm_sext( (bits(20,31,x)<<0), 11 )
+        self.subop = bits(12,14,x)
+        if (self.subop==1) or (self.subop==5): self.immediate = self.immediate & 31
+        if (self.subop==5) and (bits(30,30,x)): self.subop=8 # srai
+        return self
+    def disassemble(self):
+        return "%si %s, %s, %d"%(self.subop_str[self.subop], self.str_rd(), self.str_rs1(), self.immediate)
+
+#c rv_instr_alu
+class rv_instr_alu(rv_instr):
+    bin_mask  = 0x7f
+    bin_value = 0x33
+    subop_str = ["add", "sll", "slt", "sltu", "xor", "srl", "or", "and", "sra", "sub"]
+    def from_binary(self, x):
+        self.set_rd(bits(7,11,x))
+        self.set_rs1(bits(15,19,x))
+        self.set_rs2(bits(20,24,x))
+        self.subop = bits(12,14,x)
+        if (self.subop==0) and (bits(30,30,x)): self.subop=9 # sub
+        if (self.subop==5) and (bits(30,30,x)): self.subop=8 # sra
+        return self
+    def disassemble(self):
+        return "%s %s, %s, %s"%(self.subop_str[self.subop], self.str_rd(), self.str_rs1(), self.str_rs2())
+
+#c rv_instr_muldiv
+class rv_instr_muldiv(rv_instr):
+    bin_mask  = 0xfe00007f
+    bin_value = 0x02000033
+    subop_str = ["mul", "mulh", "mulhsu", "mulhu", "div", "divu", "rem", "remu"]
+    def from_binary(self, x):
+        self.set_rd(bits(7,11,x))
+        self.set_rs1(bits(15,19,x))
+        self.set_rs2(bits(20,24,x))
+        self.subop = bits(12,14,x)
+        return self
+    def disassemble(self):
+        return "%s %s, %s, %s"%(self.subop_str[self.subop], self.str_rd(), self.str_rs1(), self.str_rs2())
+
+#c rv_instr_system
+class rv_instr_system(rv_instr):
+    bin_mask  = 0xfffff
+    bin_value = 0x73
+    syscalls = {0:"ecall", 1:"ebreak", 0x302:"mret", 0x105:"wfi"}
+    def from_binary(self, x):
+        self.sys   = bits(20,31,x)
+        return self
+    def disassemble(self):
+        if self.sys not in self.syscalls: return "sys? %x ?"%self.sys
+        return "%s"%(self.syscalls[self.sys])
+
+#c rv_instr_csr
+class rv_instr_csr(rv_instr):
+    bin_mask  = 0x7f
+    bin_value = 0x73
+    csr_str = ["??", "csrrw", "csrrs", "csrrc", "??", "csrrwi", "csrrsi", "csrrci"]
+    def from_binary(self, x):
+        self.csrop = bits(12,14,x)
+        self.set_rs1(bits(15,19,x))
+        self.set_rd(bits(7,11,x))
+        self.csr   = bits(20,31,x)
+        return self
+    def disassemble(self):
+        if self.csrop>=4:
+            if self.rd==0: return "csrwi %d, 0x%03x"%(self.rs1, self.csr)
+            return "%s %s, %s, 0x%03x"%(self.csr_str[self.csrop], self.str_rd(), self.rs1, self.csr)
+        if self.rd==0: return "csrw %s, 0x%03x"%(self.str_rs1(), self.csr)
+        if (self.csrop==2) and (self.rs1==0):return "csrr %s, 0x%03x"%(self.str_rd(), self.csr)
+        return "%s %s, %s, 0x%03x"%(self.csr_str[self.csrop], self.str_rd(), self.str_rs1(), self.csr)
+
+#c rv_instr_fence
+class rv_instr_fence(rv_instr):
+    bin_mask  = 0x7f
+    bin_value = 0x0f
+    def from_binary(self, x):
+        self.subop = bits(12,14,x)
+        return self
+    def disassemble(self):
+        if self.subop==1: return "fence.i"
+        return "fence"
+
+#c rv_instr_store
+class rv_instr_store(rv_instr):
+    bin_mask  = 0x7f
+    bin_value = 0x23
+    subop_str = ["sb", "sh", "sw", "??"]
+    def from_binary(self, x):
+        self.set_rs1(bits(15,19,x))
+        self.set_rs2(bits(20,24,x))
+        self.subop = bits(12,14,x)
+        self.set_imm_sext( (bits(25,31,x)<<5)|
+                           (bits(7,11,x)<<0), 11 )
+        return self
+    def disassemble(self):
+        return "%s %s, %d(%s)"%(self.subop_str[self.subop], self.str_rs2(), self.immediate, self.str_rs1())
+
+#c rv_instr_load
+class rv_instr_load(rv_instr):
+    bin_mask  = 0x7f
+    bin_value = 0x03
+    subop_str = ["lb", "lh", "lw", "??", "lbu", "lsu", "??", "??"]
+    def from_binary(self, x):
+        self.set_rs1(bits(15,19,x))
+        self.set_rd(bits(7,11,x))
+        self.subop = bits(12,14,x)
+        self.set_imm_sext( (bits(20,31,x)<<0), 11 )
+        return self
+    def disassemble(self):
+        return "%s %s, %d(%s)"%(self.subop_str[self.subop], self.str_rd(), self.immediate, self.str_rs1())
+
+#f add instruction classes
+rv_instr.add_instr_class(rv_instr_lui)
+rv_instr.add_instr_class(rv_instr_auipc)
+rv_instr.add_instr_class(rv_instr_jal)
+rv_instr.add_instr_class(rv_instr_jalr)
+rv_instr.add_instr_class(rv_instr_bcc)
+rv_instr.add_instr_class(rv_instr_alui)
+rv_instr.add_instr_class(rv_instr_alu)
+rv_instr.add_instr_class(rv_instr_muldiv)
+rv_instr.add_instr_class(rv_instr_system)
+rv_instr.add_instr_class(rv_instr_csr)
+rv_instr.add_instr_class(rv_instr_fence)
+rv_instr.add_instr_class(rv_instr_store)
+rv_instr.add_instr_class(rv_instr_load)
+
+#a RV32C expansion
+#f sext
+def sext(v, b):
+    if (v>>(b-1))&1: v -= 1<<b
+    return v
+
+#f encode_r, encode_i, encode_s, encode_b, encode_j, encode_u
+def encode_r(f7, rs2, rs1, f3, rd, op): return (f7<<25) | (rs2<<20) | (rs1<<15) | (f3<<12) | (rd<<7) | op
+def encode_i(imm, rs1, f3, rd, op): return ((imm&0xfff)<<20) | (rs1<<15) | (f3<<12) | (rd<<7) | op
+def encode_s(imm, rs2, rs1, f3, op): return (bits(5,11,imm)<<25) | (rs2<<20) | (rs1<<15) | (f3<<12) | (bits(0,4,imm)<<7) | op
+def encode_b(imm, rs2, rs1, f3):
+    return ( (bits(12,12,imm)<<31) | (bits(5,10,imm)<<25) | (rs2<<20) | (rs1<<15) | (f3<<12) |
+             (bits(1,4,imm)<<8) | (bits(11,11,imm)<<7) | 0x63 )
+def encode_j(imm, rd):
+    return ( (bits(20,20,imm)<<31) | (bits(1,10,imm)<<21) | (bits(11,11,imm)<<20) | (bits(12,19,imm)<<12) |
+             (rd<<7) | 0x6f )
+def encode_u(imm, rd, op): return (imm & 0xfffff000) | (rd<<7) | op
+
+#f rvc_expand
+def rvc_expand(x):
+    """
+    Expand a 16-bit RV32C instruction to its 32-bit equivalent, or return None if it is not valid RV32C
+    """
+    (quadrant, f3) = (x&3, bits(13,15,x))
+    (rd, rs2) = (bits(7,11,x), bits(2,6,x))
+    (rs1p, rdp) = (bits(7,9,x)+8, bits(2,4,x)+8)
+    imm6 = sext((bits(12,12,x)<<5) | bits(2,6,x), 6)
+    shamt = (bits(12,12,x)<<5) | bits(2,6,x)
+    if quadrant==0:
+        mem_imm = (bits(10,12,x)<<3) | (bits(6,6,x)<<2) | (bits(5,5,x)<<6)
+        if f3==0: # c.addi4spn
+            imm = (bits(11,12,x)<<4) | (bits(7,10,x)<<6) | (bits(6,6,x)<<2) | (bits(5,5,x)<<3)
+            if imm==0: return None
+            return encode_i(imm, 2, 0, rdp, 0x13)
+        if f3==2: return encode_i(mem_imm, rs1p, 2, rdp, 0x03)  # c.lw
+        if f3==6: return encode_s(mem_imm, rdp, rs1p, 2, 0x23)  # c.sw
+        return None
+    if quadrant==1:
+        if f3==0: return encode_i(imm6, rd, 0, rd, 0x13) # c.addi
+        if f3 in (1,5): # c.jal, c.j
+            imm = sext( (bits(12,12,x)<<11) | (bits(11,11,x)<<4) | (bits(9,10,x)<<8) | (bits(8,8,x)<<10) |
+                        (bits(7,7,x)<<6) | (bits(6,6,x)<<7) | (bits(3,5,x)<<1) | (bits(2,2,x)<<5), 12 )
+            return encode_j(imm, (f3==1) and 1 or 0)
+        if f3==2: return encode_i(imm6, 0, 0, rd, 0x13) # c.li
+        if f3==3:
+            if rd==2: # c.addi16sp
+                imm = sext( (bits(12,12,x)<<9) | (bits(6,6,x)<<4) | (bits(5,5,x)<<6) |
+                            (bits(3,4,x)<<7) | (bits(2,2,x)<<5), 10 )
+                if imm==0: return None
+                return encode_i(imm, 2, 0, 2, 0x13)
+            imm = sext( (bits(12,12,x)<<17) | (bits(2,6,x)<<12), 18 ) # c.lui
+            if imm==0: return None
+            return encode_u(imm, rd, 0x37)
+        if f3==4:
+            f2 = bits(10,11,x)
+            if f2==0: return encode_i(shamt, rs1p, 5, rs1p, 0x13) # c.srli
+            if f2==1: return encode_i(0x400|shamt, rs1p, 5, rs1p, 0x13) # c.srai
+            if f2==2: return encode_i(imm6, rs1p, 7, rs1p, 0x13) # c.andi
+            if bits(12,12,x): return None
+            (f7, alu_f3) = [(0x20,0), (0,4), (0,6), (0,7)][bits(5,6,x)] # c.sub, c.xor, c.or, c.and
+            return encode_r(f7, rdp, rs1p, alu_f3, rs1p, 0x33)
+        # c.beqz, c.bnez
+        imm = sext( (bits(12,12,x)<<8) | (bits(10,11,x)<<3) | (bits(5,6,x)<<6) |
+                    (bits(3,4,x)<<1) | (bits(2,2,x)<<5), 9 )
+        return encode_b(imm, 0, rs1p, f3-6)
+    if quadrant==2:
+        if f3==0: return encode_i(shamt, rd, 1, rd, 0x13) # c.slli
+        if f3==2: # c.lwsp
+            if rd==0: return None
+            imm = (bits(12,12,x)<<5) | (bits(4,6,x)<<2) | (bits(2,3,x)<<6)
+            return encode_i(imm, 2, 2, rd, 0x03)
+        if f3==4:
+            if not bits(12,12,x):
+                if rs2!=0: return encode_r(0, rs2, 0, 0, rd, 0x33) # c.mv
+                if rd==0: return None
+                return encode_i(0, rd, 0, 0, 0x67) # c.jr
+            if rs2!=0: return encode_r(0, rs2, rd, 0, rd, 0x33) # c.add
+            if rd==0: return 0x00100073 # c.ebreak
+            return encode_i(0, rd, 0, 1, 0x67) # c.jalr
+        if f3==6: # c.swsp
+            imm = (bits(9,12,x)<<2) | (bits(7,8,x)<<6)
+            return encode_s(imm, rs2, 2, 2, 0x23)
+        return None
+    return None
+
+#a Decoder
+#c rv_decoder
+class rv_decoder(object):
+    """
+    Memoising decoder; decode() and disassemble() return the shared
+    decode of an instruction word, which is cached along with its
+    disassembly.
+
+    The cache is a two-generation LRU holding up to cache_size entries:
+    entries are added to the current generation, which replaces the old
+    generation when full, and hits in the old generation are moved to
+    the current one. Hits are a single dictionary lookup, and words
+    unused for a whole generation are dropped.
+
+    Only pc-relative instructions (jumps and branches) are cached per pc,
+    so the pc of other decoded instructions is that of their first use.
+    """
+    #f __init__
+    def __init__(self, cache_size=4096):
+        self.generation_size = max(1, cache_size/2)
+        self.cache = {}
+        self.old_cache = {}
+        self.relative_opcodes = [False]*128
+        for instr_classes in rv_instr.decode_table:
+            for (mask,value,mk_inst) in instr_classes:
+                if mk_inst(0,value).pc_relative: self.relative_opcodes[value & 0x7f] = True
+                pass
+            pass
+        pass
+    #f lookup
+    def lookup(self, pc, x):
+        """
+        Return (decoded instruction, disassembly) for the instruction word x at pc
+        """
+        if (x&3)==3:
+            relative = self.relative_opcodes[x & 0x7f]
+            pass
+        else:
+            x = x & 0xffff
+            relative = ((x&3)==1) and (bits(13,15,x) in (1,5,6,7))
+            pass
+        key = x
+        if relative: key = (x, pc)
+        entry = self.cache.get(key)
+        if entry is not None: return entry
+        entry = self.old_cache.get(key)
+        if entry is None:
+            instr = rv_instr.from_binary(pc, x)
+            text = instr.disassemble()
+            if instr.size==2: text = "c."+text
+            entry = (instr, text)
+            pass
+        if len(self.cache)>=self.generation_size:
+            self.old_cache = self.cache
+            self.cache = {}
+            pass
+        self.cache[key] = entry
+        return entry
+    #f decode
+    def decode(self, pc, x):
+        return self.lookup(pc, x)[0]
+    #f disassemble
+    def disassemble(self, pc, x):
+        return self.lookup(pc, x)[1]
@@ -1,43 +1,43 @@
 #!/usr/bin/env python
 
-import csv
+from rv_itrace import c_itrace_log
 
+import sys
 import argparse
 
-parser = argparse.ArgumentParser(description='Display execution trace of RV simulation')
-parser.add_argument('--logfile', type=str, default='itrace.log',
-                    help='logfile to parse')
-parser.add_argument('--module', type=str, default="dut.trace",
-                    help='module to show trace of')
-
-args = parser.parse_args()
-
-csvfile = open("itrace.log", "rb")
-trace = csv.reader(csvfile, delimiter=',', quotechar='"')
-for row in trace:
-    if (row[2]==args.module):
-        if False: # branch + trap flow
-            if (row[3] == '0'): #timestamp,id,dut.trace,0="PC",7,"pc","branch_taken","trap","ret","jalr","branch_target","instr"
-
-                pc = int(row[5])
-                branch_taken = row[6]
-                trap         = row[7]
-                ret          = row[8]
-                jalr         = row[9]
-                print "%08x %d %d %d %d"%(pc,branch_taken,trap,ret,jalr)
-                pass
+#a Flow
+#f write_flow
+def write_flow(f, logfile, module="dut.trace", branches=False):
+    """
+    Write the register write retirement flow of a log ('rd data' in hex),
+    or its branch and trap flow ('pc branch_taken trap ret jalr'),
+    returning a summary of it
+    """
+    summary = {"instructions":0, "register_writes":0, "first_time":None, "last_time":None}
+    for (timestamp, pc, flow, instr, rfw) in c_itrace_log(logfile, module=module):
+        if summary["first_time"] is None: summary["first_time"] = timestamp
+        summary["last_time"] = timestamp
+        if pc is not None: summary["instructions"] += 1
+        if rfw is not None: summary["register_writes"] += 1
+        if branches:
+            if pc is None: continue
+            print >>f, "%08x %d %d %d %d"%(pc, (flow>>0)&1, (flow>>2)&1, (flow>>3)&1, (flow>>1)&1)
             pass
-        else: # rfw retirement flow
-            if (row[3] == '1') and (row[5] == '1'): #timestamp,id,dut.trace,1="retire",3,"rfw","rd","data"
-                rfw_rd   = row[6]
-                rfw_data = row[7]
-                print rfw_rd, rfw_data
-                pass
+        elif rfw is not None:
+            print >>f, "%x %x"%rfw
             pass
         pass
+    return summary
+
+#a Toplevel
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Display execution flow of RV simulation')
+    parser.add_argument('--logfile', type=str, default='itrace.log',
+                        help='logfile to parse')
+    parser.add_argument('--module', type=str, default="dut.trace",
+                        help='module to show trace of')
+    parser.add_argument('--branches', action='store_true', default=False,
+                        help='show branch and trap flow rather than register writes')
+    args = parser.parse_args()
+    write_flow(sys.stdout, args.logfile, module=args.module, branches=args.branches)
     pass
-
-
-
-        
-
@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+"""
+Functional RV32IMC instruction set simulator for golden traces
+
+The simulator executes a test image loaded through dump.c_dump (from a
+dump, ELF or MIF file, as the riscv_minimal regression does) and
+generates the (time, mode, pc, instruction) entries of a riscv_trace
+golden trace, with the retired instruction count as the time. It
+models the machine-mode-only cores: the CSRs their decode accepts,
+exceptions to mtvec and mret. Instructions that take an exception other
+than ecall and ebreak are not traced, as with the checker, and mtval is
+set as the cores set it. The pipeline3 cores do not trap accesses to
+unimplemented CSRs (such as satp and pmpaddr0 in the riscv-tests
+prologue), which --no_csr_traps models. There are no interrupts,
+devices or custom instructions.
+
+A test ends when it writes to 'tohost', as the memory_expectation of
+the regression checks; a value of 1 is a pass.
+
+Generating traces: rv_iss.py --trace_dir riscv_trace/ test.dump...
+"""
+#a Imports
+import os
+import sys
+import dump
+from rv_decode import rv_decoder, rv_instr
+from rv_decode import rv_instr_lui, rv_instr_auipc, rv_instr_jal, rv_instr_jalr, rv_instr_bcc
+from rv_decode import rv_instr_alui, rv_instr_alu, rv_instr_muldiv, rv_instr_system, rv_instr_csr
+from rv_decode import rv_instr_fence, rv_instr_store, rv_instr_load
+from rv_tracefile import write_binary_trace, write_text_trace
+
+#a Constants
+MODE_MACHINE = 3
+
+MCAUSE_INSTRUCTION_MISALIGNED = 0
+MCAUSE_ILLEGAL_INSTRUCTION    = 2
+MCAUSE_BREAKPOINT             = 3
+MCAUSE_LOAD_MISALIGNED        = 4
+MCAUSE_STORE_MISALIGNED       = 6
+MCAUSE_MACHINE_ECALL          = 11
+
+CSR_MSTATUS   = 0x300
+CSR_MISA      = 0x301
+CSR_MEDELEG   = 0x302
+CSR_MIDELEG   = 0x303
+CSR_MIE       = 0x304
+CSR_MTVEC     = 0x305
+CSR_MSCRATCH  = 0x340
+CSR_MEPC      = 0x341
+CSR_MCAUSE    = 0x342
+CSR_MTVAL     = 0x343
+CSR_MIP       = 0x344
+CSR_MCYCLE    = 0xb00
+CSR_MINSTRET  = 0xb02
+CSR_MCYCLEH   = 0xb80
+CSR_MINSTRETH = 0xb82
+CSR_MVENDORID = 0xf11
+CSR_MARCHID   = 0xf12
+CSR_MIMPID    = 0xf13
+CSR_MHARTID   = 0xf14
+CSR_DCSR      = 0x7b0
+CSR_DEPC      = 0x7b1
+CSR_DSCRATCH0 = 0x7b2
+CSR_DSCRATCH1 = 0x7b3
+
+MSTATUS_MIE  = 1<<3
+MSTATUS_MPIE = 1<<7
+MSTATUS_MPP  = 3<<11
+
+#f signed
+def signed(v):
+    if v & 0x80000000: return v-(1<<32)
+    return v
+
+#c c_rv_trap
+class c_rv_trap(Exception):
+    """
+    Exception taken by an instruction; traced is True if the instruction is still traced (ecall, ebreak)
+    """
+    def __init__(self, cause, tval=0, traced=False):
+        self.cause = cause
+        self.tval = tval
+        self.traced = traced
+        pass
+    pass
+
+#a Simulator
+#c c_rv_iss
+class c_rv_iss(object):
+    """
+    Functional simulator of a RISC-V core executing a c_dump image from address 0
+    """
+    #f __init__
+    def __init__(self, image, compressed=True, muldiv=True, csr_traps=True, hartid=0):
+        self.memory = dict(image.data)
+        self.compressed = compressed
+        self.muldiv = muldiv
+        self.csr_traps = csr_traps
+        self.decoder = rv_decoder()
+        self.regs = [0]*32
+        self.pc = 0
+        self.instret = 0
+        self.tohost = image.labels.get("tohost")
+        self.tohost_value = None
+        misa = (1<<30) | (1<<8)
+        if compressed: misa |= 1<<2
+        if muldiv: misa |= 1<<12
+        self.csrs = {CSR_MSTATUS:MSTATUS_MPP, CSR_MISA:misa, CSR_MEDELEG:0, CSR_MIDELEG:0, CSR_MIE:0,
+                     CSR_MTVEC:0, CSR_MSCRATCH:0, CSR_MEPC:0, CSR_MCAUSE:0, CSR_MTVAL:0, CSR_MIP:0,
+                     CSR_MVENDORID:0, CSR_MARCHID:0, CSR_MIMPID:0, CSR_MHARTID:hartid,
+                     CSR_DCSR:0, CSR_DEPC:0, CSR_DSCRATCH0:0, CSR_DSCRATCH1:0}
+        # Bits of each CSR that are writable
+        self.csr_write_masks = {CSR_MSTATUS:MSTATUS_MIE|MSTATUS_MPIE, CSR_MISA:0, CSR_MEDELEG:0, CSR_MIDELEG:0,
+                                CSR_MIE:0x888, CSR_MTVEC:0xfffffffd, CSR_MEPC:0xfffffffe, CSR_MIP:0}
+        if not compressed: self.csr_write_masks[CSR_MEPC] = 0xfffffffc
+        self.execute = {rv_instr_lui:self.execute_lui, rv_instr_auipc:self.execute_auipc,
+                        rv_instr_jal:self.execute_jal, rv_instr_jalr:self.execute_jalr,
+                        rv_instr_bcc:self.execute_bcc, rv_instr_alui:self.execute_alui,
+                        rv_instr_alu:self.execute_alu, rv_instr_muldiv:self.execute_muldiv,
+                        rv_instr_system:self.execute_system, rv_instr_csr:self.execute_csr,
+                        rv_instr_fence:self.execute_fence, rv_instr_store:self.execute_store,
+                        rv_instr_load:self.execute_load}
+        pass
+    #f fetch
+    def fetch(self, pc):
+        """
+        Return the 32 bits at a halfword-aligned pc, as traced
+        """
+        address = pc>>2
+        if pc & 2:
+            return (self.memory.get(address,0)>>16) | ((self.memory.get(address+1,0)&0xffff)<<16)
+        return self.memory.get(address,0)
+    #f load
+    def load(self, address, size):
+        if address & (size-1): raise c_rv_trap(MCAUSE_LOAD_MISALIGNED, address)
+        data = self.memory.get(address>>2,0) >> (8*(address&3))
+        return data & ((1<<(8*size))-1)
+    #f store
+    def store(self, address, size, data):
+        if address & (size-1): raise c_rv_trap(MCAUSE_STORE_MISALIGNED, address)
+        shift = 8*(address&3)
+        mask = ((1<<(8*size))-1) << shift
+        word = self.memory.get(address>>2,0)
+        self.memory[address>>2] = (word & ~mask) | ((data<<shift) & mask)
+        if address==self.tohost: self.tohost_value = data & ((1<<(8*size))-1)
+        pass
+    #f set_rd
+    def set_rd(self, rd, value):
+        if rd!=0: self.regs[rd] = value & 0xffffffff
+        pass
+    #f jump
+    def jump(self, target):
+        target &= 0xffffffff
+        # The cores leave mtval as zero for a misaligned jump
+        if (target & 2) and not self.compressed: raise c_rv_trap(MCAUSE_INSTRUCTION_MISALIGNED)
+        return target
+    #f execute_lui
+    def execute_lui(self, i, pc):
+        self.set_rd(i.rd, i.immediate)
+        return pc+i.size
+    #f execute_auipc
+    def execute_auipc(self, i, pc):
+        self.set_rd(i.rd, pc+i.immediate)
+        return pc+i.size
+    #f execute_jal
+    def execute_jal(self, i, pc):
+        target = self.jump(pc+i.immediate)
+        self.set_rd(i.rd, pc+i.size)
+        return target
+    #f execute_jalr
+    def execute_jalr(self, i, pc):
+        target = self.jump((self.regs[i.rs1]+i.immediate) & ~1)
+        self.set_rd(i.rd, pc+i.size)
+        return target
+    #f execute_bcc
+    def execute_bcc(self, i, pc):
+        (a, b) = (self.regs[i.rs1], self.regs[i.rs2])
+        cc = i.cc
+        if   cc==0: taken = (a==b)
+        elif cc==1: taken = (a!=b)
+        elif cc==4: taken = (signed(a)<signed(b))
+        elif cc==5: taken = (signed(a)>=signed(b))
+        elif cc==6: taken = (a<b)
+        elif cc==7: taken = (a>=b)
+        else: raise c_rv_trap(MCAUSE_ILLEGAL_INSTRUCTION)
+        if taken: return self.jump(pc+i.immediate)
+        return pc+i.size
+    #f alu_op
+    def alu_op(self, subop, a, b):
+        if   subop==0: return a+b
+        elif subop==1: return a<<(b&31)
+        elif subop==2: return int(signed(a)<signed(b))
+        elif subop==3: return int(a<b)
+        elif subop==4: return a^b
+        elif subop==5: return a>>(b&31)
+        elif subop==6: return a|b
+        elif subop==7: return a&b
+        elif subop==8: return signed(a)>>(b&31)
+        return a-b
+    #f execute_alui
+    def execute_alui(self, i, pc):
+        self.set_rd(i.rd, self.alu_op(i.subop, self.regs[i.rs1], i.immediate & 0xffffffff))
+        return pc+i.size
+    #f execute_alu
+    def execute_alu(self, i, pc):
+        self.set_rd(i.rd, self.alu_op(i.subop, self.regs[i.rs1], self.regs[i.rs2]))
+        return pc+i.size
+    #f execute_muldiv
+    def execute_muldiv(self, i, pc):
+        if not self.muldiv: raise c_rv_trap(MCAUSE_ILLEGAL_INSTRUCTION)
+        (a, b) = (self.regs[i.rs1], self.regs[i.rs2])
+        subop = i.subop
+        if   subop==0: r = a*b
+        elif subop==1: r = (signed(a)*signed(b))>>32
+        elif subop==2: r = (signed(a)*b)>>32
+        elif subop==3: r = (a*b)>>32
+        elif subop in (4,6): # div, rem
+            (sa, sb) = (signed(a), signed(b))
+            if sb==0: (q, m) = (-1, sa)
+            else:
+                q = abs(sa)//abs(sb)
+                if (sa<0)!=(sb<0): q = -q
+                m = sa-q*sb
+                pass
+            if subop==4: r = q
+            else: r = m
+            pass
+        else: # divu, remu
+            if b==0: (q, m) = (0xffffffff, a)
+            else: (q, m) = (a//b, a%b)
+            if subop==5: r = q
+            else: r = m
+            pass
+        self.set_rd(i.rd, r)
+        return pc+i.size
+    #f execute_system
+    def execute_system(self, i, pc):
+        if i.sys==0: raise c_rv_trap(MCAUSE_MACHINE_ECALL, traced=True)
+        if i.sys==1: raise c_rv_trap(MCAUSE_BREAKPOINT, pc, traced=True)
+        if i.sys==0x105: return pc+i.size # wfi
+        if i.sys==0x302: # mret
+            mstatus = self.csrs[CSR_MSTATUS] & ~MSTATUS_MIE
+            if mstatus & MSTATUS_MPIE: mstatus |= MSTATUS_MIE
+            self.csrs[CSR_MSTATUS] = mstatus | MSTATUS_MPIE
+            return self.csrs[CSR_MEPC]
+        raise c_rv_trap(MCAUSE_ILLEGAL_INSTRUCTION)
+    #f read_csr
+    def read_csr(self, csr):
+        if csr in (CSR_MCYCLE, CSR_MINSTRET):   return self.instret & 0xffffffff
+        if csr in (CSR_MCYCLEH, CSR_MINSTRETH): return (self.instret>>32) & 0xffffffff
+        if csr not in self.csrs:
+            if self.csr_traps: raise c_rv_trap(MCAUSE_ILLEGAL_INSTRUCTION)
+            return 0
+        return self.csrs[csr]
+    #f write_csr
+    def write_csr(self, csr, value):
+        if (csr>>10)==3: raise c_rv_trap(MCAUSE_ILLEGAL_INSTRUCTION)
+        if csr in (CSR_MCYCLE, CSR_MINSTRET, CSR_MCYCLEH, CSR_MINSTRETH): return
+        if csr not in self.csrs: return
+        mask = self.csr_write_masks.get(csr, 0xffffffff)
+        self.csrs[csr] = (self.csrs[csr] & ~mask) | (value & mask)
+        pass
+    #f execute_csr
+    def execute_csr(self, i, pc):
+        csrop = i.csrop
+        if csrop in (0,4): raise c_rv_trap(MCAUSE_ILLEGAL_INSTRUCTION)
+        value = i.rs1
+        if csrop<4: value = self.regs[i.rs1]
+        old = self.read_csr(i.csr)
+        csrop &= 3
+        if csrop==1: self.write_csr(i.csr, value)
+        elif i.rs1!=0:
+            if csrop==2: self.write_csr(i.csr, old | value)
+            else:        self.write_csr(i.csr, old & ~value)
+            pass
+        self.set_rd(i.rd, old)
+        return pc+i.size
+    #f execute_fence
+    def execute_fence(self, i, pc):
+        return pc+i.size
+    #f execute_store
+    def execute_store(self, i, pc):
+        size = (1,2,4,0)[i.subop & 3]
+        if (i.subop>2): raise c_rv_trap(MCAUSE_ILLEGAL_INSTRUCTION)
+        self.store((self.regs[i.rs1]+i.immediate) & 0xffffffff, size, self.regs[i.rs2])
+        return pc+i.size
+    #f execute_load
+    def execute_load(self, i, pc):
+        subop = i.subop
+        if subop not in (0,1,2,4,5): raise c_rv_trap(MCAUSE_ILLEGAL_INSTRUCTION)
+        size = 1<<(subop&3)
+        data = self.load((self.regs[i.rs1]+i.immediate) & 0xffffffff, size)
+        if (subop<2) and (data>>(8*size-1)): data -= 1<<(8*size)
+        self.set_rd(i.rd, data)
+        return pc+i.size
+    #f trap
+    def trap(self, pc, trap):
+        mstatus = self.csrs[CSR_MSTATUS] & ~(MSTATUS_MIE|MSTATUS_MPIE)
+        if self.csrs[CSR_MSTATUS] & MSTATUS_MIE: mstatus |= MSTATUS_MPIE
+        self.csrs[CSR_MSTATUS] = mstatus
+        self.csrs[CSR_MEPC]   = pc
+        self.csrs[CSR_MCAUSE] = trap.cause
+        self.csrs[CSR_MTVAL]  = trap.tval & 0xffffffff
+        return self.csrs[CSR_MTVEC] & ~3
+    #f step
+    def step(self):
+        """
+        Execute one instruction, returning its (pc, instruction) if it is traced, else None
+        """
+        pc = self.pc
+        instruction = self.fetch(pc)
+        i = self.decoder.decode(pc, instruction)
+        traced = True
+        try:
+            if (i.size==2) and not self.compressed: raise c_rv_trap(MCAUSE_ILLEGAL_INSTRUCTION)
+            execute = self.execute.get(i.__class__)
+            if execute is None: raise c_rv_trap(MCAUSE_ILLEGAL_INSTRUCTION)
+            self.pc = execute(i, pc) & 0xffffffff
+            pass
+        except c_rv_trap, trap:
+            if trap.cause==MCAUSE_ILLEGAL_INSTRUCTION: trap.tval = instruction
+            self.pc = self.trap(pc, trap)
+            traced = trap.traced
+            pass
+        if not traced: return None
+        self.instret += 1
+        return (pc, instruction)
+    #f run
+    def run(self, max_instructions=1000000):
+        """
+        Generate trace entries (time, mode, pc, instruction) until the test writes tohost
+        """
+        while (self.instret<max_instructions) and (self.tohost_value is None):
+            executed = self.step()
+            if executed is not None:
+                yield (self.instret, MODE_MACHINE, executed[0], executed[1])
+                pass
+            pass
+        pass
+    pass
+
+#a Toplevel
+#f load_image
+def load_image(filename):
+    """
+    Load a test image as riscv_minimal does, preferring the ELF file alongside a .dump file
+    """
+    image = dump.c_dump()
+    if filename.endswith(".mif"):
+        f = open(filename)
+        image.load_mif(f, 0, address_mask=0x7fffffff)
+        f.close()
+        return image
+    if filename.endswith(".dump") and os.path.exists(filename[:-5]):
+        f = open(filename[:-5], "rb")
+        image.load_elf(f, 0, address_mask=0x7fffffff)
+        f.close()
+        return image
+    f = open(filename)
+    image.load(f, 0, address_mask=0x7fffffff)
+    f.close()
+    return image
+
+#f main
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Generate RISC-V golden traces with a functional simulator')
+    parser.add_argument('images', type=str, nargs='+',
+                        help='test dump, ELF or MIF files')
+    parser.add_argument('--trace_dir', type=str, default='riscv_trace/',
+                        help='directory to write <test>.trace files to')
+    parser.add_argument('--text', action='store_true', default=False,
+                        help='write text rather than binary traces')
+    parser.add_argument('--max_instructions', type=int, default=1000000,
+                        help='maximum instructions to simulate per test')
+    parser.add_argument('--no_compressed', action='store_true', default=False,
+                        help='make compressed instructions illegal')
+    parser.add_argument('--no_muldiv', action='store_true', default=False,
+                        help='make multiply and divide instructions illegal')
+    parser.add_argument('--no_csr_traps', action='store_true', default=False,
+                        help='ignore accesses to unimplemented CSRs rather than trapping')
+    args = parser.parse_args()
+    failures = 0
+    for filename in args.images:
+        test_name = os.path.splitext(os.path.basename(filename))[0]
+        iss = c_rv_iss(load_image(filename), compressed=not args.no_compressed, muldiv=not args.no_muldiv, csr_traps=not args.no_csr_traps)
+        entries = list(iss.run(args.max_instructions))
+        trace_filename = os.path.join(args.trace_dir, test_name+".trace")
+        if args.text:
+            write_text_trace(trace_filename, entries)
+            pass
+        else:
+            write_binary_trace(trace_filename, entries)
+            pass
+        result = "passed"
+        if iss.tohost_value!=1:
+            result = "FAILED (tohost %s)"%str(iss.tohost_value)
+            failures += 1
+            pass
+        print "%s: %d instructions, %s"%(test_name, len(entries), result)
+        pass
+    if failures>0: sys.exit(1)
+    pass
+
+if __name__=="__main__":
+    main()
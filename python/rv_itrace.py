@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+"""
+Streaming reader for RISC-V instruction trace logs (itrace.log)
+
+The log is written by the CDL logger for the riscv_i32_trace module as
+CSV rows of 'timestamp,id,module,event,num_args,args...', with the
+arguments in hex. Event 0 is "PC" (pc, branch_taken, trap, ret, jalr,
+branch_target, instr) and event 1 is "retire" (rfw, rd, data); rows
+starting with '#' that declare events as 'n="reason"' override this.
+
+The reader is a generator over the file, so memory use is bounded by a
+single timestamp's events whatever the length of the run, and it can
+follow a log that is still being written. It may start part way
+through the log, at an offset given by its index (see rv_traceindex).
+Binary logs (see rv_binlog) are also read, selecting the module's
+events from the log at once; they are not indexed, and start part way
+through at the offset of a record (see c_binary_log.offset_for_time).
+"""
+#a Imports
+import time
+
+#a Log events
+# Event reasons in the order riscv_i32_trace logs them
+default_reasons = {0:"PC", 1:"retire"}
+# Magic at the start of a binary log (see rv_binlog, which needs NumPy to read one)
+binary_log_magic = "RVLOG\0\0\0"
+
+#f is_binary_log
+def is_binary_log(filename):
+    f = open(filename, "rb")
+    magic = f.read(len(binary_log_magic))
+    f.close()
+    return magic==binary_log_magic
+
+#f log_lines
+def log_lines(f, follow=False, poll_interval=0.1):
+    """
+    Generate complete lines of a log file; if following, wait at the end
+    of the file for more to be written rather than stopping, generating
+    None each time the end is reached
+    """
+    if not follow:
+        for l in f: yield l
+        return
+    partial = ""
+    while True:
+        l = f.readline()
+        if l=="":
+            yield None
+            time.sleep(poll_interval)
+            continue
+        if l[-1]!="\n":
+            partial += l
+            continue
+        yield partial+l
+        partial = ""
+        pass
+    pass
+
+#c c_itrace_log
+class c_itrace_log(object):
+    """
+    An instruction trace log for one trace module
+
+    Iterating yields (timestamp, pc, flow, instr, rfw) in log order: a PC
+    event gives its pc, flow bits (trap<<2|ret<<3|jalr<<1|branch_taken)
+    and instruction, with rfw (rd, data) for a register write retired at
+    the same timestamp (else None); a register write with no PC event at
+    its timestamp gives pc, flow and instr of None.
+    """
+    #f __init__
+    def __init__(self, filename, module="dut.trace", follow=False, poll_interval=0.1, start_offset=0):
+        self.filename = filename
+        self.module = module
+        self.follow = follow
+        self.poll_interval = poll_interval
+        self.start_offset = start_offset
+        self.reasons = dict(default_reasons)
+        pass
+    #f declare_reason
+    def declare_reason(self, row):
+        if "=" in row[3]:
+            (event, reason) = row[3].split("=",1)
+            self.reasons[int(event)] = reason.strip('" ')
+            pass
+        pass
+    #f events
+    def events(self):
+        """
+        Generate (timestamp, reason, args) for each event of the module,
+        and None whenever a followed log has no more events yet
+        """
+        if is_binary_log(self.filename):
+            for e in self.binary_events(): yield e
+            return
+        f = open(self.filename, "rb")
+        try:
+            if self.start_offset>0:
+                # Declarations of event reasons are at the start of the log
+                for l in f:
+                    if not l.startswith("#"): break
+                    row = l.rstrip().split(",")
+                    if len(row)>=5: self.declare_reason(row)
+                    pass
+                f.seek(self.start_offset)
+                pass
+            for l in log_lines(f, self.follow, self.poll_interval):
+                if l is None:
+                    yield None
+                    continue
+                row = l.rstrip().split(",")
+                if len(row)<5: continue
+                if row[0].startswith("#"):
+                    self.declare_reason(row)
+                    continue
+                if row[2].strip('" ')!=self.module: continue
+                event = int(row[3])
+                args = [int(a,16) for a in row[5:5+int(row[4])]]
+                yield (int(row[0]), self.reasons.get(event,event), args)
+                pass
+            pass
+        finally:
+            f.close()
+            pass
+        pass
+    #f binary_events
+    def binary_events(self):
+        """
+        Generate (timestamp, reason, args) for each event of the module in a
+        binary log, from the record at the start offset if it is given
+        """
+        from rv_binlog import c_binary_log
+        log = c_binary_log(self.filename)
+        first = 0
+        if self.start_offset>0: first = log.record_at_offset(self.start_offset)
+        records = log.records[first:][log.mask(module=self.module)[first:]]
+        module_index = log.module_index(self.module)
+        reasons = dict([(e, log.reason(module_index, e)) for e in set(records["event"].tolist())])
+        for (timestamp, event, num_args, args) in zip(records["timestamp"].tolist(), records["event"].tolist(),
+                                                      records["num_args"].tolist(), records["args"].tolist()):
+            yield (timestamp, reasons[event], args[:num_args])
+            pass
+        pass
+    #f __iter__
+    def __iter__(self):
+        pcs = []
+        rfws = []
+        timestamp = None
+        for event in self.events():
+            # The events of the latest timestamp may not all be written
+            # yet, so they are kept across polls of a followed log
+            if event is None: continue
+            (event_timestamp, reason, args) = event
+            if event_timestamp!=timestamp:
+                for r in self.merge(timestamp, pcs, rfws): yield r
+                timestamp = event_timestamp
+                pcs = []
+                rfws = []
+                pass
+            if reason=="PC":
+                (pc, branch_taken, trap, ret, jalr) = args[:5]
+                flow = ( (trap<<2) | (ret<<3) | (jalr<<1) | (branch_taken<<0) )
+                pcs.append((pc, flow, args[6]))
+                pass
+            elif reason=="retire":
+                if args[0]: rfws.append((args[1], args[2]))
+                pass
+            pass
+        for r in self.merge(timestamp, pcs, rfws): yield r
+        pass
+    #f merge
+    def merge(self, timestamp, pcs, rfws):
+        """
+        Generate the records for the PC and register write events of one timestamp
+        """
+        for (i, (pc, flow, instr)) in enumerate(pcs):
+            rfw = None
+            if i<len(rfws): rfw = rfws[i]
+            yield (timestamp, pc, flow, instr, rfw)
+            pass
+        for rfw in rfws[len(pcs):]:
+            yield (timestamp, None, None, None, rfw)
+            pass
+        pass
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+"""
+Symbolised pc hot-spot profiler for RISC-V simulation traces
+
+A golden trace (.trace, text or binary) or an instruction trace log
+(itrace.log) is folded into a profile of instructions and cycles per
+function and per basic block, using the labels of the program's dump,
+MIF or ELF file as collected by dump.c_dump. The function of a pc is
+the nearest label at or below it.
+
+The cycles of an instruction are the time until the next instruction
+retires, in clock periods (the smallest time between two instructions
+unless given). Basic blocks are found from the trace: a block ends at
+a branch, jump or system instruction, or where execution does not
+continue sequentially.
+
+A shadow call stack is kept to give collapsed stacks for flamegraph
+tools, one 'caller;...;function cycles' line per stack: jal and jalr
+that link to ra or t0 are calls, jalr through ra or t0 without linking
+is a return, and a trap is a call of its handler that mret returns
+from.
+
+Profiling firmware: rv_profile.py --elf c_dprintf itrace.log --collapsed c_dprintf.folded
+"""
+#a Imports
+import sys
+import bisect
+import elftools.elf.elffile
+import dump
+from rv_tracefile import read_trace
+from rv_itrace import c_itrace_log
+from rv_decode import rv_decoder
+from rv_decode import rv_instr_jal, rv_instr_jalr, rv_instr_bcc, rv_instr_system
+
+#a Symbols
+#c c_symbol_table
+class c_symbol_table(object):
+    """
+    Sorted index of the labels of a c_dump for mapping addresses to functions
+    """
+    #f __init__
+    def __init__(self, labels={}):
+        by_address = {}
+        for (l,a) in labels.iteritems():
+            if l=="": continue
+            # Prefer labels that are not local (.L*) or mapping ($x) symbols
+            local = l.startswith(".") or l.startswith("$")
+            if (a not in by_address) or ((local, l) < by_address[a]):
+                by_address[a] = (local, l)
+                pass
+            pass
+        self.addresses = sorted(by_address.keys())
+        self.labels = [by_address[a][1] for a in self.addresses]
+        pass
+    #f lookup
+    def lookup(self, address):
+        """
+        Return (label, offset) of the nearest label at or below the address, or (None, address) if there is none
+        """
+        i = bisect.bisect_right(self.addresses, address)-1
+        if i<0: return (None, address)
+        return (self.labels[i], address-self.addresses[i])
+    #f function
+    def function(self, address):
+        (label, offset) = self.lookup(address)
+        if label is None: return "?"
+        return label
+    #f describe
+    def describe(self, address):
+        (label, offset) = self.lookup(address)
+        if label is None: return "0x%08x"%address
+        if offset==0: return label
+        return "%s+0x%x"%(label, offset)
+    pass
+
+#f load_labels
+def load_labels(filename, kind, base_address=0, address_mask=0xffffffff):
+    """
+    Return the labels of a dump, MIF or ELF file; only the symbol table of an ELF file is read
+    """
+    d = dump.c_dump()
+    if kind=="elf":
+        f = open(filename, "rb")
+        elf = elftools.elf.elffile.ELFFile(f)
+        for section in elf.iter_sections():
+            if section.header.sh_type!='SHT_SYMTAB': continue
+            for s in section.iter_symbols():
+                d.add_label(s.name, s.entry.st_value, base_address, address_mask)
+                pass
+            pass
+        f.close()
+        return d.labels
+    f = open(filename)
+    if kind=="mif":
+        d.load_mif(f, base_address, address_mask)
+        pass
+    else:
+        d.load(f, base_address, address_mask)
+        pass
+    f.close()
+    return d.labels
+
+#a Trace input
+#f trace_instructions
+def trace_instructions(filename, module="dut.trace"):
+    """
+    Generate (time, pc, instruction) for the retired instructions of a .trace file or itrace.log
+    """
+    if filename.endswith(".log"):
+        for (timestamp, pc, flow, instr, rfw) in c_itrace_log(filename, module):
+            if pc is not None: yield (timestamp, pc, instr)
+            pass
+        return
+    for (time, mode, pc, instruction) in read_trace(filename):
+        yield (time, pc, instruction)
+        pass
+    pass
+
+#a Profile
+#c c_profile_entry
+class c_profile_entry(object):
+    """
+    Instructions executed and time spent in a function or basic block
+    """
+    #f __init__
+    def __init__(self):
+        self.instructions = 0
+        self.time = 0
+        self.executions = 0
+        pass
+    pass
+
+#c c_profile
+class c_profile(object):
+    """
+    Profile of a trace by function, basic block and call stack, with time in trace units
+    """
+    #f __init__
+    def __init__(self, symbols=None, decoder=None):
+        if symbols is None: symbols = c_symbol_table()
+        if decoder is None: decoder = rv_decoder()
+        self.symbols = symbols
+        self.decoder = decoder
+        self.functions = {}
+        self.blocks = {}
+        self.stacks = {}
+        self.instructions = 0
+        self.time = 0
+        self.min_delta = None
+        pass
+    #f add_trace
+    def add_trace(self, instructions):
+        """
+        Add the (time, pc, instruction) of each retired instruction of a trace
+        """
+        stack = []
+        block = None
+        pending = None
+        for (time, pc, instruction) in instructions:
+            if pending is not None:
+                (last_time, last_pc, last_instr, last_block, last_stack) = pending
+                delta = time - last_time
+                self.account(last_pc, last_block, last_stack, delta)
+                if (delta>0) and ((self.min_delta is None) or (delta<self.min_delta)): self.min_delta = delta
+                (block, stack) = self.follow(last_pc, last_instr, last_block, stack, pc)
+                pass
+            if block is None: block = pc
+            function = self.symbols.function(pc)
+            if len(stack)==0: stack = [function]
+            elif stack[-1]!=function: stack = stack[:-1]+[function]
+            if block not in self.blocks: self.blocks[block] = c_profile_entry()
+            if block==pc: self.blocks[block].executions += 1
+            pending = (time, pc, instruction, block, tuple(stack))
+            pass
+        if pending is not None:
+            # The last instruction is taken to retire in one clock period
+            (last_time, last_pc, last_instr, last_block, last_stack) = pending
+            self.account(last_pc, last_block, last_stack, self.min_delta or 1)
+            pass
+        pass
+    #f account
+    def account(self, pc, block, stack, delta):
+        function = stack[-1]
+        if function not in self.functions: self.functions[function] = c_profile_entry()
+        for e in (self.functions[function], self.blocks[block]):
+            e.instructions += 1
+            e.time += delta
+            pass
+        self.stacks[stack] = self.stacks.get(stack,0) + delta
+        self.instructions += 1
+        self.time += delta
+        pass
+    #f follow
+    def follow(self, pc, instruction, block, stack, next_pc):
+        """
+        Return the (block, call stack) for the instruction at next_pc following one at pc
+        """
+        i = self.decoder.decode(pc, instruction)
+        sequential = (next_pc==pc+i.size)
+        if sequential and i.__class__ not in (rv_instr_bcc, rv_instr_jal, rv_instr_jalr, rv_instr_system):
+            return (block, stack)
+        links = (1, 5)
+        if i.__class__ in (rv_instr_jal, rv_instr_jalr) and (i.rd in links):
+            stack = stack+[None]
+            pass
+        elif (i.__class__==rv_instr_jalr) and (i.rd==0) and (i.rs1 in links):
+            if len(stack)>1: stack = stack[:-1]
+            pass
+        elif (i.__class__==rv_instr_system) and (i.sys==0x302):
+            if len(stack)>1: stack = stack[:-1]
+            pass
+        elif not sequential and i.__class__ not in (rv_instr_bcc, rv_instr_jal, rv_instr_jalr):
+            stack = stack+[None]
+            pass
+        return (None, stack)
+    #f clock_period
+    def clock_period(self):
+        return self.min_delta or 1
+    pass
+
+#a Reports
+#f report
+def report(f, profile, top=20, clock_period=None):
+    """
+    Write the function and basic block profile
+    """
+    if clock_period is None: clock_period = profile.clock_period()
+    total = float(profile.time) or 1.0
+    print >>f, "%d instructions, %.0f cycles (%d time units per cycle)"%(profile.instructions, profile.time/float(clock_period), clock_period)
+    print >>f
+    print >>f, "%12s %7s %12s  %s"%("cycles", "%", "instructions", "function")
+    functions = sorted(profile.functions.items(), key=lambda x:(-x[1].time, x[0]))
+    for (function, e) in functions[:top]:
+        print >>f, "%12.0f %6.2f%% %12d  %s"%(e.time/float(clock_period), 100*e.time/total, e.instructions, function)
+        pass
+    print >>f
+    print >>f, "%12s %7s %12s %10s  %s"%("cycles", "%", "instructions", "executions", "basic block")
+    blocks = sorted(profile.blocks.items(), key=lambda x:(-x[1].time, x[0]))
+    for (block, e) in blocks[:top]:
+        print >>f, "%12.0f %6.2f%% %12d %10d  %08x %s"%(e.time/float(clock_period), 100*e.time/total, e.instructions, e.executions, block, profile.symbols.describe(block))
+        pass
+    pass
+
+#f write_collapsed
+def write_collapsed(f, profile, clock_period=None):
+    """
+    Write collapsed stacks of cycles, one 'caller;...;function cycles' per line
+    """
+    if clock_period is None: clock_period = profile.clock_period()
+    for (stack, time) in sorted(profile.stacks.items()):
+        cycles = int(round(time/float(clock_period)))
+        if cycles==0: continue
+        print >>f, "%s %d"%(";".join([s or "?" for s in stack]), cycles)
+        pass
+    pass
+
+#a Toplevel
+#f main
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Profile a RISC-V trace file or itrace.log by function and basic block')
+    parser.add_argument('trace', type=str, help='golden trace file or itrace.log')
+    parser.add_argument('--module', type=str, default='dut.trace',
+                        help='trace module of an itrace.log')
+    parser.add_argument('--dump', type=str, default=None,
+                        help='objdump output of the program for symbols')
+    parser.add_argument('--mif', type=str, default=None,
+                        help='MIF file of the program for symbols')
+    parser.add_argument('--elf', type=str, default=None,
+                        help='ELF file of the program for symbols')
+    parser.add_argument('--base_address', type=lambda x:int(x,0), default=0,
+                        help='base address of the program image')
+    parser.add_argument('--address_mask', type=lambda x:int(x,0), default=0xffffffff,
+                        help='address mask of the program image')
+    parser.add_argument('--clock_period', type=int, default=None,
+                        help='trace time units per clock cycle (default smallest time between instructions)')
+    parser.add_argument('--top', type=int, default=20,
+                        help='number of functions and basic blocks to report')
+    parser.add_argument('--collapsed', type=str, default=None,
+                        help='file to write collapsed stacks to for flamegraph tools')
+    args = parser.parse_args()
+    labels = {}
+    for (filename, kind) in ((args.dump, "dump"), (args.mif, "mif"), (args.elf, "elf")):
+        if filename is not None: labels = load_labels(filename, kind, args.base_address, args.address_mask)
+        pass
+    profile = c_profile(c_symbol_table(labels))
+    profile.add_trace(trace_instructions(args.trace, args.module))
+    report(sys.stdout, profile, args.top, args.clock_period)
+    if args.collapsed is not None:
+        f = open(args.collapsed, "w")
+        write_collapsed(f, profile, args.clock_period)
+        f.close()
+        pass
+    pass
+
+if __name__=="__main__":
+    main()
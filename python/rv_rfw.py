@@ -1,17 +1,34 @@
 #!/usr/bin/env python
 
-import csv
+from rv_itrace import c_itrace_log
 
-csvfile = open("itrace.log", "rb")
-trace = csv.reader(csvfile, delimiter=',', quotechar='"')
-for row in trace:
-    if (row[3] == '1') and (row[2]=='dut.dut.trace'):
-        rd = int(row[5],16)
-        data = int(row[6],16)
-        print "r%d <= %08x"%(rd, data)
+import sys
+import argparse
 
+#a Register writes
+#f write_rfw
+def write_rfw(f, logfile, module="dut.trace"):
+    """
+    Write the register writes of a log, returning a summary of it
+    """
+    summary = {"instructions":0, "register_writes":0, "first_time":None, "last_time":None}
+    for (timestamp, pc, flow, instr, rfw) in c_itrace_log(logfile, module=module):
+        if summary["first_time"] is None: summary["first_time"] = timestamp
+        summary["last_time"] = timestamp
+        if pc is not None: summary["instructions"] += 1
+        if rfw is None: continue
+        summary["register_writes"] += 1
+        print >>f, "r%d <= %08x"%rfw
+        pass
+    return summary
 
-
-
-        
-
+#a Toplevel
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Display register writes of RV simulation')
+    parser.add_argument('--logfile', type=str, default='itrace.log',
+                        help='logfile to parse')
+    parser.add_argument('--module', type=str, default="dut.trace",
+                        help='module to show register writes of')
+    args = parser.parse_args()
+    write_rfw(sys.stdout, args.logfile, module=args.module)
+    pass
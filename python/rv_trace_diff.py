@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""
+Compare two RISC-V golden trace files, such as a captured trace and the
+golden trace it failed to match, or traces of two pipeline variants
+
+The traces are loaded into NumPy arrays and aligned by retire order
+rather than time. The first retired instruction whose pc, instruction
+or mode differs is reported with context on each side, symbolised with
+the labels of the test's dump, MIF or ELF file if given, and the timing
+drift of the second trace relative to the first over the matching
+instructions is summarised.
+"""
+#a Imports
+import sys
+import numpy
+import dump
+from rv_tracefile import read_trace
+from rv_decode import rv_decoder
+
+#a Classes
+#c c_trace_arrays
+class c_trace_arrays(object):
+    """
+    A trace file as arrays of time, mode, pc and instruction, indexed by retire order
+    """
+    #f __init__
+    def __init__(self, filename):
+        self.filename = filename
+        entries = numpy.array(list(read_trace(filename)), dtype=numpy.int64).reshape((-1,4))
+        self.time        = entries[:,0]
+        self.mode        = entries[:,1]
+        self.pc          = entries[:,2]
+        self.instruction = entries[:,3]
+        pass
+    #f __len__
+    def __len__(self):
+        return len(self.pc)
+    pass
+
+#c c_symbols
+class c_symbols(object):
+    """
+    Symbolises addresses using the labels of a c_dump
+    """
+    #f __init__
+    def __init__(self, labels={}):
+        labels = sorted([(a,l) for (l,a) in labels.iteritems() if l!=""])
+        self.addresses = numpy.array([a for (a,l) in labels], dtype=numpy.int64)
+        self.labels = [l for (a,l) in labels]
+        pass
+    #f lookup
+    def lookup(self, address):
+        """
+        Return 'label+offset' for the nearest label at or below the address, or '' if there is none
+        """
+        i = numpy.searchsorted(self.addresses, address, side="right")-1
+        if i<0: return ""
+        offset = address-self.addresses[i]
+        if offset==0: return self.labels[i]
+        return "%s+0x%x"%(self.labels[i], offset)
+    pass
+
+#c c_trace_diff
+class c_trace_diff(object):
+    """
+    Alignment of two traces by retire order
+
+    divergence is the index of the first retired instruction that differs
+    (or at which one trace ends), or None if the traces match; aligned is
+    the number of matching instructions before it.
+    """
+    #f __init__
+    def __init__(self, golden, captured):
+        self.golden = golden
+        self.captured = captured
+        n = min(len(golden), len(captured))
+        mismatch  = (golden.pc[:n]!=captured.pc[:n])
+        mismatch |= (golden.instruction[:n]!=captured.instruction[:n])
+        mismatch |= (golden.mode[:n]!=captured.mode[:n])
+        differences = numpy.flatnonzero(mismatch)
+        self.divergence = None
+        self.aligned = n
+        if len(differences)>0:
+            self.divergence = differences[0]
+            self.aligned = self.divergence
+            pass
+        elif len(golden)!=len(captured):
+            self.divergence = n
+            pass
+        pass
+    #f divergence_reason
+    def divergence_reason(self):
+        (g, c, i) = (self.golden, self.captured, self.divergence)
+        if i>=len(g): return "golden trace ends"
+        if i>=len(c): return "captured trace ends"
+        reasons = []
+        if g.pc[i]!=c.pc[i]: reasons.append("pc")
+        if g.instruction[i]!=c.instruction[i]: reasons.append("instruction")
+        if g.mode[i]!=c.mode[i]: reasons.append("mode")
+        if len(reasons)==1: return reasons[0]+" differs"
+        return " and ".join(reasons)+" differ"
+    #f report_divergence
+    def report_divergence(self, f, context=5, symbols=None, decoder=None):
+        if symbols is None: symbols = c_symbols()
+        if decoder is None: decoder = rv_decoder()
+        if self.divergence is None:
+            print >>f, "Traces match for all %d retired instructions"%self.aligned
+            return
+        print >>f, "First divergence at retired instruction %d: %s"%(self.divergence, self.divergence_reason())
+        def describe(trace, i):
+            if i>=len(trace): return "%-66s"%""
+            (pc, instruction) = (int(trace.pc[i]), int(trace.instruction[i]))
+            return "%08x %-24s %-32s"%(pc, symbols.lookup(pc)[:24], decoder.disassemble(pc, instruction))
+        print >>f, "%9s   %-66s | %s"%("", "golden %s"%self.golden.filename, "captured %s"%self.captured.filename)
+        for i in range(max(0,self.divergence-context), self.divergence+context+1):
+            if (i>=len(self.golden)) and (i>=len(self.captured)): break
+            marker = " "
+            if i==self.divergence: marker = ">"
+            print >>f, ("%s%8d : %s | %s"%(marker, i, describe(self.golden, i), describe(self.captured, i))).rstrip()
+            pass
+        pass
+    #f timing_drift
+    def timing_drift(self, top=10):
+        """
+        Return a dictionary summarising the time of the captured trace
+        relative to the golden trace over the aligned instructions,
+        including the pcs at which most drift accumulates
+        """
+        n = self.aligned
+        if n<2: return None
+        golden_time   = self.golden.time[:n]   - self.golden.time[0]
+        captured_time = self.captured.time[:n] - self.captured.time[0]
+        drift = captured_time - golden_time
+        (pcs, pc_index) = numpy.unique(self.golden.pc[1:n], return_inverse=True)
+        drift_by_pc = numpy.bincount(pc_index, weights=numpy.diff(drift))
+        order = numpy.argsort(-numpy.abs(drift_by_pc), kind="mergesort")[:top]
+        return {"instructions":  n,
+                "golden_cpi":    golden_time[-1]/float(n-1),
+                "captured_cpi":  captured_time[-1]/float(n-1),
+                "final_drift":   int(drift[-1]),
+                "max_drift":     int(drift[numpy.argmax(numpy.abs(drift))]),
+                "max_drift_at":  int(numpy.argmax(numpy.abs(drift))),
+                "drift_by_pc":   [(int(pcs[i]), int(drift_by_pc[i])) for i in order if drift_by_pc[i]!=0],
+                }
+    #f report_timing
+    def report_timing(self, f, top=10, symbols=None):
+        if symbols is None: symbols = c_symbols()
+        drift = self.timing_drift(top)
+        if drift is None:
+            print >>f, "Too few aligned instructions to compare timing"
+            return
+        print >>f, "Timing over %d aligned instructions: golden %.3f, captured %.3f time units per instruction"%(drift["instructions"], drift["golden_cpi"], drift["captured_cpi"])
+        print >>f, "Captured drift at end %+d, largest %+d at retired instruction %d"%(drift["final_drift"], drift["max_drift"], drift["max_drift_at"])
+        if len(drift["drift_by_pc"])>0:
+            print >>f, "Drift accumulated by pc:"
+            for (pc, d) in drift["drift_by_pc"]:
+                print >>f, "  %08x %-32s %+8d"%(pc, symbols.lookup(pc), d)
+                pass
+            pass
+        pass
+    pass
+
+#a Toplevel
+#f load_symbols
+def load_symbols(args):
+    """
+    Load the labels of the dump, MIF or ELF file given in the arguments, if any
+    """
+    for (filename, load, mode) in ((args.dump, dump.c_dump.load, "r"),
+                                   (args.mif,  dump.c_dump.load_mif, "r"),
+                                   (args.elf,  dump.c_dump.load_elf, "rb")):
+        if filename is None: continue
+        d = dump.c_dump()
+        f = open(filename, mode)
+        load(d, f, base_address=args.base_address, address_mask=args.address_mask)
+        f.close()
+        return c_symbols(d.labels)
+    return c_symbols()
+
+#f main
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Find the first divergence between two RISC-V trace files')
+    parser.add_argument('golden', type=str, help='golden trace file')
+    parser.add_argument('captured', type=str, help='captured trace file')
+    parser.add_argument('--context', type=int, default=5,
+                        help='instructions of context to show each side of the divergence')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of pcs to show timing drift of')
+    parser.add_argument('--dump', type=str, default=None,
+                        help='objdump output of the test for symbols')
+    parser.add_argument('--mif', type=str, default=None,
+                        help='MIF file of the test for symbols')
+    parser.add_argument('--elf', type=str, default=None,
+                        help='ELF file of the test for symbols')
+    parser.add_argument('--base_address', type=lambda x:int(x,0), default=0,
+                        help='base address of the test image')
+    parser.add_argument('--address_mask', type=lambda x:int(x,0), default=0xffffffff,
+                        help='address mask of the test image')
+    args = parser.parse_args()
+    symbols = load_symbols(args)
+    diff = c_trace_diff(c_trace_arrays(args.golden), c_trace_arrays(args.captured))
+    diff.report_divergence(sys.stdout, context=args.context, symbols=symbols)
+    diff.report_timing(sys.stdout, top=args.top, symbols=symbols)
+    if diff.divergence is not None: sys.exit(1)
+    pass
+
+if __name__=="__main__":
+    main()
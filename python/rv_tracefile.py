@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""
+RISC-V golden instruction trace files (riscv_trace/*.trace)
+
+These are captured and matched by the chk_riscv_trace checker, each
+entry being the (time, mode, pc, instruction) of an executed
+instruction. The text format has one 'time,mode,pc,instr' line per
+entry, with pc and instruction in hex.
+
+The binary format is a header of the magic 'RVTRACE\\0', then version
+and number of entries as 32-bit little-endian values, followed by the
+entries. Each entry is a varint of the zigzag-encoded time delta, a
+varint of the zigzag-encoded pc delta, and a varint of
+(instruction reference<<3)|mode. A reference of 0 is followed by a
+varint of the instruction, which is added to the instruction table;
+a reference of n is the (n-1)th instruction of the table. Varints are
+little-endian base-128, with the top bit of each byte set if more
+bytes follow.
+
+Converting to binary: rv_tracefile.py in.trace out.trace
+Converting to text:   rv_tracefile.py --text in.trace out.trace
+"""
+#a Imports
+import struct
+
+#a Binary trace format
+trace_magic = "RVTRACE\0"
+trace_version = 1
+trace_header = struct.Struct("<8sII")
+
+#f zigzag
+def zigzag(v):
+    if v<0: return ((-v)<<1)-1
+    return v<<1
+
+#f unzigzag
+def unzigzag(v):
+    if v&1: return -((v+1)>>1)
+    return v>>1
+
+#f varint
+def varint(v):
+    """
+    Return the varint encoding of v as a bytearray
+    """
+    data = bytearray()
+    while v>=0x80:
+        data.append(0x80 | (v&0x7f))
+        v >>= 7
+        pass
+    data.append(v)
+    return data
+
+#c c_trace_writer
+class c_trace_writer(object):
+    """
+    Writer of a binary trace file; close() fills in the number of entries
+    """
+    #f __init__
+    def __init__(self, f):
+        self.f = f
+        self.num_entries = 0
+        self.instructions = {}
+        self.last_time = 0
+        self.last_pc = 0
+        self.f.write(trace_header.pack(trace_magic, trace_version, 0))
+        pass
+    #f add
+    def add(self, time, mode, pc, instruction):
+        data = varint(zigzag(time-self.last_time))
+        data += varint(zigzag(pc-self.last_pc))
+        if instruction in self.instructions:
+            data += varint((self.instructions[instruction]<<3) | mode)
+            pass
+        else:
+            self.instructions[instruction] = len(self.instructions)+1
+            data += varint(mode)
+            data += varint(instruction)
+            pass
+        self.f.write(data)
+        self.last_time = time
+        self.last_pc = pc
+        self.num_entries += 1
+        pass
+    #f close
+    def close(self):
+        self.f.seek(0)
+        self.f.write(trace_header.pack(trace_magic, trace_version, self.num_entries))
+        self.f.close()
+        pass
+    pass
+
+#f read_binary_trace
+def read_binary_trace(data):
+    """
+    Generate (time, mode, pc, instruction) for the entries of binary trace data
+    """
+    (magic, version, num_entries) = trace_header.unpack_from(data)
+    if magic!=trace_magic: raise Exception("Not a binary RISC-V trace")
+    if version!=trace_version: raise Exception("Unsupported binary RISC-V trace version %d"%version)
+    data = bytearray(data)
+    instructions = [None]
+    (time, pc) = (0, 0)
+    ofs = trace_header.size
+    for n in range(num_entries):
+        fields = []
+        while len(fields)<3 or (len(fields)==3 and fields[2]<8):
+            (v, shift) = (0, 0)
+            while True:
+                b = data[ofs]
+                ofs += 1
+                v |= (b&0x7f)<<shift
+                if b<0x80: break
+                shift += 7
+                pass
+            fields.append(v)
+            pass
+        time += unzigzag(fields[0])
+        pc += unzigzag(fields[1])
+        (reference, mode) = (fields[2]>>3, fields[2]&7)
+        if reference==0:
+            instruction = fields[3]
+            instructions.append(instruction)
+            pass
+        else:
+            instruction = instructions[reference]
+            pass
+        yield (time, mode, pc, instruction)
+        pass
+    pass
+
+#f read_text_trace
+def read_text_trace(f):
+    """
+    Generate (time, mode, pc, instruction) for the lines of a text trace file
+    """
+    for l in f:
+        fields = l.strip().split(",")
+        if len(fields)!=4: continue
+        yield (int(fields[0]), int(fields[1]), int(fields[2],16), int(fields[3],16))
+        pass
+    pass
+
+#f read_trace
+def read_trace(filename):
+    """
+    Generate (time, mode, pc, instruction) for the entries of a trace file in either format
+    """
+    f = open(filename, "rb")
+    try:
+        if f.read(len(trace_magic))==trace_magic:
+            f.seek(0)
+            for e in read_binary_trace(f.read()): yield e
+            return
+        f.seek(0)
+        for e in read_text_trace(f): yield e
+        pass
+    finally:
+        f.close()
+        pass
+    pass
+
+#f write_binary_trace
+def write_binary_trace(filename, entries):
+    writer = c_trace_writer(open(filename, "wb"))
+    for (time, mode, pc, instruction) in entries:
+        writer.add(time, mode, pc, instruction)
+        pass
+    writer.close()
+    pass
+
+#f write_text_trace
+def write_text_trace(filename, entries):
+    f = open(filename, "w")
+    for e in entries:
+        f.write("%d,%d,%08x,%08x\n"%e)
+        pass
+    f.close()
+    pass
+
+#a Toplevel
+if __name__=="__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert RISC-V golden trace files between text and binary')
+    parser.add_argument('--text', action='store_true', default=False,
+                        help='convert to text rather than binary')
+    parser.add_argument('input', type=str, help='trace file to read (text or binary)')
+    parser.add_argument('output', type=str, help='trace file to write')
+    args = parser.parse_args()
+    entries = list(read_trace(args.input))
+    if args.text:
+        write_text_trace(args.output, entries)
+        pass
+    else:
+        write_binary_trace(args.output, entries)
+        pass
+    pass
@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+"""
+Seekable index of RISC-V trace files and instruction trace logs
+
+An index divides a golden trace (.trace, text or binary) or an
+itrace.log into blocks of a fixed number of records, and records for
+each block its file offset, the time of its first record and the range
+of pcs in it, along with the first block in which each pc occurs. A
+reader can then start at the block containing a given time, or the
+first block that can contain a given pc, rather than parsing the file
+from the start. Blocks start only at a change of time, so a block never
+splits the events of one timestamp of an itrace.log.
+
+Binary traces are delta-encoded with an instruction table, so each
+block also records the time, pc and instruction table size before it,
+and the index holds the instruction table.
+
+The index is kept in a sidecar file (the trace filename with '.idx'
+appended) built in one streaming pass. When the trace has grown it is
+updated from its last block; if the trace has been rewritten (it is
+smaller, or its start differs) it is rebuilt.
+
+Sidecar format: a header of the magic 'RVINDEX\\0', version, block
+size, trace file size, CRC of the start of the trace, and the numbers
+of blocks, first pcs and instructions; then the blocks, the (pc, block)
+pairs and the instructions, all little-endian.
+"""
+#a Imports
+import os
+import zlib
+import struct
+import bisect
+from rv_tracefile import trace_magic, trace_version, trace_header, unzigzag
+from rv_itrace import default_reasons, is_binary_log
+
+#a Index file format
+index_magic = "RVINDEX\0"
+index_version = 1
+index_header = struct.Struct("<8sIIQIIII")
+index_block = struct.Struct("<QqqQqQQ")
+index_first_pc = struct.Struct("<QI")
+index_instruction = struct.Struct("<Q")
+
+# Bytes at the start of a trace whose CRC identifies it; this skips the
+# binary trace header, whose number of entries is filled in at close
+crc_start = 16
+crc_end = 4096
+
+#f read_varint
+def read_varint(data, ofs):
+    """
+    Return (value, offset after it) of the varint at ofs in a bytearray, or None if it is incomplete
+    """
+    (v, shift) = (0, 0)
+    while ofs<len(data):
+        b = data[ofs]
+        ofs += 1
+        v |= (b&0x7f)<<shift
+        if b<0x80: return (v, ofs)
+        shift += 7
+        pass
+    return None
+
+#a Trace records
+#f text_trace_records
+def text_trace_records(f, offset):
+    """
+    Generate (offset, time, pc, entry) for the complete lines of a text trace from offset
+    """
+    f.seek(offset)
+    for l in f:
+        if l[-1]!="\n": return
+        fields = l.strip().split(",")
+        if len(fields)==4:
+            entry = (int(fields[0]), int(fields[1]), int(fields[2],16), int(fields[3],16))
+            yield (offset, entry[0], entry[2], entry)
+            pass
+        offset += len(l)
+        pass
+    pass
+
+#f binary_trace_records
+def binary_trace_records(f, offset, state, instructions):
+    """
+    Generate (offset, time, pc, entry) for the complete entries of a
+    binary trace from offset, given the (time, pc) before it; new
+    instructions are appended to the instruction table
+    """
+    f.seek(offset)
+    data = bytearray(f.read())
+    (time, pc) = state
+    ofs = 0
+    while True:
+        fields = []
+        end = ofs
+        while len(fields)<3 or (len(fields)==3 and fields[2]<8):
+            v = read_varint(data, end)
+            if v is None: return
+            fields.append(v[0])
+            end = v[1]
+            pass
+        time += unzigzag(fields[0])
+        pc += unzigzag(fields[1])
+        (reference, mode) = (fields[2]>>3, fields[2]&7)
+        if reference==0:
+            instructions.append(fields[3])
+            reference = len(instructions)
+            pass
+        yield (offset+ofs, time, pc, (time, mode, pc, instructions[reference-1]))
+        ofs = end
+        pass
+    pass
+
+#f itrace_records
+def itrace_records(f, offset, reasons):
+    """
+    Generate (offset, timestamp, pc, row) for the complete event rows of
+    an itrace.log from offset, with a pc of None for events other than
+    PC; declarations of event reasons update reasons
+    """
+    f.seek(offset)
+    for l in f:
+        if l[-1]!="\n": return
+        row = l.rstrip().split(",")
+        if len(row)>=5:
+            if row[0].startswith("#"):
+                if "=" in row[3]:
+                    (event, reason) = row[3].split("=",1)
+                    reasons[int(event)] = reason.strip('" ')
+                    pass
+                pass
+            else:
+                pc = None
+                if (reasons.get(int(row[3]))=="PC") and (int(row[4])>0): pc = int(row[5],16)
+                yield (offset, int(row[0]), pc, row)
+                pass
+            pass
+        offset += len(l)
+        pass
+    pass
+
+#a Index
+#c c_index_block
+class c_index_block(object):
+    """
+    A block of a trace: its offset, the (time, pc, instruction table
+    size) of a binary trace before it, the time of its first record and
+    the range of its pcs
+    """
+    #f __init__
+    def __init__(self, offset, state_time, state_pc, state_instructions, first_time, min_pc=None, max_pc=None):
+        self.offset = offset
+        self.state_time = state_time
+        self.state_pc = state_pc
+        self.state_instructions = state_instructions
+        self.first_time = first_time
+        self.min_pc = min_pc
+        self.max_pc = max_pc
+        pass
+    #f may_contain
+    def may_contain(self, pc):
+        # A block with no pcs is stored with min_pc above max_pc
+        return (self.min_pc is not None) and (self.min_pc<=pc<=self.max_pc)
+    pass
+
+#c c_trace_index
+class c_trace_index(object):
+    """
+    Index of a trace file or itrace.log, loaded from its sidecar and
+    brought up to date with the file
+    """
+    #f __init__
+    def __init__(self, filename, block_size=4096, sidecar=None, save=True):
+        self.filename = filename
+        self.sidecar = sidecar
+        if sidecar is None: self.sidecar = filename+".idx"
+        self.save = save
+        self.kind = self.file_kind()
+        self.block_size = block_size
+        self.reset()
+        self.load()
+        self.update()
+        pass
+    #f file_kind
+    def file_kind(self):
+        f = open(self.filename, "rb")
+        magic = f.read(len(trace_magic))
+        f.close()
+        if magic==trace_magic: return "binary"
+        if is_binary_log(self.filename): raise Exception("%s is a binary log, which is not indexed; use c_binary_log.offset_for_time"%self.filename)
+        if self.filename.endswith(".log"): return "itrace"
+        return "text"
+    #f reset
+    def reset(self):
+        self.source_size = 0
+        self.source_crc = 0
+        self.blocks = []
+        self.first_pcs = {}
+        self.instructions = []
+        pass
+    #f source_start_crc
+    def source_start_crc(self):
+        f = open(self.filename, "rb")
+        f.seek(crc_start)
+        crc = zlib.crc32(f.read(crc_end-crc_start)) & 0xffffffff
+        f.close()
+        return crc
+    #f load
+    def load(self):
+        """
+        Load the sidecar if it exists and is of the same block size
+        """
+        if not os.path.exists(self.sidecar): return
+        f = open(self.sidecar, "rb")
+        data = f.read()
+        f.close()
+        if len(data)<index_header.size: return
+        (magic, version, block_size, source_size, source_crc, num_blocks, num_first_pcs, num_instructions) = index_header.unpack_from(data)
+        if (magic!=index_magic) or (version!=index_version) or (block_size!=self.block_size): return
+        ofs = index_header.size
+        for i in range(num_blocks):
+            self.blocks.append(c_index_block(*index_block.unpack_from(data, ofs)))
+            ofs += index_block.size
+            pass
+        for i in range(num_first_pcs):
+            (pc, block) = index_first_pc.unpack_from(data, ofs)
+            self.first_pcs[pc] = block
+            ofs += index_first_pc.size
+            pass
+        for i in range(num_instructions):
+            self.instructions.append(index_instruction.unpack_from(data, ofs)[0])
+            ofs += index_instruction.size
+            pass
+        (self.source_size, self.source_crc) = (source_size, source_crc)
+        pass
+    #f write
+    def write(self):
+        f = open(self.sidecar, "wb")
+        f.write(index_header.pack(index_magic, index_version, self.block_size, self.source_size, self.source_crc,
+                                  len(self.blocks), len(self.first_pcs), len(self.instructions)))
+        for b in self.blocks:
+            (min_pc, max_pc) = (b.min_pc, b.max_pc)
+            if min_pc is None: (min_pc, max_pc) = ((1<<64)-1, 0)
+            f.write(index_block.pack(b.offset, b.state_time, b.state_pc, b.state_instructions, b.first_time, min_pc, max_pc))
+            pass
+        for pc in sorted(self.first_pcs):
+            f.write(index_first_pc.pack(pc, self.first_pcs[pc]))
+            pass
+        for i in self.instructions:
+            f.write(index_instruction.pack(i))
+            pass
+        f.close()
+        pass
+    #f update
+    def update(self):
+        """
+        Index any records added to the file since the index was built,
+        rebuilding it if the file has been rewritten; the last block is
+        indexed again as it may have been incomplete
+        """
+        size = os.path.getsize(self.filename)
+        crc = self.source_start_crc()
+        if (size<self.source_size) or (crc!=self.source_crc): self.reset()
+        if (size==self.source_size) and (len(self.blocks)>0): return
+        if len(self.blocks)>0:
+            last = self.blocks.pop()
+            for pc in [pc for (pc, b) in self.first_pcs.iteritems() if b==len(self.blocks)]:
+                del self.first_pcs[pc]
+                pass
+            del self.instructions[last.state_instructions:]
+            (offset, state) = (last.offset, (last.state_time, last.state_pc))
+            pass
+        else:
+            (offset, state) = (0, (0, 0))
+            if self.kind=="binary": offset = trace_header.size
+            pass
+        block = None
+        count = 0
+        last_time = None
+        # Instruction table size before each record; records add to the table as they are generated
+        num_instructions = len(self.instructions)
+        for (record_offset, time, pc, entry) in self.records(offset, state):
+            if (block is None) or ((count>=self.block_size) and (time!=last_time)):
+                (state_time, state_pc) = state
+                block = c_index_block(record_offset, state_time, state_pc, num_instructions, time)
+                self.blocks.append(block)
+                count = 0
+                pass
+            if pc is not None:
+                if (block.min_pc is None) or (pc<block.min_pc): block.min_pc = pc
+                if (block.max_pc is None) or (pc>block.max_pc): block.max_pc = pc
+                if pc not in self.first_pcs: self.first_pcs[pc] = len(self.blocks)-1
+                pass
+            if self.kind=="binary": state = (time, pc)
+            num_instructions = len(self.instructions)
+            last_time = time
+            count += 1
+            pass
+        (self.source_size, self.source_crc) = (size, crc)
+        if self.save: self.write()
+        pass
+    #f records
+    def records(self, offset, state, instructions=None):
+        """
+        Generate (offset, time, pc, entry) for the records of the file from
+        an offset, given the (time, pc) state of a binary trace before it
+        """
+        if instructions is None: instructions = self.instructions
+        f = open(self.filename, "rb")
+        try:
+            if self.kind=="binary":
+                for r in binary_trace_records(f, offset, state, instructions): yield r
+                pass
+            elif self.kind=="itrace":
+                reasons = dict(default_reasons)
+                if offset>0: self.read_declarations(f, reasons)
+                for r in itrace_records(f, offset, reasons): yield r
+                pass
+            else:
+                for r in text_trace_records(f, offset): yield r
+                pass
+            pass
+        finally:
+            f.close()
+            pass
+        pass
+    #f read_declarations
+    def read_declarations(self, f, reasons):
+        """
+        Read the event reason declarations at the start of an itrace.log
+        """
+        f.seek(0)
+        for l in f:
+            if not l.startswith("#"): break
+            row = l.rstrip().split(",")
+            if (len(row)>=5) and ("=" in row[3]):
+                (event, reason) = row[3].split("=",1)
+                reasons[int(event)] = reason.strip('" ')
+                pass
+            pass
+        pass
+    #f block_for_time
+    def block_for_time(self, time):
+        """
+        Return the index of the block containing the first record at or after a time
+        """
+        i = bisect.bisect_right([b.first_time for b in self.blocks], time)-1
+        return max(i, 0)
+    #f block_for_pc
+    def block_for_pc(self, pc, from_block=0):
+        """
+        Return the index of the first block from from_block that may contain a pc, or None
+        """
+        first = self.first_pcs.get(pc)
+        if first is None: return None
+        if first>=from_block: return first
+        for i in range(from_block, len(self.blocks)):
+            if self.blocks[i].may_contain(pc): return i
+            pass
+        return None
+    #f start_block
+    def start_block(self, time=None, pc=None):
+        """
+        Return the index of the block to read from for the first record at
+        or after a time at a pc (either may be None), or None if there is none
+        """
+        block = 0
+        if time is not None: block = self.block_for_time(time)
+        if pc is not None: block = self.block_for_pc(pc, block)
+        if (block is not None) and (block>=len(self.blocks)): return None
+        return block
+    #f offset
+    def offset(self, block):
+        return self.blocks[block].offset
+    #f entries
+    def entries(self, time=None, pc=None):
+        """
+        Generate the entries of the file from the first record at or after
+        a time at a pc (either may be None): (time, mode, pc, instruction)
+        for a trace file, and rows for an itrace.log
+        """
+        block = self.start_block(time, pc)
+        if block is None: return
+        b = self.blocks[block]
+        instructions = self.instructions[:b.state_instructions]
+        started = False
+        for (offset, record_time, record_pc, entry) in self.records(b.offset, (b.state_time, b.state_pc), instructions):
+            if not started:
+                started = ((time is None) or (record_time>=time)) and ((pc is None) or (record_pc==pc))
+                if not started: continue
+                pass
+            yield entry
+            pass
+        pass
+    pass
+
+#a Toplevel
+#f main
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Build or update the index of a RISC-V trace file or itrace.log, and show entries from a time or pc')
+    parser.add_argument('filename', type=str, help='trace file or itrace.log')
+    parser.add_argument('--block_size', type=int, default=4096,
+                        help='records per index block')
+    parser.add_argument('--time', type=int, default=None,
+                        help='show entries from the first at or after this time')
+    parser.add_argument('--pc', type=lambda x:int(x,16), default=None,
+                        help='show entries from the first at this pc (hex)')
+    parser.add_argument('--count', type=int, default=20,
+                        help='number of entries to show')
+    args = parser.parse_args()
+    index = c_trace_index(args.filename, block_size=args.block_size)
+    print "%s: %d blocks, %d distinct pcs"%(args.filename, len(index.blocks), len(index.first_pcs))
+    if (args.time is None) and (args.pc is None): return
+    n = 0
+    for e in index.entries(args.time, args.pc):
+        if n>=args.count: break
+        if index.kind=="itrace":
+            print ",".join(e)
+            pass
+        else:
+            print "%d,%d,%08x,%08x"%e
+            pass
+        n += 1
+        pass
+    pass
+
+if __name__=="__main__":
+    main()
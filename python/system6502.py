@@ -1,34 +1,130 @@
 #a Imports
 import re
 import sys, inspect
-from model6502 import c_6502
+import array
+import pickle
+import struct
+from instr6502 import c65am_reset
+from model6502 import c_6502, R_IR, MEM_READ, MEM_WRITE
+from fast6502 import c_6502_fast
 
 #a Memory
+# Page types of the memory bus; shared pages are RAM pages shared with
+# snapshots, copied on their first write
+PAGE_RAM, PAGE_SHARED, PAGE_ROM, PAGE_DEVICE = range(4)
+
+#c c_bus_device
+class c_bus_device(object):
+    """
+    Base class for a device mapped into pages of a c_memory bus
+
+    read and write are invoked with the full 16-bit address for any
+    access to a page the device is mapped to; tick is invoked with the
+    number of CPU cycles that have elapsed (1 per cycle when ticking
+    the cycle-accurate model, and the whole run after a fast_forward)
+    """
+    def read(self, address):
+        return 0xff
+    def write(self, address, data):
+        pass
+    def tick(self, cycles):
+        pass
+    pass
+
 #c c_memory
 class c_memory(object):
+    """
+    64kB memory bus held as 256-byte pages, with a 256-entry page dispatch table
+
+    RAM and ROM pages are bytearrays accessed directly; writes to ROM
+    pages are ignored. Device pages route reads and writes to a
+    c_bus_device. RAM pages may be shared with snapshots (and hence
+    forked systems); a shared page is copied on its first write.
+    """
     def __init__(self):
-        self.data = bytearray(65536)
-        self.data[0xfffc] = 0
-        self.data[0xfffd] = 0
+        self.pages = [bytearray(256) for p in range(256)]
+        self.page_types = [PAGE_RAM]*256
+        self.devices = [None]*256
+        self.tick_devices = []
+        self.write(0xfffc, 0)
+        self.write(0xfffd, 0)
         n = 0
         n = self.add_code(n, (0xa9, 0x54) )
         n = self.add_code(n, (0xa0, 0x18) )
         n = self.add_code(n, (0xa2, 0x82) )
         n = self.add_code(n, (0x69, 0x01) )
         n = self.add_code(n, (0x8d, 0x12, 0x34) )
-        self.data[n] = 0x4c
-        n+=1
-        self.data[n] = 0x06
-        n+=1
-        self.data[n] = 0x00
-        n+=1
-        pass
-    def load_binary(self, base_address, f):
-        address = base_address
+        n = self.add_code(n, (0x4c, 0x06, 0x00) )
+        pass
+    def get_data(self):
+        """
+        Get the contents of the RAM and ROM pages (device pages read as zero)
+        """
+        return bytearray().join(self.pages)
+    data = property(get_data)
+    def snapshot(self):
+        """
+        Return the pages as a tuple, which must not be modified; the
+        RAM pages become shared
+        """
+        for page in range(256):
+            if self.page_types[page]==PAGE_RAM: self.page_types[page] = PAGE_SHARED
+            pass
+        return tuple(self.pages)
+    def restore(self, pages):
+        """
+        Restore the memory to pages from a snapshot, sharing them
+        """
+        self.pages = list(pages)
+        for page in range(256):
+            if self.page_types[page]==PAGE_RAM: self.page_types[page] = PAGE_SHARED
+            pass
+        pass
+    def map_device(self, device, base_address, size=256):
+        """
+        Map a c_bus_device to the pages covering base_address to base_address+size-1
+        """
+        for page in range(base_address>>8, (base_address+size+255)>>8):
+            self.page_types[page] = PAGE_DEVICE
+            self.devices[page] = device
+            pass
+        if device not in self.tick_devices:
+            self.tick_devices.append(device)
+            pass
+        pass
+    def map_rom(self, base_address, data):
+        """
+        Load data at base_address and make the pages it covers read-only
+
+        The pages are copied first, as they may be shared with snapshots
+        """
+        for page in range(base_address>>8, (base_address+len(data)+255)>>8):
+            self.pages[page] = bytearray(self.pages[page])
+            self.page_types[page] = PAGE_RAM
+            self.devices[page] = None
+            pass
+        end_address = self.add_code(base_address, data)
+        for page in range(base_address>>8, (end_address+255)>>8):
+            self.page_types[page] = PAGE_ROM
+            pass
+        pass
+    def tick(self, cycles=1):
+        for device in self.tick_devices:
+            device.tick(cycles)
+            pass
+        pass
+    def load_binary(self, base_address, f, rom=False):
+        data = bytearray()
         while True:
             d = f.read(4096)
             if len(d)==0: break
-            address = self.add_code(address, d)
+            data.extend(d)
+            pass
+        if rom:
+            self.map_rom(base_address, data)
+            pass
+        else:
+            self.add_code(base_address, data)
             pass
         pass
     def add_code(self, address, data):
@@ -38,9 +134,23 @@ class c_memory(object):
             pass
         return address
     def read(self, address):
-        return self.data[address]
+        device = self.devices[address>>8]
+        if device is None: return self.pages[address>>8][address&0xff]
+        return device.read(address)
     def write(self, address, data):
-        self.data[address] = data
+        page = address>>8
+        page_type = self.page_types[page]
+        if page_type==PAGE_RAM:
+            self.pages[page][address&0xff] = data
+            pass
+        elif page_type==PAGE_SHARED:
+            self.pages[page] = bytearray(self.pages[page])
+            self.page_types[page] = PAGE_RAM
+            self.pages[page][address&0xff] = data
+            pass
+        elif page_type==PAGE_DEVICE:
+            self.devices[page].write(address, data)
+            pass
         pass
     def dump(self, address, length=256):
         while length>0:
@@ -54,6 +164,132 @@ class c_memory(object):
             pass
         pass
     
+#a Bus trace
+# Control bits of a bus trace cycle
+CTL_READ, CTL_WRITE, CTL_SYNC = 1, 2, 4
+
+#c c_bus_trace
+class c_bus_trace(object):
+    """
+    Preallocated buffers recording the bus activity of a number of cycles
+
+    For each cycle the address, data (read or written) and control
+    (CTL_READ, CTL_WRITE, CTL_SYNC for an opcode fetch) are recorded;
+    a cycle with no memory access has address 0 and data 0xff.
+
+    The binary file format is a header of the magic string, a version
+    and the number of cycles (as little-endian 32-bit values), followed
+    by the addresses (little-endian 16-bit), the data bytes and the
+    control bytes.
+    """
+    magic = "6502BUS\0"
+    version = 1
+    #f __init__
+    def __init__(self, size):
+        self.size = size
+        self.length = 0
+        self.address = array.array('H', [0])*size
+        self.data = array.array('B', [0xff])*size
+        self.control = array.array('B', [0])*size
+        pass
+    #f __len__
+    def __len__(self):
+        return self.length
+    #f get_cycle
+    def get_cycle(self, n):
+        """
+        Get (address, data, control) of cycle n
+        """
+        return (self.address[n], self.data[n], self.control[n])
+    #f first_difference
+    def first_difference(self, other):
+        """
+        Return the first cycle at which two traces differ, or None if
+        they match (over the length of the shorter)
+        """
+        length = min(self.length, other.length)
+        for (a, b) in ((self.address, other.address), (self.data, other.data), (self.control, other.control)):
+            if a[:length]!=b[:length]:
+                for n in xrange(length):
+                    if self.get_cycle(n)!=other.get_cycle(n): return n
+                    pass
+                pass
+            pass
+        return None
+    #f save
+    def save(self, filename):
+        addresses = self.address[:self.length]
+        if sys.byteorder!="little": addresses.byteswap()
+        f = open(filename, "wb")
+        f.write(struct.pack("<8sII", self.magic, self.version, self.length))
+        f.write(addresses.tostring())
+        f.write(self.data[:self.length].tostring())
+        f.write(self.control[:self.length].tostring())
+        f.close()
+        pass
+    #f load
+    @classmethod
+    def load(cls, filename):
+        f = open(filename, "rb")
+        header = f.read(struct.calcsize("<8sII"))
+        (magic, version, length) = struct.unpack("<8sII", header)
+        if (magic!=cls.magic) or (version!=cls.version):
+            raise Exception("File '%s' is not a version %d 6502 bus trace"%(filename, cls.version))
+        trace = cls(0)
+        trace.address.fromstring(f.read(2*length))
+        if sys.byteorder!="little": trace.address.byteswap()
+        trace.data.fromstring(f.read(length))
+        trace.control.fromstring(f.read(length))
+        f.close()
+        if (len(trace.address)!=length) or (len(trace.control)!=length):
+            raise Exception("Bus trace file '%s' is truncated"%filename)
+        trace.size = length
+        trace.length = length
+        return trace
+    pass
+
+#a Snapshot
+#c c_system_snapshot
+class c_system_snapshot(object):
+    """
+    Snapshot of the state of a c_system: the CPU register file,
+    instruction in hand and cycle within it, and memory
+
+    Snapshots compare equal if the states are identical, independent
+    of the cycle at which they were taken. They may be pickled (see
+    save and load); within a process they share memory pages with the
+    system, so taking one is cheap. Devices mapped into the memory are
+    not part of a snapshot.
+    """
+    def __init__(self, system):
+        cpu = system.cpu
+        self.registers = cpu.registers.tostring()
+        self.alu_flags = cpu.alu_flags
+        self.in_reset = (cpu.instr[1] is c65am_reset)
+        self.instr_cycle = cpu.instr_cycle
+        self.cycle = system.cycle
+        self.pages = system.memory.snapshot()
+        pass
+    def state(self):
+        return (self.registers, self.in_reset, self.instr_cycle, self.pages)
+    def __eq__(self, other):
+        if not isinstance(other, c_system_snapshot): return False
+        return self.state()==other.state()
+    def __ne__(self, other):
+        return not self.__eq__(other)
+    def save(self, filename):
+        f = open(filename, "wb")
+        pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+        pass
+    @staticmethod
+    def load(filename):
+        f = open(filename, "rb")
+        snapshot = pickle.load(f)
+        f.close()
+        return snapshot
+    pass
+
 #a System
 #c c_system
 class c_system(object):
@@ -62,30 +298,167 @@ class c_system(object):
         self. cpu = c_6502()
         self.memory = c_memory()
         if False:
-            self.memory.load_binary(0xc000, file("../../BeebEm3/BeebFile/BBCINT/OS12.ROM","r"))
-            self.memory.load_binary(0x8000, file("../../BeebEm3/BeebFile/BBCINT/BASIC2.ROM","r"))
+            self.memory.load_binary(0xc000, file("../../BeebEm3/BeebFile/BBCINT/OS12.ROM","r"), rom=True)
+            self.memory.load_binary(0x8000, file("../../BeebEm3/BeebFile/BBCINT/BASIC2.ROM","r"), rom=True)
             pass
+        self.fast_cpu = c_6502_fast(self.memory, self.cpu.microcode)
         self.cpu.reset()
+        self.cycle = 0
         pass
-    #f tick
-    def tick(self, verbose=False):
-        ts = self.cpu.tick_start()
-        if verbose:
-            print ts
-            pass
-        data_in = 0xff
-        if ts["mem"] is not None:
-            if ts["mem"][0] in ["read"]:
-                data_in = self.memory.read(ts["mem"][1])
+    #f snapshot
+    def snapshot(self):
+        """
+        Take a snapshot of the system state
+        """
+        return c_system_snapshot(self)
+    #f restore
+    def restore(self, snapshot):
+        """
+        Restore the system state (including cycle count) from a snapshot
+        """
+        cpu = self.cpu
+        cpu.registers[:] = array.array('B', snapshot.registers)
+        cpu.alu_flags = snapshot.alu_flags
+        if snapshot.in_reset:
+            cpu.reset()
+            pass
+        else:
+            cpu.decode(cpu.registers[R_IR])
+            pass
+        cpu.instr_cycle = snapshot.instr_cycle
+        self.memory.restore(snapshot.pages)
+        self.cycle = snapshot.cycle
+        pass
+    #f fork
+    def fork(self):
+        """
+        Create a copy of the system; memory pages are shared between
+        the two until written. Devices are not copied, and must be
+        mapped into the new system as required
+        """
+        system = self.__class__()
+        system.restore(self.snapshot())
+        return system
+    #f run
+    def run(self, num_cycles, skip_loops=False, check_interval=1024, verbose=False, trace=None):
+        """
+        Run the cycle-accurate CPU for num_cycles
+
+        If skip_loops is set then the system is snapshotted at an
+        instruction boundary every check_interval cycles. As the system
+        is deterministic, if a snapshot matches the previous one then
+        the system is periodic from then on; whole periods are then
+        skipped (the cycle count is maintained), and only the remainder
+        is run. This makes a program that ends in a 'jmp .' loop cheap
+        to run for a large number of cycles. As devices are not part of
+        a snapshot, loops are not skipped if any device is mapped.
+
+        If trace is True (or a c_bus_trace to append to) then the bus
+        activity of every cycle is recorded, and loops are not skipped;
+        the c_bus_trace is returned.
+        """
+        if trace is True: trace = c_bus_trace(num_cycles)
+        if trace is not None: skip_loops = False
+        if len(self.memory.tick_devices)>0: skip_loops = False
+        end = self.cycle + num_cycles
+        last_snapshot = None
+        while self.cycle<end:
+            check = min(end, self.cycle+check_interval)
+            self.run_cycles(check-self.cycle, trace=trace, verbose=verbose)
+            if not skip_loops: continue
+            while (self.cycle<end) and (self.cpu.instr_cycle!=0):
+                self.tick(verbose=verbose)
+                pass
+            if self.cycle>=end: break
+            snapshot = self.snapshot()
+            if snapshot==last_snapshot:
+                period = snapshot.cycle - last_snapshot.cycle
+                self.cycle += ((end-self.cycle)/period)*period
+                snapshot = None
+                pass
+            last_snapshot = snapshot
+            pass
+        return trace
+    #f run_cycles
+    def run_cycles(self, num_cycles, trace=None, verbose=False):
+        """
+        Run the cycle-accurate CPU for num_cycles, recording the bus
+        activity in trace if it is not None
+        """
+        cpu = self.cpu
+        memory = self.memory
+        if trace is not None:
+            if trace.length+num_cycles>trace.size:
+                raise Exception("Bus trace of %d cycles is too small to record %d more cycles"%(trace.size, num_cycles))
+            (addresses, datas, controls, n) = (trace.address, trace.data, trace.control, trace.length)
+            pass
+        for i in xrange(num_cycles):
+            mem_op = cpu.bus_start()
+            if verbose:
+                print cpu.describe_bus_cycle(mem_op)
+                pass
+            data_in = 0xff
+            if mem_op==MEM_READ:
+                data_in = memory.read(cpu.bus_address)
+                pass
+            elif mem_op==MEM_WRITE:
+                memory.write(cpu.bus_address, cpu.bus_data)
                 pass
-            elif ts["mem"][0] in ["write"]:
-                self.memory.write(ts["mem"][1], ts["mem"][2])
+            if trace is not None:
+                control = (cpu.bus_sync and CTL_SYNC) or 0
+                if mem_op==MEM_READ:
+                    addresses[n] = cpu.bus_address
+                    datas[n] = data_in
+                    control |= CTL_READ
+                    pass
+                elif mem_op==MEM_WRITE:
+                    addresses[n] = cpu.bus_address
+                    datas[n] = cpu.bus_data
+                    control |= CTL_WRITE
+                    pass
+                controls[n] = control
+                n += 1
+                trace.length = n
+                pass
+            cpu.tick_end(data_in=data_in)
+            if memory.tick_devices: memory.tick(1)
+            self.cycle += 1
+            if verbose:
+                print "%02x"%data_in, cpu.get_alu_result()
+                print cpu
                 pass
             pass
-        te = self.cpu.tick_end(data_in=data_in)
-        if verbose:
-            print "%02x"%data_in, te
-            print self.cpu
+        pass
+    #f tick_to_instruction_boundary
+    def tick_to_instruction_boundary(self, verbose=False):
+        """
+        Tick the cycle-accurate CPU until it is at the start of an instruction
+        """
+        while self.cpu.instr_cycle!=0:
+            self.tick(verbose=verbose)
             pass
         pass
-        
+    #f fast_forward
+    def fast_forward(self, num_instructions=None, num_cycles=None):
+        """
+        Run the functional CPU model for num_instructions, or until at
+        least num_cycles have elapsed, and hand back to the
+        cycle-accurate CPU at the instruction boundary reached
+
+        The cycle-accurate CPU is first ticked to an instruction
+        boundary if required; the cycle count is maintained as if the
+        cycle-accurate CPU had been run throughout.
+
+        Returns (instructions, cycles) run by the functional model
+        """
+        self.tick_to_instruction_boundary()
+        self.fast_cpu.load_from_cpu(self.cpu)
+        (instructions, cycles) = self.fast_cpu.run(num_instructions=num_instructions, num_cycles=num_cycles)
+        self.fast_cpu.store_to_cpu(self.cpu)
+        self.memory.tick(cycles)
+        self.cycle += cycles
+        return (instructions, cycles)
+    #f tick
+    def tick(self, verbose=False):
+        self.run_cycles(1, verbose=verbose)
+        pass
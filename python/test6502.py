@@ -3,8 +3,11 @@
 import re
 import unittest
 import sys, inspect
+import os, tempfile
+import hashlib, pickle
+import multiprocessing
 from instr6502 import c_6502_instruction_set
-from system6502 import c_system
+from system6502 import c_system, c_system_snapshot, c_bus_device, c_bus_trace, CTL_WRITE, CTL_SYNC
 from asm6502 import c_assembler
 
 #a Still to test
@@ -1964,9 +1967,105 @@ class test_6502_nmi(c_6502_test):
         pass
     verbose = False
 
+#a Assembled test cache
+#c c_load_data_cache
+class c_load_data_cache(object):
+    """
+    Cache of assembled test load data, keyed by a hash of the test data
+    (source text and base addresses) and of the assembler sources
+
+    Entries are held in memory and, if a directory is given, as pickle
+    files in that directory (which may be shared by many processes)
+    """
+    assembler_digest = None
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.load_data = {}
+        pass
+    #f get_assembler_digest
+    @classmethod
+    def get_assembler_digest(cls):
+        if cls.assembler_digest is None:
+            h = hashlib.sha1()
+            for module in (sys.modules[c_assembler.__module__], sys.modules[c_6502_instruction_set.__module__]):
+                h.update(file(inspect.getsourcefile(module)).read())
+                pass
+            cls.assembler_digest = h.hexdigest()
+            pass
+        return cls.assembler_digest
+    #f key
+    def key(self, data):
+        return hashlib.sha1(self.get_assembler_digest()+repr(data)).hexdigest()
+    #f filename
+    def filename(self, key):
+        return os.path.join(self.directory, key+".load_data")
+    #f get
+    def get(self, data):
+        key = self.key(data)
+        if key in self.load_data: return self.load_data[key]
+        if self.directory is None: return None
+        try:
+            f = open(self.filename(key), "rb")
+            self.load_data[key] = pickle.load(f)
+            f.close()
+            pass
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        return self.load_data[key]
+    #f add
+    def add(self, data, load_data):
+        key = self.key(data)
+        self.load_data[key] = load_data
+        if self.directory is None: return
+        if not os.path.isdir(self.directory): os.makedirs(self.directory)
+        (fd, temp_filename) = tempfile.mkstemp(dir=self.directory)
+        f = os.fdopen(fd, "wb")
+        pickle.dump(load_data, f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+        os.rename(temp_filename, self.filename(key))
+        pass
+    #f assemble
+    def assemble(self, data):
+        """
+        Get the load data for test data, assembling it if it is not cached
+        """
+        load_data = self.get(data)
+        if load_data is not None: return load_data
+        ass = c_assembler(c_6502_instruction_set())
+        load_data = []
+        for d in data:
+            if d[0] == "src":
+                code = ass.assemble(base_address=d[1], program=d[2])
+                for (s,e,m) in code:
+                    load_data.append( (s,m) )
+                pass
+            else:
+                load_data.append( (d[1],d[2]) )
+                pass
+            pass
+        self.add(data, load_data)
+        return load_data
+    pass
+
+#f run_test_job
+def run_test_job(data, num_cycles):
+    """
+    Assemble and run a test in a worker process, returning the load data and a snapshot of the final system state
+    """
+    load_data = Test6502Base.load_data_cache.assemble(data)
+    system = c_system()
+    for (s,m) in load_data:
+        system.memory.add_code(s,m)
+        pass
+    system.run(num_cycles, skip_loops=True)
+    return (load_data, system.snapshot())
+
 #c Test6502Base
 class Test6502Base(unittest.TestCase):
     auto_test_classes = []
+    auto_tests = {}
+    load_data_cache = c_load_data_cache(os.environ.get("TEST6502_CACHE_DIR"))
+    parallel_results = {}
     #c c_compiled_test
     class c_compiled_test(object):
         def __init__(self,test, load_data, num_cycles, expected_memory_data, verbose):
@@ -1977,45 +2076,65 @@ class Test6502Base(unittest.TestCase):
             self.verbose = verbose
             pass
         pass
+    #f get_test_data
+    @staticmethod
+    def get_test_data(test):
+        return [("src",0,test.src%test.src_args)]
     #f compile_cpu_test
     def compile_cpu_test(self, test=None, data=[], num_cycles=20, expected_memory_data=None, verbose=False):
         if test is not None:
-            data=[("src",0,test.src%test.src_args)]
+            data = self.get_test_data(test)
             num_cycles = test.num_cycles
             expected_memory_data = test.expected_memory_data
             verbose = test.verbose
             pass
-        ass = c_assembler(c_6502_instruction_set())
-        load_data = []
-        for d in data:
-            if d[0] == "src":
-                code = ass.assemble(base_address=d[1], program=d[2])
-                for (s,e,m) in code:
-                    load_data.append( (s,m) )
-                pass
-            else:
-                load_data.append( (d[1],d[2]) )
-                pass
-            pass
+        load_data = self.load_data_cache.assemble(data)
         return Test6502Base.c_compiled_test(test, load_data, num_cycles, expected_memory_data, verbose)
     #f run_cpu_test
     def run_cpu_test(self, test=None, data=[], num_cycles=20, expected_memory_data=None, verbose=False):
-        compiled_test = self.compile_cpu_test(test, data, num_cycles, expected_memory_data, verbose)
-        system = c_system()
-        for (s,m) in compiled_test.load_data:
-            system.memory.add_code(s,m)
+        if test in self.parallel_results:
+            (load_data, snapshot) = self.parallel_results[test].get()
+            self.load_data_cache.add(self.get_test_data(test), load_data)
+            system = c_system()
+            system.restore(snapshot)
+            expected_memory_data = test.expected_memory_data
             pass
-        for i in range(compiled_test.num_cycles):
-            system.tick(verbose=compiled_test.verbose)
+        else:
+            compiled_test = self.compile_cpu_test(test, data, num_cycles, expected_memory_data, verbose)
+            system = c_system()
+            for (s,m) in compiled_test.load_data:
+                system.memory.add_code(s,m)
+                pass
+            system.run(compiled_test.num_cycles, skip_loops=not compiled_test.verbose, verbose=compiled_test.verbose)
+            expected_memory_data = compiled_test.expected_memory_data
             pass
-        if compiled_test.expected_memory_data is not None:
+        if expected_memory_data is not None:
             system.memory.dump(0)
-            for (a,e) in compiled_test.expected_memory_data:
+            for (a,e) in expected_memory_data:
                 v = system.memory.read(a)
                 self.assertEqual(v,e,"Expected address %04x to have data %02x but had %02x"%(a,e,v))
                 pass
             pass
         pass
+    #f start_parallel_tests
+    @classmethod
+    def start_parallel_tests(cls, tests, pool):
+        """
+        Start the auto tests in a test suite that use the standard
+        run_cpu_test running in a process pool; when each such test is
+        run it picks up its result from the pool
+        """
+        for test_case in tests:
+            if isinstance(test_case, unittest.TestSuite):
+                cls.start_parallel_tests(test_case, pool)
+                continue
+            if not isinstance(test_case, Test6502Base): continue
+            if type(test_case).run_cpu_test.im_func is not Test6502Base.run_cpu_test.im_func: continue
+            t = test_case.auto_tests.get(test_case._testMethodName)
+            if (t is None) or t.verbose or (t in cls.parallel_results): continue
+            cls.parallel_results[t] = pool.apply_async(run_test_job, (cls.get_test_data(t), t.num_cycles))
+            pass
+        pass
     #f get_subclasses
     @classmethod
     def get_subclasses(cls):
@@ -2031,11 +2150,13 @@ class Test6502Base(unittest.TestCase):
     #f create_tests
     @classmethod
     def create_tests(cls):
+        cls.auto_tests = {}
         for t in cls.auto_test_classes:
             def run_test(self, test=t):
                 self.run_cpu_test(test)
                 pass
             setattr( cls, "test_atc_%s"%(t.__name__), run_test )
+            cls.auto_tests["test_atc_%s"%(t.__name__)] = t
             pass
         pass
     #f create_subclass_tests
@@ -2109,10 +2230,269 @@ class Test6502_Interrupt(Test6502Base):
                           test_6502_nmi,
                           )
 
+#c Test6502_FastForward
+class Test6502_FastForward(Test6502Base):
+    """
+    Run the functional model in lockstep with the cycle-accurate model,
+    checking the state and cycle count at every instruction boundary
+    """
+    auto_test_classes = ( test_6502_simplest,
+                          test_6502_stack,
+                          test_6502_branches,
+                          test_6502_xy_reg,
+                          test_6502_shift,
+                          test_6502_addressing_logical_adc,
+                          test_6502_addressing_logical_cmp,
+                          test_6502_sta_flags_set,
+                          test_6502_mem_loop256_cross_page,
+                          test_6502_coverage,
+                          )
+    #f load_system
+    def load_system(self, compiled_test):
+        system = c_system()
+        for (s,m) in compiled_test.load_data:
+            system.memory.add_code(s,m)
+            pass
+        return system
+    #f run_cpu_test
+    def run_cpu_test(self, test):
+        compiled_test = self.compile_cpu_test(test)
+        cycle_system = self.load_system(compiled_test)
+        fast_system  = self.load_system(compiled_test)
+        fast_cpu = fast_system.fast_cpu
+        fast_cpu.load_from_cpu(fast_system.cpu)
+        while cycle_system.cycle<compiled_test.num_cycles:
+            cycle_system.tick()
+            cycle_system.tick_to_instruction_boundary()
+            cycle_system.fast_cpu.load_from_cpu(cycle_system.cpu)
+            fast_cpu.step()
+            self.assertEqual(str(fast_cpu), str(cycle_system.fast_cpu), "Mismatch in CPU state after %d cycles"%cycle_system.cycle)
+            self.assertEqual(fast_cpu.cycles, cycle_system.cycle, "Mismatch in cycle count at %04x"%fast_cpu.pc)
+            pass
+        self.assertEqual(fast_system.memory.data, cycle_system.memory.data, "Mismatch in memory contents")
+        pass
+    #f test_handoff
+    def test_handoff(self):
+        compiled_test = self.compile_cpu_test(test_6502_addressing_logical_sbc)
+        system = self.load_system(compiled_test)
+        system.fast_forward(num_cycles=compiled_test.num_cycles/2)
+        system.run(compiled_test.num_cycles-system.cycle, skip_loops=True)
+        for (a,e) in compiled_test.expected_memory_data:
+            v = system.memory.read(a)
+            self.assertEqual(v,e,"Expected address %04x to have data %02x but had %02x"%(a,e,v))
+            pass
+        pass
+    pass
+
+#c Test6502_Snapshot
+class Test6502_Snapshot(Test6502Base):
+    """
+    Check snapshot, restore and fork of a system, and the skipping of
+    periodic states when running
+    """
+    #f load_system
+    def load_system(self, test):
+        compiled_test = self.compile_cpu_test(test)
+        system = c_system()
+        for (s,m) in compiled_test.load_data:
+            system.memory.add_code(s,m)
+            pass
+        return system
+    #f test_fork
+    def test_fork(self):
+        system = self.load_system(test_6502_mem_loop256)
+        system.run(1000)
+        forked_system = system.fork()
+        snapshot = system.snapshot()
+        system.run(2000)
+        self.assertNotEqual(system.snapshot(), snapshot, "System state should have changed")
+        self.assertEqual(forked_system.snapshot(), snapshot, "Forked system should be unaffected by its parent")
+        forked_system.run(2000)
+        self.assertEqual(forked_system.snapshot(), system.snapshot(), "Forked system should run identically to its parent")
+        self.assertEqual(forked_system.cycle, system.cycle)
+        pass
+    #f test_save_restore
+    def test_save_restore(self):
+        system = self.load_system(test_6502_stack)
+        system.run(517)
+        snapshot = system.snapshot()
+        filename = tempfile.mktemp(suffix=".snapshot")
+        snapshot.save(filename)
+        system.run(500)
+        end_snapshot = system.snapshot()
+        system.restore(c_system_snapshot.load(filename))
+        os.unlink(filename)
+        self.assertEqual(system.snapshot(), snapshot, "Restored system should match snapshot")
+        self.assertEqual(system.cycle, 517)
+        system.run(500)
+        self.assertEqual(system.snapshot(), end_snapshot, "Restored system should run identically")
+        pass
+    #f test_skip_loops
+    def test_skip_loops(self):
+        system = self.load_system(test_6502_sta_flags_set)
+        skip_system = system.fork()
+        system.run(test_6502_sta_flags_set.num_cycles+7)
+        skip_system.run(test_6502_sta_flags_set.num_cycles+7, skip_loops=True, check_interval=64)
+        self.assertEqual(skip_system.snapshot(), system.snapshot(), "Skipping loops should not change the final state")
+        self.assertEqual(skip_system.cycle, system.cycle)
+        pass
+    #f test_map_rom_after_snapshot
+    def test_map_rom_after_snapshot(self):
+        system = c_system()
+        system.memory.write(0x1000, 1)
+        snapshot = system.snapshot()
+        system.memory.map_rom(0x1000, [0x55])
+        self.assertEqual(system.memory.read(0x1000), 0x55)
+        system.restore(snapshot)
+        self.assertEqual(system.memory.read(0x1000), 1, "Mapping a ROM should not change a snapshot")
+        pass
+    pass
+
 #c Tests
 Test6502Base.create_subclass_tests()
 
+#c Test6502_Bus
+class Test6502_Bus(Test6502Base):
+    """
+    Check ROM and device pages of the memory bus
+    """
+    #c c_latch_device
+    class c_latch_device(c_bus_device):
+        """
+        Device that returns the last value written plus the offset of the address read, and counts cycles
+        """
+        def __init__(self):
+            self.latch = 0
+            self.cycles = 0
+            pass
+        def read(self, address):
+            return (self.latch + (address&0xff))&0xff
+        def write(self, address, data):
+            self.latch = data
+            pass
+        def tick(self, cycles):
+            self.cycles += cycles
+            pass
+        pass
+    src = """. = $fffb
+    jmp code_start
+    . = $400
+    code_start:
+        lda #0x10
+        sta 0xfe00
+        lda 0xfe03
+        sta 0x00
+        lda #0x55
+        sta 0xc001
+        lda 0xc001
+        sta 0x01
+    done: jmp done
+    """
+    #f test_devices
+    def test_devices(self):
+        compiled_test = self.compile_cpu_test(data=[("src",0,self.src)])
+        system = c_system()
+        for (s,m) in compiled_test.load_data:
+            system.memory.add_code(s,m)
+            pass
+        device = self.c_latch_device()
+        system.memory.map_device(device, 0xfe00)
+        system.memory.map_rom(0xc000, (0x11,0x22,0x33))
+        system.run(200, skip_loops=True)
+        self.assertEqual(system.memory.read(0x00), 0x13, "Expected read from device")
+        self.assertEqual(system.memory.read(0x01), 0x22, "Expected ROM to be unaffected by write")
+        self.assertEqual(device.latch, 0x10, "Expected write to device")
+        self.assertEqual(device.cycles, 200, "Expected device to be ticked every cycle")
+        system.fast_forward(num_cycles=100)
+        self.assertEqual(device.cycles, system.cycle, "Expected device to be ticked by fast forward")
+        pass
+    #f test_bus_trace
+    def test_bus_trace(self):
+        compiled_test = self.compile_cpu_test(test_6502_stack)
+        system = c_system()
+        for (s,m) in compiled_test.load_data:
+            system.memory.add_code(s,m)
+            pass
+        trace = system.run(compiled_test.num_cycles, trace=True)
+        self.assertEqual(len(trace), compiled_test.num_cycles)
+        written = {}
+        for n in range(len(trace)):
+            (address, data, control) = trace.get_cycle(n)
+            if control & CTL_WRITE: written[address] = data
+            pass
+        for (a,e) in compiled_test.expected_memory_data:
+            self.assertEqual(written.get(a),e,"Expected trace to have written %02x to address %04x"%(e,a))
+            pass
+        filename = tempfile.mktemp(suffix=".bus_trace")
+        trace.save(filename)
+        loaded_trace = c_bus_trace.load(filename)
+        os.unlink(filename)
+        self.assertEqual(len(loaded_trace), len(trace))
+        self.assertEqual(loaded_trace.first_difference(trace), None, "Expected loaded trace to match")
+        pass
+    pass
+
+#c Test6502_Profile
+class Test6502_Profile(Test6502Base):
+    """
+    Check the per-opcode profile against a bus trace of the same run
+    """
+    #f profile_test
+    def profile_test(self, test):
+        compiled_test = self.compile_cpu_test(test)
+        system = c_system()
+        for (s,m) in compiled_test.load_data:
+            system.memory.add_code(s,m)
+            pass
+        profile = system.cpu.enable_profiling()
+        trace = system.run(compiled_test.num_cycles, trace=True)
+        self.assertEqual(system.cpu.disable_profiling(), profile)
+        self.assertFalse("tick_end" in system.cpu.__dict__, "Expected uninstrumented tick_end after profiling")
+        results = profile.get_results()
+        syncs = len([n for n in range(len(trace)) if trace.get_cycle(n)[2] & CTL_SYNC])
+        self.assertEqual(sum([r["cycles"] for r in results]), compiled_test.num_cycles)
+        self.assertEqual(sum([r["count"] for r in results]), syncs, "Expected one instruction completed per opcode fetch")
+        self.assertTrue(profile.report().endswith("Total cycles %d\n"%compiled_test.num_cycles))
+        return results
+    #f test_branches
+    def test_branches(self):
+        results = self.profile_test(test_6502_mem_loop256)
+        bne = [r for r in results if r["mnemonic"]=="bne"][0]
+        self.assertEqual(bne["count"], 256, "Expected loop of 256 iterations")
+        self.assertEqual(bne["branches_taken"], 255, "Expected loop branch to be taken on all but the last iteration")
+        self.assertEqual(bne["page_crossings"], 0, "Expected loop branch not to cross a page")
+        pass
+    #f test_page_crossing
+    def test_page_crossing(self):
+        results = self.profile_test(test_6502_mem_loop256_cross_page)
+        crossings = sum([r["page_crossings"] for r in results])
+        self.assertTrue(crossings>0, "Expected page crossings")
+        pass
+    pass
+
+#c c_test_program
+class c_test_program(unittest.TestProgram):
+    """
+    unittest main program that runs the selected auto tests in a pool
+    of TEST6502_PROCESSES processes (default is the number of CPUs)
+    """
+    def runTests(self):
+        processes = int(os.environ.get("TEST6502_PROCESSES", multiprocessing.cpu_count()))
+        if processes<=1:
+            return unittest.TestProgram.runTests(self)
+        pool = multiprocessing.Pool(processes)
+        try:
+            Test6502Base.start_parallel_tests(self.test, pool)
+            pool.close()
+            unittest.TestProgram.runTests(self)
+            pass
+        finally:
+            pool.terminate()
+            pass
+        pass
+    pass
+
 #a Toplevel
 if __name__=="__main__":
-    unittest.main()
+    c_test_program()
 
@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+#a Imports
+import os
+import unittest
+import tempfile
+import random
+import struct
+import StringIO
+import dump
+
+#a Reference model
+#c c_dict_dump
+class c_dict_dump(dump.c_dump):
+    """
+    The dump as it was with its data in a dictionary, adding a byte at a time
+    """
+    #f reset
+    def reset(self):
+        self.labels = {}
+        self.data   = {}
+        pass
+    #f add_data_byte
+    def add_data_byte(self,data,address,base_address=0, address_mask=0xffffffff):
+        address = (address-base_address) & address_mask
+        offset = address&3
+        address = address/4
+        data = data << (8*offset)
+        if address in self.data:
+            mask = (0xff << (8*offset)) ^ 0xffffffff
+            data = data | (self.data[address] & mask)
+            pass
+        self.data[address] = data
+        pass
+    #f add_data_bytes
+    def add_data_bytes(self,data,address,base_address=0, address_mask=0xffffffff):
+        for (n, d) in enumerate(data):
+            self.add_data_byte(ord(d),address+n,base_address,address_mask)
+            pass
+        pass
+    #f add_data
+    def add_data(self,data,address,base_address=0, address_mask=0xffffffff):
+        address = (address-base_address) & address_mask
+        offset = address&3
+        address = address/4
+        if offset!=0:
+            self.add_data((data<<(8*offset))&0xffffffff,address*4,base_address=0)
+            self.add_data((data>>(32-8*offset))&0xffffffff,address*4+4,base_address=0)
+            return
+        if address in self.data:
+            data = data | self.data[address]
+            pass
+        self.data[address] = data
+        pass
+    #f package_data
+    def package_data(self, max_per_base=1024):
+        package = []
+        addresses = sorted(self.data.keys())
+        while len(addresses)>0:
+            base = addresses[0]
+            data = []
+            i = base
+            while (len(addresses)>0) and (i==addresses[0]) and (len(data)<max_per_base):
+                data.append(self.data[i])
+                addresses.pop(0)
+                i += 1
+                pass
+            package.append((base,data))
+            pass
+        return package
+    #f write_mif
+    def write_mif(self, f):
+        labels = self.labels.keys()
+        labels.sort(cmp=lambda a,b:cmp(self.labels[a],self.labels[b]))
+        label_addresses_map = {}
+        for l in labels:
+            la = self.labels[l]
+            if la not in label_addresses_map: label_addresses_map[la]=[]
+            label_addresses_map[la].append(l)
+            pass
+        for l in labels:
+            print >>f, "#%8x:%s"%(self.labels[l],l)
+            pass
+        for a in sorted(self.data.keys()):
+            r = "%08x: "%a
+            r += "%08x" % self.data[a]
+            if a in label_addresses_map:
+                r += " #"
+                for l in label_addresses_map[a]:
+                    r += " %s"%l
+                    pass
+                pass
+            print >>f, r
+            pass
+        pass
+    #f write_mem
+    def write_mem(self, f):
+        for a in sorted(self.data.keys()):
+            print >>f, "@%08x %08x"%(a, self.data[a])
+            pass
+        pass
+    #f write_c_data
+    def write_c_data(self, f):
+        print >>f, "static uint32_t data[] = {"
+        r = ""
+        for a in sorted(self.data.keys()):
+            r += " %d, 0x%08x,"%(a,self.data[a])
+            if (len(r)>50):
+                print >>f, r
+                r = ""
+                pass
+            pass
+        r += " -1, -1"
+        print >>f, r
+        print >>f, "};"
+        pass
+    pass
+
+#a ELF fixture
+#f elf_file
+def elf_file(segments, symbols):
+    """
+    Return a little-endian ELF32 RISC-V executable with PT_LOAD segments of
+    (address, data, memory size) and a symbol table of (name, value)
+    """
+    (ehdr, phdr, shdr, sym) = (struct.Struct("<16sHHIIIIIHHHHHH"), struct.Struct("<IIIIIIII"),
+                               struct.Struct("<IIIIIIIIII"), struct.Struct("<IIIBBH"))
+    body = ""
+    offset = ehdr.size + phdr.size*len(segments)
+    phdrs = ""
+    for (address, data, memsz) in segments:
+        phdrs += phdr.pack(1, offset+len(body), address, address, len(data), memsz, 5, 4)
+        body += data
+        pass
+    strtab = "\0"
+    symtab = sym.pack(0, 0, 0, 0, 0, 0)
+    for (name, value) in symbols:
+        symtab += sym.pack(len(strtab), value, 0, 0x10, 0, 0xfff1) # Global, absolute
+        strtab += name+"\0"
+        pass
+    shstrtab = "\0.symtab\0.strtab\0.shstrtab\0"
+    sections = [(0, 0, "", 0, 0), (1, 2, symtab, 2, sym.size), (9, 3, strtab, 0, 0), (17, 3, shstrtab, 0, 0)]
+    shdrs = ""
+    for (name, sh_type, data, link, entsize) in sections:
+        shdrs += shdr.pack(name, sh_type, 0, 0, offset+len(body), len(data), link, len(symbols)+1 if sh_type==2 else 0, 1, entsize)
+        body += data
+        pass
+    header = ehdr.pack("\x7fELF\x01\x01\x01"+"\0"*9, 2, 0xf3, 1, segments[0][0], ehdr.size, offset+len(body), 0,
+                       ehdr.size, phdr.size, len(segments), shdr.size, len(sections), 3)
+    return header + phdrs + body + shdrs
+
+#a Unit tests
+#c test_dump_memory
+class test_dump_memory(unittest.TestCase):
+    """
+    Check c_dump with its paged memory against the dictionary model
+    """
+    #f written
+    def written(self, d, fn):
+        f = StringIO.StringIO()
+        fn(d, f)
+        return f.getvalue()
+    #f check_same
+    def check_same(self, d, ref):
+        self.assertEqual(len(d.data), len(ref.data))
+        self.assertEqual(d.data.items(), sorted(ref.data.items()))
+        self.assertEqual(d.data.keys(), sorted(ref.data.keys()))
+        for max_per_base in (1, 3, 1024):
+            self.assertEqual(d.package_data(max_per_base), ref.package_data(max_per_base))
+            pass
+        for fn in (dump.c_dump.write_mif, dump.c_dump.write_mem, dump.c_dump.write_c_data):
+            self.assertEqual(self.written(d, fn), self.written(ref, getattr(c_dict_dump, fn.__name__)))
+            pass
+        for a in range(0, 0x900, 7)+[0x40000, 0x40001, 0x123456]:
+            self.assertEqual(a in d.data, a in ref.data)
+            self.assertEqual(d.data.get(a), ref.data.get(a))
+            pass
+        pass
+    #f apply
+    def apply(self, operations):
+        (d, ref) = (dump.c_dump(), c_dict_dump())
+        for (fn, args) in operations:
+            getattr(d, fn)(*args)
+            getattr(ref, fn)(*args)
+            pass
+        return (d, ref)
+    #f test_empty
+    def test_empty(self):
+        (d, ref) = self.apply([])
+        self.check_same(d, ref)
+        self.assertEqual(d.package_data(), [])
+        pass
+    #f test_sparse_words
+    def test_sparse_words(self):
+        (d, ref) = self.apply([("add_data", (0x12345678, 0x100000)),
+                               ("add_data", (0x9abcdef0, 0x0)),
+                               ("add_data", (0x11111111, 0x1000)), # Page boundary in words
+                               ("add_data", (0x22222222, 0xffc)),
+                               ("add_data", (0x33333333, 0x1004)),
+                               ("add_label", ("start", 0x1000)),
+                               ("add_label", ("other", 0x1000)),
+                               ])
+        self.check_same(d, ref)
+        pass
+    #f test_overlapping_writes
+    def test_overlapping_writes(self):
+        (d, ref) = self.apply([("add_data_bytes", ("abcdefghij", 0x201)),
+                               ("add_data_bytes", ("0123456789abcdef", 0x200)),
+                               ("add_data", (0xf0f0f0f0, 0x206)),  # Unaligned word ORs into two words
+                               ("add_data_byte", (0x5a, 0x210)),
+                               ("add_data_bytes", ("x"*5000, 0xffe)),   # Crosses pages
+                               ("add_data_bytes", ("y"*4096, 0x1000)),  # Within what was written
+                               ("add_data_byte", (0x7e, 0x3000)),
+                               ])
+        self.check_same(d, ref)
+        pass
+    #f test_random
+    def test_random(self):
+        r = random.Random(1)
+        operations = []
+        for i in range(300):
+            address = r.choice((0, 0x3f00, 0x10000, 0x7fff0)) + r.randrange(0x400)
+            op = r.randrange(3)
+            if op==0: operations.append(("add_data", (r.getrandbits(32), address)))
+            if op==1: operations.append(("add_data_byte", (r.getrandbits(8), address)))
+            if op==2: operations.append(("add_data_bytes", ("".join([chr(r.getrandbits(8)) for j in range(r.randrange(1,64))]), address)))
+            pass
+        (d, ref) = self.apply(operations)
+        self.check_same(d, ref)
+        pass
+    #f test_base_address_and_mask
+    def test_base_address_and_mask(self):
+        (d, ref) = self.apply([("add_data_bytes", ("abcdefgh", 0x80001001, 0x80000000, 0xffff)),
+                               ("add_data", (0xdeadbeef, 0x80011000, 0x80000000, 0xffff)),
+                               ])
+        self.check_same(d, ref)
+        pass
+    pass
+
+#c test_dump_elf
+class test_dump_elf(unittest.TestCase):
+    """
+    Check the loading of ELF segments and symbols
+    """
+    elf = elf_file(segments=[(0x80000000, "".join([chr(i) for i in range(16)]), 16),
+                             (0x80001000, "abcdefgh", 22), # 14 bytes of .bss
+                             ],
+                   symbols=[("_start", 0x80000000), ("data", 0x80001000), ("bss_end", 0x80001016), ("high", 0x80020004)])
+    #f test_segments
+    def test_segments(self):
+        d = dump.c_dump()
+        d.load_elf(StringIO.StringIO(self.elf), base_address=0x80000000)
+        self.assertEqual(d.data.items(), [(0, 0x03020100), (1, 0x07060504), (2, 0x0b0a0908), (3, 0x0f0e0d0c),
+                                          (0x400, 0x64636261), (0x401, 0x68676665),
+                                          (0x402, 0), (0x403, 0), (0x404, 0), (0x405, 0)])
+        pass
+    #f test_bss_zero_filled
+    def test_bss_zero_filled(self):
+        d = dump.c_dump()
+        d.load_elf(StringIO.StringIO(self.elf), base_address=0x80000000)
+        image = StringIO.StringIO()
+        d.write_bin(image, base_address=0x1000, size=24)
+        self.assertEqual(image.getvalue(), "abcdefgh"+"\0"*16)
+        pass
+    #f test_symbols_masked
+    def test_symbols_masked(self):
+        d = dump.c_dump()
+        d.load_elf(StringIO.StringIO(self.elf), base_address=0x80000000, address_mask=0xffff)
+        self.assertEqual(d.labels, {"":0, "_start":0, "data":0x1000, "bss_end":0x1016, "high":0x4})
+        self.assertEqual(d.data.keys(), [0, 1, 2, 3, 0x400, 0x401, 0x402, 0x403, 0x404, 0x405])
+        pass
+    pass
+
+#c test_dump_ihex_bin
+class test_dump_ihex_bin(unittest.TestCase):
+    """
+    Check Intel HEX and raw binary files
+    """
+    #f sample
+    def sample(self):
+        r = random.Random(2)
+        d = dump.c_dump()
+        d.add_data_bytes("".join([chr(r.getrandbits(8)) for i in range(70000)]), 0xfff0) # Crosses 64kB boundaries
+        d.add_data_bytes("0123456789", 0x80000003)
+        d.add_data(0xcafef00d, 0x12345678)
+        return d
+    #f ihex
+    def ihex(self, d, **kwargs):
+        f = StringIO.StringIO()
+        d.write_ihex(f, **kwargs)
+        return f.getvalue()
+    #f load_ihex
+    def load_ihex(self, text, **kwargs):
+        d = dump.c_dump()
+        d.load_ihex(StringIO.StringIO(text), **kwargs)
+        return d
+    #f test_ihex_round_trip
+    def test_ihex_round_trip(self):
+        d = self.sample()
+        for bytes_per_record in (16, 32, 7):
+            text = self.ihex(d, bytes_per_record=bytes_per_record)
+            self.assertTrue(":020000040001F9\n" in text)
+            self.assertTrue(":0200000480007A\n" in text)
+            self.assertTrue(text.endswith(":00000001FF\n"))
+            self.assertEqual(self.load_ihex(text).data.items(), d.data.items())
+            self.assertEqual(self.load_ihex(text.replace("\n","\r\n")).data.items(), d.data.items())
+            pass
+        pass
+    #f test_ihex_records
+    def test_ihex_records(self):
+        self.assertEqual(dump.ihex_record(2, 0, "\x12\x00"), ":020000021200EA\n")
+        self.assertEqual(dump.ihex_record(4, 0, "\x00\xff"), ":0200000400FFFB\n")
+        self.assertEqual(dump.ihex_record(0, 0x0030, "\x02\x33\x7a"), ":0300300002337A1E\n")
+        pass
+    #f test_ihex_segment_and_linear
+    def test_ihex_segment_and_linear(self):
+        text = (dump.ihex_record(2, 0, "\x12\x00") +      # Segment 0x1200, base 0x12000
+                dump.ihex_record(0, 0x0004, "abcd") +
+                dump.ihex_record(4, 0, "\x00\x02") +      # Linear base 0x20000
+                dump.ihex_record(0, 0x0008, "efgh") +
+                dump.ihex_record(1, 0, "") +
+                dump.ihex_record(0, 0x0000, "ignored after the end of file"))
+        d = self.load_ihex(text)
+        self.assertEqual(d.data.items(), [(0x12004/4, 0x64636261), (0x20008/4, 0x68676665)])
+        d = self.load_ihex(text, base_address=0x12000, address_mask=0xffff)
+        self.assertEqual(d.data.items(), [(0x1, 0x64636261), (0x3802, 0x68676665)])
+        pass
+    #f test_ihex_bad_checksum
+    def test_ihex_bad_checksum(self):
+        text = self.ihex(self.sample())
+        lines = text.split("\n")
+        for n in (1, 100, len(lines)-3):
+            corrupt = list(lines)
+            corrupt[n] = corrupt[n][:-2] + "%02X"%((int(corrupt[n][-2:],16)+1)&0xff)
+            self.assertRaises(Exception, self.load_ihex, "\n".join(corrupt))
+            pass
+        self.assertRaises(Exception, self.load_ihex, ":0400000061626364FF\n")
+        self.assertRaises(Exception, self.load_ihex, ":04000000616263\n")
+        self.assertRaises(Exception, self.load_ihex, "0400000061626364D6\n")
+        pass
+    #f test_bin_at_base
+    def test_bin_at_base(self):
+        d = dump.c_dump()
+        d.load_bin(StringIO.StringIO("abcdefghij"), base_address=0x80000000, address=0x80001002)
+        self.assertEqual(d.data.items(), [(0x400, 0x62610000), (0x401, 0x66656463), (0x402, 0x6a696867)])
+        f = StringIO.StringIO()
+        d.write_bin(f)
+        self.assertEqual(f.getvalue(), "\0\0abcdefghij")
+        d.load_bin(StringIO.StringIO("abcdefghij"), base_address=0x80000000)
+        self.assertEqual(d.data.items(), [(0, 0x64636261), (1, 0x68676665), (2, 0x6a69)])
+        pass
+    #f test_load_file
+    def test_load_file(self):
+        d = dump.c_dump()
+        d.add_data_bytes("".join([chr(i&0xff) for i in range(1000)]), 0x80000000)
+        directory = tempfile.mkdtemp()
+        try:
+            for extension in (".hex", ".bin"):
+                filename = os.path.join(directory, "image"+extension)
+                dump.file_write(filename, lambda f:dump.file_writers[extension](d, f))
+                loaded = dump.c_dump()
+                loaded.load_file(filename, base_address=0x80000000)
+                self.assertEqual(loaded.data.items(), [(a-0x80000000/4, w) for (a, w) in d.data.items()])
+                pass
+            pass
+        finally:
+            for f in os.listdir(directory): os.unlink(os.path.join(directory, f))
+            os.rmdir(directory)
+            pass
+        pass
+    pass
+
+#c test_mif_cache
+class test_mif_cache(unittest.TestCase):
+    """
+    Check that the MIF cache misses whenever the image would load differently
+    """
+    #f setUp
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.image = os.path.join(self.directory, "image.bin")
+        self.write_image("abcdefgh")
+        self.cache = dump.c_mif_cache(os.path.join(self.directory, "cache"))
+        pass
+    #f tearDown
+    def tearDown(self):
+        for (path, dirs, files) in os.walk(self.directory, topdown=False):
+            for f in files: os.unlink(os.path.join(path, f))
+            os.rmdir(path)
+            pass
+        pass
+    #f write_image
+    def write_image(self, data):
+        f = open(self.image, "wb")
+        f.write(data)
+        f.close()
+        pass
+    #f store
+    def store(self, *parameters):
+        d = dump.c_dump()
+        d.load_file(self.image, *parameters)
+        return self.cache.store(self.cache.key(self.image, *parameters), d)
+    #f test_hit
+    def test_hit(self):
+        filename = self.store(0x1000, 0xffff)
+        self.assertEqual(self.cache.lookup(self.cache.key(self.image, 0x1000, 0xffff)), filename)
+        self.assertEqual(open(filename).read(), "00000000: 64636261\n00000001: 68676665\n")
+        pass
+    #f test_parameters_miss
+    def test_parameters_miss(self):
+        self.store(0x1000, 0xffff)
+        self.assertEqual(self.cache.lookup(self.cache.key(self.image, 0x2000, 0xffff)), None)
+        self.assertEqual(self.cache.lookup(self.cache.key(self.image, 0x1000, 0xfff)), None)
+        self.assertEqual(self.cache.lookup(self.cache.key(self.image)), None)
+        pass
+    #f test_image_miss
+    def test_image_miss(self):
+        self.store(0x1000, 0xffff)
+        self.write_image("abcdefgi")
+        self.assertEqual(self.cache.lookup(self.cache.key(self.image, 0x1000, 0xffff)), None)
+        pass
+    #f test_extension_miss
+    def test_extension_miss(self):
+        self.store(0x1000, 0xffff)
+        other = os.path.join(self.directory, "image.hex")
+        os.rename(self.image, other)
+        self.assertEqual(self.cache.lookup(self.cache.key(other, 0x1000, 0xffff)), None)
+        os.rename(other, self.image)
+        pass
+    #f test_loader_version_miss
+    def test_loader_version_miss(self):
+        self.store(0x1000, 0xffff)
+        loader_version = dump.loader_version
+        try:
+            dump.loader_version += 1
+            self.assertEqual(self.cache.lookup(self.cache.key(self.image, 0x1000, 0xffff)), None)
+            pass
+        finally:
+            dump.loader_version = loader_version
+            pass
+        self.assertNotEqual(self.cache.lookup(self.cache.key(self.image, 0x1000, 0xffff)), None)
+        pass
+    pass
+
+#a Toplevel
+if __name__=="__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+#a Imports
+import unittest
+from rv_batch import log_names
+
+#a Unit tests
+#c test_rv_batch_log_names
+class test_rv_batch_log_names(unittest.TestCase):
+    #f test_relative_names
+    def test_relative_names(self):
+        names = log_names(["run/a/itrace.log", "run/b/itrace.log", "run/c.log"])
+        self.assertEqual(names, {"run/a/itrace.log":"a_itrace", "run/b/itrace.log":"b_itrace", "run/c.log":"c"})
+        pass
+    #f test_separator_collision
+    def test_separator_collision(self):
+        logs = ["run/a/b_c.log", "run/a_b/c.log", "run/d/e.log"]
+        names = log_names(logs)
+        self.assertEqual(len(set(names.values())), 3)
+        self.assertEqual(names["run/d/e.log"], "d_e")
+        for l in logs[:2]:
+            self.assertTrue(names[l].startswith("a_b_c_"))
+            pass
+        self.assertEqual(log_names(list(reversed(logs))), names)
+        pass
+    #f test_same_log_twice
+    def test_same_log_twice(self):
+        self.assertRaises(Exception, log_names, ["run/a.log", "run/./a.log"])
+        pass
+    pass
+
+#a Toplevel
+if __name__=="__main__":
+    unittest.main()
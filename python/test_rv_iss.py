@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+#a Imports
+import os
+import unittest
+import dump
+from rv_iss import c_rv_iss, CSR_MCAUSE, CSR_MTVAL, MCAUSE_ILLEGAL_INSTRUCTION
+from rv_tracefile import read_trace
+
+#a Instruction encoding
+#f r_type
+def r_type(funct7, rs2, rs1, funct3, rd, opcode=0x33):
+    return (funct7<<25) | (rs2<<20) | (rs1<<15) | (funct3<<12) | (rd<<7) | opcode
+
+#f addi
+def addi(rd, rs1, imm):
+    return ((imm&0xfff)<<20) | (rs1<<15) | (rd<<7) | 0x13
+
+#f lui
+def lui(rd, imm):
+    return (imm<<12) | (rd<<7) | 0x37
+
+#f muldiv
+def muldiv(op, rd, rs1, rs2):
+    funct3 = ("mul", "mulh", "mulhsu", "mulhu", "div", "divu", "rem", "remu").index(op)
+    return r_type(1, rs2, rs1, funct3, rd)
+
+#f c_ci
+def c_ci(funct3, rd, imm, quadrant):
+    return (funct3<<13) | (((imm>>5)&1)<<12) | (rd<<7) | ((imm&0x1f)<<2) | quadrant
+
+#f c_cr
+def c_cr(funct4, rd, rs2):
+    return (funct4<<12) | (rd<<7) | (rs2<<2) | 2
+
+#f c_j
+def c_j(offset):
+    bits = [(11,12), (4,11), (9,10), (8,9), (10,8), (6,7), (7,6), (3,5), (2,4), (1,3), (5,2)]
+    return (5<<13) | sum([((offset>>i)&1)<<b for (i, b) in bits]) | 1
+
+#f image
+def image(program):
+    """
+    Return a c_dump of a program of (instruction, size in bytes) from address 0
+    """
+    address = 0
+    instructions = []
+    for (instruction, size) in program:
+        instructions.append((address, instruction))
+        address += size
+        pass
+    return instructions_image(instructions)
+
+#f instructions_image
+def instructions_image(instructions):
+    """
+    Return a c_dump of (address, instruction), with 16 bits for each compressed instruction
+    """
+    d = dump.c_dump()
+    for (address, instruction) in instructions:
+        size = 2
+        if instruction&3==3: size = 4
+        d.add_data_bytes("".join([chr((instruction>>(8*i))&0xff) for i in range(size)]), address)
+        pass
+    return d
+
+#a Unit tests
+#c test_rv_iss_muldiv
+class test_rv_iss_muldiv(unittest.TestCase):
+    """
+    Check the corner cases of the M extension
+    """
+    #f run_ops
+    def run_ops(self, a, b, ops):
+        """
+        Return the results of ops on a (in x1) and b (in x2)
+        """
+        program = [lui(1, (a+0x800)>>12 & 0xfffff), addi(1, 1, a), lui(2, (b+0x800)>>12 & 0xfffff), addi(2, 2, b)]
+        for (n, op) in enumerate(ops):
+            program.append(muldiv(op, 10+n, 1, 2))
+            pass
+        iss = c_rv_iss(image([(i, 4) for i in program]))
+        for i in program: iss.step()
+        self.assertEqual(iss.pc, 4*len(program))
+        self.assertEqual(iss.regs[1:3], [a & 0xffffffff, b & 0xffffffff])
+        return dict(zip(ops, iss.regs[10:10+len(ops)]))
+    #f test_divide_by_zero
+    def test_divide_by_zero(self):
+        r = self.run_ops(-7, 0, ("div", "divu", "rem", "remu"))
+        self.assertEqual(r, {"div":0xffffffff, "divu":0xffffffff, "rem":0xfffffff9, "remu":0xfffffff9})
+        pass
+    #f test_overflow
+    def test_overflow(self):
+        r = self.run_ops(-0x80000000, -1, ("div", "divu", "rem", "remu", "mul"))
+        self.assertEqual(r, {"div":0x80000000, "divu":0, "rem":0, "remu":0x80000000, "mul":0x80000000})
+        pass
+    #f test_divide_signs
+    def test_divide_signs(self):
+        self.assertEqual(self.run_ops(-7, 2, ("div", "rem")), {"div":0xfffffffd, "rem":0xffffffff})
+        self.assertEqual(self.run_ops(7, -2, ("div", "rem")), {"div":0xfffffffd, "rem":1})
+        self.assertEqual(self.run_ops(-7, -2, ("div", "rem")), {"div":3, "rem":0xffffffff})
+        pass
+    #f test_multiply_high
+    def test_multiply_high(self):
+        ops = ("mul", "mulh", "mulhsu", "mulhu")
+        self.assertEqual(self.run_ops(-1, -1, ops), {"mul":1, "mulh":0, "mulhsu":0xffffffff, "mulhu":0xfffffffe})
+        self.assertEqual(self.run_ops(-0x80000000, -0x80000000, ops), {"mul":0, "mulh":0x40000000, "mulhsu":0xc0000000, "mulhu":0x40000000})
+        self.assertEqual(self.run_ops(3, -2, ops), {"mul":0xfffffffa, "mulh":0xffffffff, "mulhsu":2, "mulhu":2})
+        pass
+    pass
+
+#c test_rv_iss_compressed
+class test_rv_iss_compressed(unittest.TestCase):
+    """
+    Check the execution of compressed instructions, mixed with 32-bit instructions
+    """
+    program = [(c_ci(2, 8, -3, 1), 2),  # c.li x8, -3
+               (c_ci(0, 8, 5, 1), 2),   # c.addi x8, 5
+               (c_cr(8, 9, 8), 2),      # c.mv x9, x8
+               (c_cr(9, 9, 8), 2),      # c.add x9, x8
+               (c_ci(0, 9, 3, 2), 2),   # c.slli x9, 3
+               (addi(10, 0, 7), 4),     # at a halfword-aligned pc
+               (c_j(4), 2),
+               (c_ci(2, 11, 1, 1), 2),  # c.li x11, 1 (skipped)
+               (c_ci(2, 12, -1, 1), 2), # c.li x12, -1
+               ]
+    #f test_execute
+    def test_execute(self):
+        iss = c_rv_iss(image(self.program))
+        pcs = [iss.step()[0] for i in range(8)]
+        self.assertEqual(pcs, [0, 2, 4, 6, 8, 0xa, 0xe, 0x12])
+        self.assertEqual(iss.regs[8:13], [2, 32, 7, 0, 0xffffffff])
+        self.assertEqual(iss.pc, 0x14)
+        pass
+    #f test_illegal_without_compressed
+    def test_illegal_without_compressed(self):
+        iss = c_rv_iss(image(self.program), compressed=False)
+        self.assertEqual(iss.step(), None)
+        self.assertEqual(iss.csrs[CSR_MCAUSE], MCAUSE_ILLEGAL_INSTRUCTION)
+        self.assertEqual(iss.csrs[CSR_MTVAL], c_ci(2, 8, -3, 1) | (c_ci(0, 8, 5, 1)<<16))
+        self.assertEqual(iss.regs[8], 0)
+        pass
+    pass
+
+#c test_rv_iss_goldens
+class test_rv_iss_goldens(unittest.TestCase):
+    """
+    Check the simulator against golden traces, running an image rebuilt
+    from each trace's instructions; only tests whose data is all in
+    their instructions and stores can be rebuilt so
+    """
+    trace_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "riscv_trace")
+    # The rv32um goldens were captured from a core that ignores accesses to unimplemented CSRs
+    tests = {"rv32um-p-div":False, "rv32um-p-divu":False, "rv32um-p-rem":False, "rv32um-p-remu":False,
+             "rv32um-p-mul":False, "rv32um-p-mulh":False, "rv32um-p-mulhsu":False, "rv32um-p-mulhu":False,
+             "c_arith":True, "c_branch":True, "c_jump":True, "c_mv":True, "c_stack":True,
+             "rv32ui-p-add":True, "rv32ui-p-jalr":True, "rv32ui-p-sw":True, "traps":True}
+    #f golden
+    def golden(self, test):
+        """
+        Return the (pc, instruction) of a golden trace, with just the 16 bits of a compressed instruction
+        """
+        golden = []
+        for (time, mode, pc, instruction) in read_trace(os.path.join(self.trace_dir, test+".trace")):
+            if instruction&3!=3: instruction &= 0xffff
+            golden.append((pc, instruction))
+            pass
+        # Some goldens start with an entry for reset
+        if golden[0]==(0, 0): golden = golden[1:]
+        return golden
+    #f test_goldens
+    def test_goldens(self):
+        for (test, csr_traps) in sorted(self.tests.items()):
+            golden = self.golden(test)
+            iss = c_rv_iss(instructions_image(golden), csr_traps=csr_traps)
+            trace = [(pc, i) for (time, mode, pc, i) in iss.run(len(golden))]
+            trace = [(pc, i if i&3==3 else i&0xffff) for (pc, i) in trace]
+            self.assertEqual(trace, golden, "Simulation of %s should match its golden trace"%test)
+            pass
+        pass
+    pass
+
+#a Toplevel
+if __name__=="__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+#a Imports
+import unittest
+from rv_profile import c_symbol_table, c_profile
+
+#a Unit tests
+#c test_rv_symbol_table
+class test_rv_symbol_table(unittest.TestCase):
+    #f test_function_beats_mapping_symbol
+    def test_function_beats_mapping_symbol(self):
+        symbols = c_symbol_table({"main":0x100, "$x":0x100})
+        self.assertEqual(symbols.labels, ["main"])
+        self.assertEqual(symbols.function(0x104), "main")
+        pass
+    #f test_function_beats_local_label
+    def test_function_beats_local_label(self):
+        symbols = c_symbol_table({".L3":0x200, "zeta":0x200, "foo":0x200})
+        self.assertEqual(symbols.function(0x200), "foo")
+        self.assertEqual(symbols.describe(0x208), "foo+0x8")
+        pass
+    #f test_local_label_alone
+    def test_local_label_alone(self):
+        symbols = c_symbol_table({".L3":0x200, "main":0x100})
+        self.assertEqual(symbols.function(0x204), ".L3")
+        self.assertEqual(symbols.function(0x80), "?")
+        pass
+    pass
+
+#c test_rv_profile
+class test_rv_profile(unittest.TestCase):
+    #f test_ecall_mret
+    def test_ecall_mret(self):
+        symbols = c_symbol_table({"main":0x100, "trap":0x300})
+        profile = c_profile(symbols=symbols)
+        profile.add_trace([(10, 0x100, 0x00000073), # ecall
+                           (20, 0x300, 0x00000013), # nop
+                           (30, 0x304, 0x30200073), # mret
+                           (40, 0x104, 0x00000013), # nop
+                           ])
+        self.assertEqual(profile.instructions, 4)
+        self.assertEqual(profile.time, 40)
+        self.assertEqual(profile.stacks, {("main",):20, ("main","trap"):20})
+        self.assertEqual(profile.functions["trap"].instructions, 2)
+        self.assertEqual(sorted(profile.blocks.keys()), [0x100, 0x104, 0x300])
+        pass
+    pass
+
+#a Toplevel
+if __name__=="__main__":
+    unittest.main()
@@ -48,6 +48,15 @@ if "RISCV_ATCF_REGRESSION_DIR" in os.environ.keys():
     riscv_atcf_regression_dir      = os.environ["RISCV_ATCF_REGRESSION_DIR"]+"/build/dump/"
 if "RISCV_TRACE_DIR" in os.environ.keys():
     riscv_trace_dir      = os.environ["RISCV_TRACE_DIR"]
+riscv_mif_cache_dir       = os.path.join(tempfile.gettempdir(), "riscv_mif_cache")
+riscv_mif_cache_size      = 256
+if "RISCV_MIF_CACHE_DIR" in os.environ.keys():
+    riscv_mif_cache_dir      = os.environ["RISCV_MIF_CACHE_DIR"]
+if "RISCV_MIF_CACHE_SIZE" in os.environ.keys():
+    riscv_mif_cache_size     = int(os.environ["RISCV_MIF_CACHE_SIZE"])
+riscv_mif_cache = None
+if riscv_mif_cache_dir!="":
+    riscv_mif_cache = dump.c_mif_cache(riscv_mif_cache_dir, max_bytes=riscv_mif_cache_size<<20)
 
 #a Test classes
 #c c_riscv_minimal_test_base
@@ -70,23 +79,30 @@ class c_riscv_minimal_test_base(simple_tb.base_th):
             self.test_image.load_mif(f, self.base_address, address_mask=0x7fffffff)
             f.close()
             return self.mif_filename
-        elf = None
-        if self.dump_filename[-5:]=='.dump':
-            try:
-                elf = open(self.dump_filename[:-5])
-                pass
-            except:
-                pass
-            pass
-        if elf:
+        source = self.dump_filename
+        if (self.dump_filename[-5:]=='.dump') and os.path.isfile(self.dump_filename[:-5]):
             print "Using ELF file instead of %s"%(self.dump_filename)
-            self.test_image.load_elf(elf, self.base_address, address_mask=0x7fffffff)
+            source = self.dump_filename[:-5]
             pass
-        else:
-            f = open(self.dump_filename)
-            self.test_image.load(f, self.base_address, address_mask=0x7fffffff)
+        if riscv_mif_cache is not None:
+            key = riscv_mif_cache.key(source, self.base_address, 0x7fffffff)
+            mif_filename = riscv_mif_cache.lookup(key)
+            if mif_filename is not None:
+                f = open(mif_filename)
+                self.test_image.load_mif_labels(f)
+                f.close()
+                return mif_filename
+            pass
+        if source!=self.dump_filename:
+            f = open(source, "rb")
+            self.test_image.load_elf(f, self.base_address, address_mask=0x7fffffff)
             f.close()
             pass
+        else:
+            self.test_image.load_file(source, self.base_address, address_mask=0x7fffffff)
+            pass
+        if riscv_mif_cache is not None:
+            return riscv_mif_cache.store(key, self.test_image)
         self.mif = tempfile.NamedTemporaryFile(mode='w')
         self.test_image.write_mif(self.mif)
         self.mif.flush()
@@ -553,6 +569,9 @@ class riscv_base_hw(simple_tb.cdl_test_hw):
         self.trace_filename = "%s%s.trace"%(riscv_trace_dir,test.get_test_name())
         if "RISCV_CAPTURE_TRACE" in os.environ:
             self.th_forces[checker_base + "checker_trace.capture_filename"] = self.trace_filename
+            if "RISCV_TEXT_TRACE" not in os.environ:
+                self.th_forces[checker_base + "checker_trace.capture_binary"] = 1
+                pass
             pass
         if "RISCV_MATCH_TRACE" in os.environ:
             self.th_forces[checker_base + "checker_trace.match_filename"]   = self.trace_filename